@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Stress benchmark for the credit debit path under concurrent saves.
+
+Several processes (like several uvicorn workers or db_tools runs) with several threads each
+save OCR records for the same account through the app's own save transaction
+(run_write_transaction(main._add_ocr_record_with_charge, ...)) against a throwaway SQLite
+database. Every save uses its own save session, so each successful save must debit exactly
+OCR_SAVE_COST_PER_PAGE credits.
+
+The account starts with fewer credits than all saves need, so some saves must be refused
+(402). Afterwards the benchmark checks, from the database:
+
+  lost updates   successful saves whose debit is missing from the balance
+  ledger         one charge row per successful save, balance == initial + sum(ledger deltas)
+  overdraft      balance never below zero
+
+and reports saves/sec. It exits with 1 if any check fails.
+
+To compare before/after, point --backend-dir at another checkout, e.g.:
+  git worktree add /tmp/before <commit-before-the-change>
+  python benchmarks/bench_credit_debit.py --backend-dir /tmp/before/backend
+  python benchmarks/bench_credit_debit.py
+
+Usage (from backend/):
+  python benchmarks/bench_credit_debit.py [--processes 4] [--threads 4] [--saves 100]
+"""
+
+from __future__ import annotations
+
+import argparse
+import multiprocessing
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List, Tuple
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+EMAIL = "stress@example.com"
+
+
+def _worker(backend_dir: str, workdir: str, worker: int, threads: int, saves: int, start, out) -> None:
+    sys.path.insert(0, backend_dir)
+    os.chdir(workdir)
+    from fastapi import HTTPException
+
+    import main
+    from database import run_write_transaction
+
+    counts = {"ok": 0, "refused": 0, "errors": 0}
+    lock = threading.Lock()
+    error_samples: List[str] = []
+
+    def run(thread: int) -> None:
+        for i in range(saves):
+            session = f"stress-{worker}-{thread}-{i}"
+            try:
+                run_write_transaction(
+                    main._add_ocr_record_with_charge, EMAIL, f"stress {session}", None, f"{session}.pdf", 1, session
+                )
+                kind = "ok"
+            except HTTPException as e:
+                kind = "refused" if e.status_code == 402 else "errors"
+            except Exception as e:
+                kind = "errors"
+                with lock:
+                    if len(error_samples) < 3:
+                        error_samples.append(f"{type(e).__name__}: {e}".splitlines()[0])
+            with lock:
+                counts[kind] += 1
+
+    pool = [threading.Thread(target=run, args=(t,)) for t in range(threads)]
+    # every process has imported the app
+    start.wait()
+    started = time.perf_counter()
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    out.put({**counts, "elapsed": time.perf_counter() - started, "error_samples": error_samples})
+
+
+def _prepare(backend_dir: str, workdir: str, total_saves: int, credit_ratio: float) -> Tuple[int, int]:
+    # creates the schema and the account; returns (cost per save, initial credits)
+    sys.path.insert(0, backend_dir)
+    os.chdir(workdir)
+    import database
+    import main
+
+    database.init_db()
+    database.engine.dispose()
+    cost = main.OCR_SAVE_COST_PER_PAGE
+    credits = int(total_saves * cost * credit_ratio)
+    con = sqlite3.connect("ocr_history.db")
+    try:
+        con.execute(
+            "INSERT INTO users(email, plan_key, credits_balance, created_at, updated_at) "
+            "VALUES (?, 'pro', ?, datetime('now'), datetime('now')) "
+            "ON CONFLICT(email) DO UPDATE SET credits_balance = excluded.credits_balance",
+            (EMAIL, credits),
+        )
+        con.commit()
+    finally:
+        con.close()
+    return cost, credits
+
+
+def _check(workdir: str, credits: int, cost: int, totals: Dict[str, int]) -> List[str]:
+    con = sqlite3.connect(os.path.join(workdir, "ocr_history.db"))
+    try:
+        balance = con.execute("SELECT credits_balance FROM users WHERE email = ?", (EMAIL,)).fetchone()[0]
+        charges, charged = con.execute(
+            "SELECT count(*), coalesce(sum(delta), 0) FROM credit_ledger WHERE email = ? AND reason = 'ocr_save_page_charge'",
+            (EMAIL,),
+        ).fetchone()
+        records = con.execute("SELECT count(*) FROM ocr_records WHERE email = ?", (EMAIL,)).fetchone()[0]
+    finally:
+        con.close()
+
+    debited = credits - balance
+    lost = totals["ok"] - debited // cost
+    print(f"balance {credits} -> {balance} (debited {debited}, expected {totals['ok'] * cost})")
+    print(f"records {records}, ledger charges {charges} (sum {charged})")
+    print(f"lost updates: {lost}")
+
+    failures = []
+    if lost or debited != totals["ok"] * cost:
+        failures.append(f"balance does not match successful saves ({lost} lost updates)")
+    if records != totals["ok"] or charges != totals["ok"]:
+        failures.append("records / ledger charges do not match successful saves")
+    if balance != credits + charged:
+        failures.append("balance does not match the ledger")
+    if balance < 0:
+        failures.append("balance went negative")
+    if totals["ok"] != min(totals["saves"], credits // cost):
+        failures.append(f"expected {min(totals['saves'], credits // cost)} successful saves, got {totals['ok']}")
+    return failures
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="concurrent credit debit stress benchmark")
+    parser.add_argument("--backend-dir", default=BACKEND_DIR, help="backend directory to benchmark (e.g. an older worktree)")
+    parser.add_argument("--processes", type=int, default=4, help="writer processes")
+    parser.add_argument("--threads", type=int, default=4, help="saving threads per process")
+    parser.add_argument("--saves", type=int, default=100, help="saves per thread")
+    parser.add_argument(
+        "--credit-ratio", type=float, default=0.75, help="initial credits as a fraction of what all saves need"
+    )
+    args = parser.parse_args(argv)
+
+    backend_dir = os.path.abspath(args.backend_dir)
+    total_saves = args.processes * args.threads * args.saves
+    ctx = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory(prefix="bench-credit-") as workdir:
+        # blob_store.py / crop_stage.py use paths relative to the working directory
+        os.environ.setdefault("OCR_BLOB_DIR", os.path.join(workdir, "blobs"))
+        os.environ.setdefault("OCR_STAGE_DIR", os.path.join(workdir, "staged_crops"))
+        cwd = os.getcwd()
+        cost, credits = _prepare(backend_dir, workdir, total_saves, args.credit_ratio)
+        os.chdir(cwd)
+
+        start = ctx.Barrier(args.processes + 1)
+        out = ctx.Queue()
+        procs = [
+            ctx.Process(target=_worker, args=(backend_dir, workdir, n, args.threads, args.saves, start, out))
+            for n in range(args.processes)
+        ]
+        for p in procs:
+            p.start()
+        start.wait()
+        results = [out.get() for _ in procs]
+        for p in procs:
+            p.join()
+
+        totals = {key: sum(r[key] for r in results) for key in ("ok", "refused", "errors")}
+        totals["saves"] = total_saves
+        elapsed = max(r["elapsed"] for r in results)
+        print(f"backend: {backend_dir}")
+        print(
+            f"{args.processes} processes x {args.threads} threads x {args.saves} saves, "
+            f"{credits} credits for {total_saves} saves of {cost}"
+        )
+        print(
+            f"ok {totals['ok']}, refused (402) {totals['refused']}, errors {totals['errors']}, "
+            f"{elapsed:.2f}s, {(totals['ok'] + totals['refused']) / elapsed:.0f} saves/s"
+        )
+        for sample in sorted({s for r in results for s in r["error_samples"]}):
+            print(f"  error: {sample}")
+        failures = _check(workdir, credits, cost, totals)
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
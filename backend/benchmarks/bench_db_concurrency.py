@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+Tail-latency benchmark for the database layer under mixed read/write load.
+
+The backend app runs in-process (httpx ASGITransport, single event loop, like one
+uvicorn worker) against a throwaway SQLite database in a temp directory. For
+--duration seconds it runs, concurrently:
+
+  readers   GET /history?limit=50 and GET /billing/usage?mode=file in a loop
+  writers   POST /history/save in a loop
+  ping      GET / (no database access) every few ms, timed from its scheduled tick
+            so that event-loop stalls show up in its latency
+  locker    a separate sqlite3 connection (another process's writer, e.g. db_tools)
+            that holds the write lock for --lock-ms every --lock-interval seconds
+
+and reports p50/p95/p99/max latency per request class. When an endpoint does
+blocking database I/O on the event loop, a save waiting for the write lock
+(busy_timeout) stalls every other request, including the ping.
+
+To compare before/after, point --backend-dir at another checkout, e.g.:
+  git worktree add /tmp/before <commit-before-the-change>
+  python benchmarks/bench_db_concurrency.py --backend-dir /tmp/before/backend
+  python benchmarks/bench_db_concurrency.py
+
+Usage (from backend/):
+  python benchmarks/bench_db_concurrency.py [--duration 10] [--readers 8] [--writers 4] [--lock-ms 200]
+"""
+
+from __future__ import annotations
+
+import argparse
+import asyncio
+import base64
+import io
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from typing import Dict, List
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+EMAIL = "bench@example.com"
+
+
+def _png_bytes() -> bytes:
+    from PIL import Image
+
+    out = io.BytesIO()
+    Image.new("RGB", (64, 24), (240, 240, 240)).save(out, "PNG")
+    return out.getvalue()
+
+
+def _percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(p / 100.0 * (len(ordered) - 1))))]
+
+
+def _seed(db_path: str, records: int) -> None:
+    con = sqlite3.connect(db_path)
+    try:
+        con.execute(
+            "INSERT INTO users(email, plan_key, credits_balance, created_at, updated_at) "
+            "VALUES (?, 'enterprise', ?, datetime('now'), datetime('now')) "
+            "ON CONFLICT(email) DO UPDATE SET credits_balance = excluded.credits_balance",
+            (EMAIL, 10**9),
+        )
+        rows = [
+            (EMAIL, f"seed-{i // 20}", f"seed text {i} 계약서 합계 {i * 7}", f"seed{i // 20}.pdf", i % 20)
+            for i in range(records)
+        ]
+        con.executemany(
+            "INSERT INTO ocr_records(email, save_session_id, extracted_text, timestamp, filename, page_number) "
+            "VALUES (?, ?, ?, datetime('now'), ?, ?)",
+            rows,
+        )
+        con.commit()
+    finally:
+        con.close()
+
+
+def _locker(db_path: str, lock_ms: int, interval: float, stop: threading.Event, held: List[float]) -> None:
+    con = sqlite3.connect(db_path, timeout=30.0, isolation_level=None)
+    try:
+        while not stop.wait(interval):
+            con.execute("BEGIN IMMEDIATE")
+            started = time.perf_counter()
+            time.sleep(lock_ms / 1000.0)
+            con.execute("COMMIT")
+            held.append(time.perf_counter() - started)
+    finally:
+        con.close()
+
+
+async def _run(args: argparse.Namespace) -> Dict[str, List[float]]:
+    import httpx
+    import main
+
+    _seed(os.path.abspath("ocr_history.db"), args.records)
+    headers = {"Authorization": f"Bearer {main._create_access_token(EMAIL)}"}
+    image = base64.b64encode(_png_bytes()).decode("ascii")
+    latencies: Dict[str, List[float]] = {"read": [], "write": [], "ping": []}
+    errors: Dict[str, int] = {"read": 0, "write": 0, "ping": 0}
+    deadline = time.monotonic() + args.duration
+
+    async def timed(client: httpx.AsyncClient, kind: str, method: str, url: str, **kwargs) -> None:
+        started = time.perf_counter()
+        response = await client.request(method, url, headers=headers, **kwargs)
+        latencies[kind].append((time.perf_counter() - started) * 1000.0)
+        if response.status_code >= 400:
+            errors[kind] += 1
+
+    async def reader(client: httpx.AsyncClient) -> None:
+        while time.monotonic() < deadline:
+            await timed(client, "read", "GET", "/history", params={"limit": 50})
+            await timed(client, "read", "GET", "/billing/usage", params={"mode": "file", "limit": 50})
+
+    async def writer(client: httpx.AsyncClient, n: int) -> None:
+        i = 0
+        while time.monotonic() < deadline:
+            data = {
+                "extracted_text": f"bench {n}-{i} 서울 invoice",
+                "cropped_image": image,
+                "filename": f"bench{n}.pdf",
+                "page_number": str(i % 10),
+                "save_session_id": f"bench-{n}-{i // 10}",
+            }
+            await timed(client, "write", "POST", "/history/save", data=data)
+            i += 1
+
+    async def ping(client: httpx.AsyncClient) -> None:
+        # measured from the scheduled tick, so time spent waiting for a blocked event loop counts
+        while time.monotonic() < deadline:
+            scheduled = time.perf_counter() + args.ping_interval
+            await asyncio.sleep(args.ping_interval)
+            response = await client.get("/")
+            latencies["ping"].append((time.perf_counter() - scheduled) * 1000.0)
+            if response.status_code >= 400:
+                errors["ping"] += 1
+
+    stop = threading.Event()
+    held: List[float] = []
+    locker = threading.Thread(
+        target=_locker, args=(os.path.abspath("ocr_history.db"), args.lock_ms, args.lock_interval, stop, held), daemon=True
+    )
+
+    await main.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=120.0) as client:
+            if args.lock_ms > 0:
+                locker.start()
+            tasks = [reader(client) for _ in range(args.readers)]
+            tasks += [writer(client, n) for n in range(args.writers)]
+            tasks.append(ping(client))
+            await asyncio.gather(*tasks)
+    finally:
+        stop.set()
+        if locker.is_alive():
+            locker.join()
+        await main.app.router.shutdown()
+
+    print(f"backend: {os.path.abspath(args.backend_dir)}")
+    print(
+        f"duration {args.duration}s, readers {args.readers}, writers {args.writers}, "
+        f"external write lock {args.lock_ms}ms every {args.lock_interval}s (held {len(held)}x)"
+    )
+    print(f"{'class':<6} {'count':>7} {'errors':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for kind, values in latencies.items():
+        print(
+            f"{kind:<6} {len(values):>7} {errors[kind]:>7} {_percentile(values, 50):>9.1f} {_percentile(values, 95):>9.1f} "
+            f"{_percentile(values, 99):>9.1f} {max(values, default=0.0):>9.1f}"
+        )
+    return latencies
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="database tail-latency benchmark (mixed read/write load)")
+    parser.add_argument("--backend-dir", default=BACKEND_DIR, help="backend directory to benchmark (e.g. an older worktree)")
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds of load")
+    parser.add_argument("--readers", type=int, default=8, help="concurrent read loops")
+    parser.add_argument("--writers", type=int, default=4, help="concurrent save loops")
+    parser.add_argument("--records", type=int, default=20000, help="records seeded before the run")
+    parser.add_argument("--lock-ms", type=int, default=200, help="external write-lock hold time (0 disables)")
+    parser.add_argument("--lock-interval", type=float, default=1.0, help="seconds between external write locks")
+    parser.add_argument("--ping-interval", type=float, default=0.01, help="seconds between pings")
+    args = parser.parse_args(argv)
+
+    backend_dir = os.path.abspath(args.backend_dir)
+    sys.path.insert(0, backend_dir)
+    with tempfile.TemporaryDirectory(prefix="bench-db-") as workdir:
+        # database.py / blob_store.py use paths relative to the working directory
+        os.chdir(workdir)
+        os.environ.setdefault("OCR_BLOB_DIR", os.path.join(workdir, "blobs"))
+        os.environ.setdefault("OCR_STAGE_DIR", os.path.join(workdir, "staged_crops"))
+        asyncio.run(_run(args))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
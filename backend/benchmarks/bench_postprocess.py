@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""
+Golden-corpus benchmark and regression check for OCR post-processing
+(ocr_postprocess.clean_ocr_response / extract_json_from_text) and for the
+streaming repetition guard (ocr_guards.RepetitionDetector, run as stream_guard:
+the input is fed in small token-sized chunks and the output is the text the
+guard keeps, so ordinary documents must come back unchanged).
+
+The corpus lives in benchmarks/corpus/postprocess.jsonl, one case per line:
+  {"id": ..., "function": ..., "tags": [...], "input": "..."}        literal input
+  {"id": ..., "function": ..., "tags": [...], "generator": "...", "n": N}
+                                                                   built by GENERATORS
+Expected outputs live in benchmarks/corpus/postprocess.golden.jsonl ({"id", "output"}).
+
+For every function the runner reports throughput (input MB/s), p50/p99/max
+latency per call, and a unified diff for each case whose output differs from
+the golden result. The exit status is 1 when any case differs or is missing a
+golden result, so a change to these functions can be shown to be both faster
+and equivalent.
+
+Usage (from backend/):
+  python benchmarks/bench_postprocess.py
+  python benchmarks/bench_postprocess.py --repeat 50 --tag adversarial
+  python benchmarks/bench_postprocess.py --update-golden   # after an intended behavior change
+"""
+
+from __future__ import annotations
+
+import argparse
+import contextlib
+import difflib
+import io
+import json
+import os
+import sys
+import time
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from ocr_guards import RepetitionDetector  # noqa: E402
+from ocr_postprocess import clean_ocr_response, extract_json_from_text  # noqa: E402
+
+CORPUS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "corpus")
+CORPUS_PATH = os.path.join(CORPUS_DIR, "postprocess.jsonl")
+GOLDEN_PATH = os.path.join(CORPUS_DIR, "postprocess.golden.jsonl")
+
+# chars per simulated streaming token for stream_guard
+STREAM_CHUNK_CHARS = 3
+
+
+def stream_guard(text: str) -> str:
+    detector = RepetitionDetector()
+    for i in range(0, len(text), STREAM_CHUNK_CHARS):
+        if detector.feed(text[i:i + STREAM_CHUNK_CHARS]):
+            break
+    return detector.finish()
+
+
+FUNCTIONS: Dict[str, Callable[[str], str]] = {
+    "clean_ocr_response": clean_ocr_response,
+    "extract_json_from_text": extract_json_from_text,
+    "stream_guard": stream_guard,
+}
+
+
+def _number_list(n: int) -> str:
+    return "사업장 소재지 (지번 : " + ", ".join(str(10 + i) for i in range(n))
+
+
+def _phrase_loop(n: int) -> str:
+    return " ".join(["광고 프로젝트의 진행 및"] * n)
+
+
+def _alternating(n: int) -> str:
+    return " ".join(f"항목 x{i}" for i in range(n))
+
+
+def _group_chain(n: int) -> str:
+    return " ".join(f"p{i} q{i} p{i} q{i} p{i} q{i}" for i in range(n // 6))
+
+
+def _line_loop(n: int) -> str:
+    return "계약서 제1조\n" + "\n".join(["본 계약의 목적은 다음과 같다."] * n)
+
+
+def _block_loop(n: int) -> str:
+    block = "성명: 홍길동\n직위: 과장\n부서: 광고기획팀"
+    return "\n".join([block] * n) + "\n끝"
+
+
+def _long_document(n: int) -> str:
+    lines = []
+    for i in range(n):
+        lines.append(f"제{i + 1}조 ({'목적' if i % 3 == 0 else '정의'}) Article {i + 1}: 갑은 을에게 {i * 1000:,}원을 지급한다.")
+        if i % 10 == 9:
+            lines.append("")
+    return "\n".join(lines)
+
+
+def _calendar(n: int) -> str:
+    months = []
+    for m in range(n):
+        days = 28 + m % 4
+        weeks = [" ".join(str(d) for d in range(w * 7 + 1, min(w * 7 + 8, days + 1))) for w in range(5)]
+        months.append(f"{m % 12 + 1}월\n일 월 화 수 목 금 토\n" + "\n".join(weeks))
+    return "\n\n".join(months)
+
+
+def _table(n: int) -> str:
+    header = "| 항목 | " + " | ".join(f"{m}월" for m in range(1, 13)) + " |"
+    sep = "| --- " * 13 + "|"
+    rows = [f"| 항목{i} | " + " | ".join(str(i * m % 7 * 10) for m in range(1, 13)) + " |" for i in range(n)]
+    total = "| 합계 | " + " | ".join(["0"] * 12) + " |"
+    return "\n".join([header, sep] + rows + [total, "", "비고: 단위 천원"])
+
+
+def _json_in_prose(n: int) -> str:
+    items = [{"name": f"품목{i}", "qty": i % 7, "price": f"{i * 1250:,}"} for i in range(n)]
+    body = json.dumps({"회사명": "(주)데이터랩", "items": items}, ensure_ascii=False)
+    return f"요청하신 JSON입니다. Here is the result:\n{body}\n추가로 필요한 내용이 있으면 알려주세요."
+
+
+def _json_unbalanced(n: int) -> str:
+    return "결과: {\"items\": [" + ", ".join("{\"k\": %d}" % i for i in range(n)) + ", {\"k\": "
+
+
+def _brace_soup(n: int) -> str:
+    return "참고 " + "{" * n + "}" * (n - 1) + " 끝"
+
+
+GENERATORS: Dict[str, Callable[[int], str]] = {
+    "number_list": _number_list,
+    "phrase_loop": _phrase_loop,
+    "alternating": _alternating,
+    "group_chain": _group_chain,
+    "line_loop": _line_loop,
+    "block_loop": _block_loop,
+    "long_document": _long_document,
+    "calendar": _calendar,
+    "table": _table,
+    "json_in_prose": _json_in_prose,
+    "json_unbalanced": _json_unbalanced,
+    "brace_soup": _brace_soup,
+}
+
+
+def load_corpus(path: str = CORPUS_PATH) -> List[dict]:
+    cases = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            case = json.loads(line)
+            if "generator" in case:
+                case["input"] = GENERATORS[case["generator"]](case["n"])
+            cases.append(case)
+    return cases
+
+
+def load_golden(path: str = GOLDEN_PATH) -> Dict[str, str]:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return {row["id"]: row["output"] for row in map(json.loads, filter(str.strip, f))}
+
+
+def write_golden(cases: List[dict], outputs: Dict[str, str], path: str = GOLDEN_PATH) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for case in cases:
+            f.write(json.dumps({"id": case["id"], "output": outputs[case["id"]]}, ensure_ascii=False) + "\n")
+
+
+def _percentile(sorted_values: List[float], q: float) -> float:
+    if not sorted_values:
+        return 0.0
+    k = min(len(sorted_values) - 1, max(0, int(round(q * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+def _diff(expected: str, actual: str, max_lines: int) -> str:
+    lines = list(difflib.unified_diff(
+        expected.splitlines(), actual.splitlines(), "golden", "actual", lineterm="", n=1,
+    ))
+    if len(lines) > max_lines:
+        lines = lines[:max_lines] + [f"... ({len(lines) - max_lines} more diff lines)"]
+    return "\n".join(lines)
+
+
+def run(cases: List[dict], repeat: int) -> tuple[Dict[str, str], Dict[str, dict]]:
+    """
+    Runs every case `repeat` times. Returns (outputs by case id, stats by function).
+    The functions print diagnostics (e.g. JSON parse failures); that output is swallowed.
+    """
+    outputs: Dict[str, str] = {}
+    stats: Dict[str, dict] = {}
+    sink = io.StringIO()
+    for case in cases:
+        fn = FUNCTIONS[case["function"]]
+        text = case["input"]
+        entry = stats.setdefault(case["function"], {"calls": 0, "bytes": 0, "seconds": 0.0, "latencies": [], "slowest": ("", 0.0)})
+        size = len(text.encode("utf-8"))
+        with contextlib.redirect_stdout(sink):
+            for _ in range(repeat):
+                start = time.perf_counter()
+                out = fn(text)
+                elapsed = time.perf_counter() - start
+                entry["calls"] += 1
+                entry["bytes"] += size
+                entry["seconds"] += elapsed
+                entry["latencies"].append(elapsed)
+                if elapsed > entry["slowest"][1]:
+                    entry["slowest"] = (case["id"], elapsed)
+        sink.seek(0)
+        sink.truncate()
+        outputs[case["id"]] = out
+    return outputs, stats
+
+
+def main(argv: List[str]) -> int:
+    parser = argparse.ArgumentParser(description="OCR post-processing golden benchmark")
+    parser.add_argument("--repeat", type=int, default=20, help="calls per case")
+    parser.add_argument("--function", choices=sorted(FUNCTIONS), help="only run cases for this function")
+    parser.add_argument("--tag", help="only run cases with this tag")
+    parser.add_argument("--update-golden", action="store_true", help="rewrite golden outputs from the current code")
+    parser.add_argument("--diff-lines", type=int, default=40, help="max diff lines shown per case")
+    args = parser.parse_args(argv)
+
+    cases = load_corpus()
+    if args.function:
+        cases = [c for c in cases if c["function"] == args.function]
+    if args.tag:
+        cases = [c for c in cases if args.tag in c.get("tags", [])]
+    if args.update_golden and (args.function or args.tag):
+        parser.error("--update-golden rewrites the whole golden file; do not combine with --function/--tag")
+
+    outputs, stats = run(cases, max(1, args.repeat))
+
+    print(f"{'function':24s} {'cases':>5s} {'calls':>6s} {'MB/s':>8s} {'p50 ms':>8s} {'p99 ms':>8s} {'max ms':>8s}  slowest case")
+    for name, entry in stats.items():
+        latencies = sorted(entry["latencies"])
+        mb_s = entry["bytes"] / entry["seconds"] / 1e6 if entry["seconds"] else 0.0
+        n_cases = sum(1 for c in cases if c["function"] == name)
+        print(
+            f"{name:24s} {n_cases:5d} {entry['calls']:6d} {mb_s:8.2f} "
+            f"{_percentile(latencies, 0.50) * 1000:8.3f} {_percentile(latencies, 0.99) * 1000:8.3f} "
+            f"{latencies[-1] * 1000:8.3f}  {entry['slowest'][0]}"
+        )
+
+    if args.update_golden:
+        write_golden(cases, outputs)
+        print(f"golden: wrote {len(cases)} results to {os.path.relpath(GOLDEN_PATH)}")
+        return 0
+
+    golden = load_golden()
+    missing = [c["id"] for c in cases if c["id"] not in golden]
+    changed = [c for c in cases if c["id"] in golden and golden[c["id"]] != outputs[c["id"]]]
+    for case in changed:
+        print(f"\nDIFF {case['id']} ({case['function']})")
+        print(_diff(golden[case["id"]], outputs[case["id"]], args.diff_lines))
+    if missing:
+        print(f"\nmissing golden results: {', '.join(missing)} (run with --update-golden)")
+    print(f"\ngolden: {len(cases) - len(changed) - len(missing)}/{len(cases)} identical, "
+          f"{len(changed)} changed, {len(missing)} missing")
+    return 1 if changed or missing else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Benchmark for repeat_removal.remove_repeated_phrases against the previous
+backtracking implementation that lived inside main.clean_ocr_response.
+
+- Times both implementations on pathological single-line inputs
+  (runaway number lists, long distinct word runs, alternating words,
+  chained word groups, no-whitespace lines) at growing sizes.
+- Checks that both produce identical output on every case where the legacy
+  version finishes within --legacy-budget seconds.
+- Optionally runs a randomized differential check (--fuzz N) over short
+  lines built from repeated word groups and irregular whitespace.
+
+Usage (from backend/):
+  python benchmarks/bench_repeat_removal.py
+  python benchmarks/bench_repeat_removal.py --sizes 500,2000,8000 --fuzz 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import re
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+from repeat_removal import remove_repeated_phrases  # noqa: E402
+
+
+def legacy_remove_repeated_phrases(text_line: str) -> str:
+    """The pre-repeat_removal implementation, comments trimmed (reference only)."""
+    if not text_line or len(text_line.strip()) < 10:
+        return text_line
+
+    result = re.sub(r'(.{5,}?)(?:\s+\1){2,}', lambda m: m.group(1), text_line)
+
+    words = result.split()
+    if len(words) > 15:
+        max_group_size = min(8, len(words) // 3)
+        for group_size in range(max_group_size, 1, -1):
+            i = 0
+            while i <= len(words) - group_size * 3:
+                group = words[i:i + group_size]
+                repeat_count = 1
+                pos = i + group_size
+                while pos + group_size <= len(words):
+                    if words[pos:pos + group_size] == group:
+                        repeat_count += 1
+                        pos += group_size
+                    else:
+                        break
+                if repeat_count >= 3:
+                    new_words = words[:i + group_size]
+                    new_words.extend(words[i + group_size * repeat_count:])
+                    words = new_words
+                    i = 0
+                    continue
+                i += 1
+            if len(words) < len(result.split()):
+                break
+        result = ' '.join(words)
+    return result
+
+
+# name -> builder(n) producing a single line with roughly n tokens
+CASES = {
+    "number_list": lambda n: ", ".join(str(i) for i in range(n)),
+    "phrase_loop": lambda n: " ".join(["광고 프로젝트의 진행 및"] * max(1, n // 4)),
+    "distinct_words": lambda n: " ".join(f"w{i}" for i in range(n)),
+    "alternating": lambda n: " ".join(f"a x{i}" for i in range(max(1, n // 2))),
+    "group_chain": lambda n: " ".join(f"p{i} q{i} p{i} q{i} p{i} q{i}" for i in range(max(1, n // 6))),
+    "mixed_spacing": lambda n: "".join(f"항목{i % 7}" + (" " * (1 + i % 3)) for i in range(n)),
+    "no_whitespace": lambda n: "ab" * n,
+}
+
+
+def _time(fn, line: str, repeat: int) -> tuple[float, str]:
+    best = float("inf")
+    out = ""
+    for _ in range(repeat):
+        start = time.perf_counter()
+        out = fn(line)
+        best = min(best, time.perf_counter() - start)
+    return best, out
+
+
+def run_cases(sizes: list[int], repeat: int, legacy_budget: float) -> int:
+    failures = 0
+    print(f"{'case':16s} {'tokens':>7s} {'chars':>8s} {'new ms':>9s} {'legacy ms':>10s} {'speedup':>8s}  same")
+    for name, build in CASES.items():
+        legacy_too_slow = False
+        for n in sizes:
+            line = build(n)
+            new_s, new_out = _time(remove_repeated_phrases, line, repeat)
+            if legacy_too_slow:
+                legacy_cell, speedup, same = "skipped", "", "-"
+            else:
+                old_s, old_out = _time(legacy_remove_repeated_phrases, line, 1)
+                legacy_too_slow = old_s > legacy_budget
+                legacy_cell = f"{old_s * 1000:10.1f}"
+                speedup = f"{old_s / new_s:7.1f}x" if new_s > 0 else ""
+                same = "yes" if old_out == new_out else "NO"
+                failures += old_out != new_out
+            print(f"{name:16s} {n:7d} {len(line):8d} {new_s * 1000:9.1f} {legacy_cell:>10s} {speedup:>8s}  {same}")
+    return failures
+
+
+def run_fuzz(count: int, seed: int) -> int:
+    rng = random.Random(seed)
+    vocab = ["광고", "프로젝트의", "진행", "및", "the", "a", "ab", "abc", "abcde", "cde", "xabcde",
+             "10,", "11,", "(주)", "데이터", "hel", "hello", "lo", "world", "x"]
+    seps = [" ", " ", " ", "  ", "   ", "\t", " \t"]
+    failures = 0
+    for _ in range(count):
+        words: list[str] = []
+        target = rng.randint(1, 40)
+        while len(words) < target:
+            if rng.random() < 0.3:
+                group = [rng.choice(vocab) for _ in range(rng.randint(1, 5))]
+                words += group * rng.randint(2, 5)
+                if rng.random() < 0.3:
+                    words[-1] += rng.choice(["x", "s"])
+            else:
+                words.append(rng.choice(vocab))
+        irregular = rng.random() < 0.5
+        line = "".join(w + (rng.choice(seps) if irregular else " ") for w in words).rstrip()
+        if rng.random() < 0.1:
+            line = " " + line + " "
+        expected = legacy_remove_repeated_phrases(line)
+        actual = remove_repeated_phrases(line)
+        if expected != actual:
+            failures += 1
+            if failures <= 5:
+                print(f"MISMATCH {line!r}\n  legacy {expected!r}\n  new    {actual!r}")
+    print(f"fuzz: {count - failures}/{count} identical (seed={seed})")
+    return failures
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="remove_repeated_phrases benchmark")
+    parser.add_argument("--sizes", default="250,1000,4000,16000", help="comma separated token counts")
+    parser.add_argument("--repeat", type=int, default=3, help="best-of runs for the new implementation")
+    parser.add_argument("--legacy-budget", type=float, default=1.0,
+                        help="stop timing the legacy version for larger sizes once one run exceeds this (seconds)")
+    parser.add_argument("--fuzz", type=int, default=0, help="number of random differential cases")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    failures = run_cases(sizes, args.repeat, args.legacy_budget)
+    if args.fuzz:
+        failures += run_fuzz(args.fuzz, args.seed)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
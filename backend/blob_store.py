@@ -0,0 +1,144 @@
+"""
+크롭 이미지 저장소 (content-addressed blob store).
+
+기존에는 OCRRecord.cropped_image에 base64 문자열을 그대로 저장해 DB/WAL/백업이 이미지 크기만큼(+33%) 커지고,
+레코드 전체를 읽는 모든 쿼리가 이미지까지 읽었습니다.
+이제 이미지는 sha256 이름의 원본 바이너리 파일로 한 번만 저장하고(같은 이미지는 레코드가 여러 개여도 1개),
+레코드에는 해시(image_sha256)만 남깁니다.
+
+- 경로: OCR_BLOB_DIR/ab/abcdef... (해시 앞 2자리로 디렉터리 분산)
+- 쓰기: 임시 파일 → fsync → rename 으로 원자적으로 기록, 이미 있으면 mtime만 갱신
+- 삭제: 레코드 삭제 시 바로 지우지 않고(다른 레코드가 같은 이미지를 참조할 수 있음) db_tools.py gc-blobs로 정리
+"""
+
+import hashlib
+import os
+import re
+import tempfile
+from typing import Iterator, Optional, Tuple
+
+# database.py의 sqlite 경로와 마찬가지로 backend 실행 위치 기준
+OCR_BLOB_DIR = os.getenv("OCR_BLOB_DIR", "./blobs")
+
+_SHA256_RE = re.compile(r"^[0-9a-f]{64}$")
+
+# 매직 바이트 → MIME 타입
+_IMAGE_SIGNATURES = (
+    (b"\x89PNG\r\n\x1a\n", "image/png"),
+    (b"\xff\xd8\xff", "image/jpeg"),
+    (b"GIF87a", "image/gif"),
+    (b"GIF89a", "image/gif"),
+    (b"BM", "image/bmp"),
+)
+
+
+def is_valid_sha256(value: Optional[str]) -> bool:
+    return bool(value) and bool(_SHA256_RE.match(value))
+
+
+def sniff_image_type(head: bytes) -> str:
+    for signature, media_type in _IMAGE_SIGNATURES:
+        if head.startswith(signature):
+            return media_type
+    if head[:4] == b"RIFF" and head[8:12] == b"WEBP":
+        return "image/webp"
+    return "application/octet-stream"
+
+
+class BlobStore:
+    """
+    sha256 → 원본 바이트. 파일 I/O가 있으므로 async 엔드포인트에서는 run_in_threadpool로 호출합니다.
+    """
+
+    def __init__(self, directory: str = OCR_BLOB_DIR):
+        self.directory = directory
+
+    def path(self, sha256: str) -> str:
+        if not is_valid_sha256(sha256):
+            raise ValueError(f"invalid sha256: {sha256!r}")
+        return os.path.join(self.directory, sha256[:2], sha256)
+
+    def exists(self, sha256: str) -> bool:
+        return is_valid_sha256(sha256) and os.path.exists(self.path(sha256))
+
+    def put(self, data: bytes) -> str:
+        """
+        저장하고 sha256(hex)을 반환합니다. 같은 내용이 이미 있으면 다시 쓰지 않고 mtime만 갱신합니다.
+        (gc-blobs는 유예 시간보다 오래된 blob만 지우므로, 곧 레코드가 참조할 blob을 지우지 않음)
+        """
+        sha256 = hashlib.sha256(data).hexdigest()
+        path = self.path(sha256)
+        try:
+            os.utime(path)
+            return sha256
+        except FileNotFoundError:
+            pass
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            # 동시에 같은 내용을 쓰더라도 결과 파일은 동일
+            os.replace(tmp_path, path)
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+        return sha256
+
+    def get(self, sha256: str) -> Optional[bytes]:
+        if not is_valid_sha256(sha256):
+            return None
+        try:
+            with open(self.path(sha256), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def stat(self, sha256: str) -> Optional[Tuple[int, str]]:
+        """
+        (크기, MIME 타입) 또는 없으면 None.
+        """
+        if not is_valid_sha256(sha256):
+            return None
+        path = self.path(sha256)
+        try:
+            with open(path, "rb") as f:
+                head = f.read(16)
+            return os.path.getsize(path), sniff_image_type(head)
+        except FileNotFoundError:
+            return None
+
+    def delete(self, sha256: str) -> bool:
+        try:
+            os.remove(self.path(sha256))
+            return True
+        except FileNotFoundError:
+            return False
+
+    def iter_hashes(self) -> Iterator[Tuple[str, int, float]]:
+        """
+        저장된 모든 blob: (sha256, 크기, mtime). 중단된 쓰기의 임시 파일은 제외합니다.
+        """
+        if not os.path.isdir(self.directory):
+            return
+        for prefix in os.listdir(self.directory):
+            sub = os.path.join(self.directory, prefix)
+            if len(prefix) != 2 or not os.path.isdir(sub):
+                continue
+            for name in os.listdir(sub):
+                if not is_valid_sha256(name):
+                    continue
+                try:
+                    st = os.stat(os.path.join(sub, name))
+                except FileNotFoundError:
+                    continue
+                yield name, st.st_size, st.st_mtime
+
+
+blob_store = BlobStore()
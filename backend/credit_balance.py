@@ -0,0 +1,108 @@
+"""
+크레딧 잔액 변경 (users.credits_balance + credit_ledger).
+
+저장/구매는 잔액을 Python으로 읽어 계산한 값을 다시 쓰고 있었습니다. pysqlite는 첫 INSERT/UPDATE 직전에야
+트랜잭션을 시작하므로 읽기는 트랜잭션 밖에서 일어나고, 여러 프로세스(uvicorn 워커, db_tools.py)가 동시에 저장하면
+한쪽의 차감이 덮어써져 사라졌습니다 (lost update).
+
+- 잔액은 항상 SQL 식으로 바꿉니다: UPDATE ... SET credits_balance = credits_balance - :cost
+  WHERE email = :email AND credits_balance >= :cost RETURNING credits_balance (부족하면 0행 → None)
+- 페이지 차감 기록은 INSERT ... ON CONFLICT DO NOTHING RETURNING으로 넣어, 이미 차감된 페이지는
+  uq_credit_once_per_page_per_session이 걸러 주고 새로 들어간 페이지만 차감합니다 (미리 SELECT하지 않음)
+- 계정 upsert(INSERT ... ON CONFLICT DO NOTHING)를 트랜잭션 첫 문장으로 실행해 처음부터 쓰기 잠금을 잡습니다.
+  (WAL에서 읽기로 시작한 트랜잭션은 그 사이 다른 프로세스가 commit하면 쓰기로 올라가지 못하고 바로 실패)
+"""
+
+import json
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from sqlalchemy import select, update
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+
+from database import CreditLedger, UserAccount
+
+CHARGE_ONCE_COLUMNS = ["email", "reason", "save_session_id", "page_key"]
+
+
+def ensure_account(db: Session, email: str) -> None:
+    # 계정이 없으면 잔액 0으로 만듭니다 (있으면 그대로)
+    now = datetime.utcnow()
+    db.execute(
+        insert(UserAccount)
+        .values(email=email, plan_key=None, credits_balance=0, created_at=now, updated_at=now)
+        .on_conflict_do_nothing(index_elements=["email"])
+    )
+
+
+def get_balance(db: Session, email: str) -> int:
+    return db.scalar(select(UserAccount.credits_balance).where(UserAccount.email == email)) or 0
+
+
+def debit_credits(db: Session, email: str, cost: int) -> Optional[int]:
+    """
+    잔액이 cost 이상이면 차감하고 차감 후 잔액을 반환합니다. 부족하면 아무것도 바꾸지 않고 None.
+    """
+    return db.execute(
+        update(UserAccount)
+        .where(UserAccount.email == email, UserAccount.credits_balance >= cost)
+        .values(credits_balance=UserAccount.credits_balance - cost, updated_at=datetime.utcnow())
+        .returning(UserAccount.credits_balance)
+        .execution_options(synchronize_session=False)
+    ).scalar_one_or_none()
+
+
+def grant_credits(db: Session, email: str, amount: int, plan_key: Optional[str]) -> int:
+    # 플랜을 설정하고 amount를 더한 뒤 잔액을 반환합니다 (계정은 ensure_account로 미리 만듦)
+    return db.execute(
+        update(UserAccount)
+        .where(UserAccount.email == email)
+        .values(
+            plan_key=plan_key,
+            credits_balance=UserAccount.credits_balance + amount,
+            updated_at=datetime.utcnow(),
+        )
+        .returning(UserAccount.credits_balance)
+        .execution_options(synchronize_session=False)
+    ).scalar_one()
+
+
+def claim_page_charges(
+    db: Session,
+    email: str,
+    reason: str,
+    save_session_id: str,
+    filename: str,
+    page_numbers: Dict[int, Optional[int]],
+    cost_per_page: int,
+) -> List[int]:
+    """
+    page_numbers({page_key: page_number}) 중 이 저장 세션에서 아직 차감 기록이 없는 페이지에 기록을 추가하고
+    그 page_key 목록을 반환합니다. 잔액 차감(debit_credits)은 호출 측이 같은 트랜잭션에서 합니다.
+    """
+    if not page_numbers:
+        return []
+    now = datetime.utcnow()
+    rows = [
+        {
+            "email": email,
+            "delta": -cost_per_page,
+            "reason": reason,
+            "filename": filename,
+            "page_key": page_key,
+            "save_session_id": save_session_id,
+            "meta": json.dumps({"cost_per_page": cost_per_page, "page_number": page_number}, ensure_ascii=False),
+            "created_at": now,
+        }
+        for page_key, page_number in page_numbers.items()
+    ]
+    claimed = db.execute(
+        insert(CreditLedger)
+        .values(rows)
+        .on_conflict_do_nothing(index_elements=CHARGE_ONCE_COLUMNS)
+        .returning(CreditLedger.page_key)
+    ).scalars().all()
+    # RETURNING 순서는 보장되지 않으므로 요청 순서로 정렬
+    claimed_keys = set(claimed)
+    return [page_key for page_key in page_numbers if page_key in claimed_keys]
@@ -0,0 +1,212 @@
+"""
+OCR 크롭 이미지 임시 보관소 (staged crops).
+
+기존에는 /ocr이 크롭 이미지를 base64로 돌려주고, 프론트엔드가 같은 문자열을 /history/save에 다시 올렸습니다.
+저장되는 영역 하나가 네트워크를 세 번(업로드 → 응답 → 저장) 건너고, 그때마다 base64로 33% 커집니다.
+이제 /ocr은 크롭 원본 바이트를 서버에 잠시 보관하고 짧은 handle만 돌려주며,
+/history/save는 이미지 대신 handle을 받을 수 있습니다.
+
+- 1차: 메모리 (바이트 예산 OCR_STAGE_MEMORY_BYTES), 넘치면 오래된 것부터 디스크로 이동
+- 2차: 디스크 OCR_STAGE_DIR (용량 예산 OCR_STAGE_DISK_BYTES), 넘치면 오래된 것부터 삭제
+- 크롭은 저장된 뒤에도 지우지 않고(저장을 다시 시도할 수 있도록) TTL(OCR_STAGE_TTL_SECONDS)이 지나면 주기적인 collect()로 정리
+"""
+
+import os
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+OCR_STAGE_TTL_SECONDS = int(os.getenv("OCR_STAGE_TTL_SECONDS", str(24 * 3600)))  # 기본 24시간
+OCR_STAGE_MEMORY_BYTES = int(os.getenv("OCR_STAGE_MEMORY_BYTES", str(64 * 1024 * 1024)))  # 기본 64MB
+OCR_STAGE_DISK_BYTES = int(os.getenv("OCR_STAGE_DISK_BYTES", str(1024 * 1024 * 1024)))  # 기본 1GB
+# database.py의 sqlite 경로와 마찬가지로 backend 실행 위치 기준
+OCR_STAGE_DIR = os.getenv("OCR_STAGE_DIR", "./staged_crops")
+OCR_STAGE_GC_INTERVAL_SECONDS = float(os.getenv("OCR_STAGE_GC_INTERVAL_SECONDS", "60"))
+
+_HANDLE_RE = re.compile(r"^[A-Za-z0-9_-]{16,64}$")
+
+
+def is_valid_handle(handle: Optional[str]) -> bool:
+    return bool(handle) and bool(_HANDLE_RE.match(handle))
+
+
+class CropStage:
+    """
+    handle → 크롭 원본 바이트. 파일 I/O가 있으므로 async 엔드포인트에서는 run_in_threadpool로 호출합니다.
+    """
+
+    def __init__(
+        self,
+        directory: str = OCR_STAGE_DIR,
+        ttl_seconds: int = OCR_STAGE_TTL_SECONDS,
+        memory_bytes: int = OCR_STAGE_MEMORY_BYTES,
+        disk_bytes: int = OCR_STAGE_DISK_BYTES,
+    ):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        self.memory_bytes = memory_bytes
+        self.disk_bytes = disk_bytes
+
+        # handle -> (data, 보관 시각(epoch 초)), 오래된 순
+        self._memory: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._memory_size = 0
+        # handle -> (size, 보관 시각), 오래된 순
+        self._disk: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._disk_size = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self.staged = 0
+        self.hits = 0
+        self.spilled = 0
+        self.expired = 0
+        self.evicted = 0
+        self.misses = 0
+
+    def _path(self, handle: str) -> str:
+        return os.path.join(self.directory, f"{handle}.bin")
+
+    def _load_disk_index(self) -> None:
+        # 재시작 후에도 디스크에 남은 크롭을 이어서 사용 (보관 시각은 파일 mtime)
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            handle, ext = os.path.splitext(name)
+            if ext != ".bin" or not is_valid_handle(handle):
+                continue
+            try:
+                st = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, handle, st.st_size))
+        for mtime, handle, size in sorted(entries):
+            self._disk[handle] = (size, mtime)
+            self._disk_size += size
+
+    def _remove_file(self, handle: str) -> None:
+        try:
+            os.remove(self._path(handle))
+        except FileNotFoundError:
+            pass
+
+    def _drop_disk(self, handle: str) -> None:
+        entry = self._disk.pop(handle, None)
+        if entry is not None:
+            self._disk_size -= entry[0]
+            self._remove_file(handle)
+
+    def _spill(self) -> None:
+        # lock 안에서 호출: 메모리 예산을 넘으면 오래된 크롭부터 디스크로 이동
+        while self._memory_size > self.memory_bytes and self._memory:
+            handle, (data, staged_at) = self._memory.popitem(last=False)
+            self._memory_size -= len(data)
+            path = self._path(handle)
+            with open(path, "wb") as f:
+                f.write(data)
+            os.utime(path, (staged_at, staged_at))
+            self._disk[handle] = (len(data), staged_at)
+            self._disk_size += len(data)
+            self.spilled += 1
+        while self._disk_size > self.disk_bytes and self._disk:
+            handle = next(iter(self._disk))
+            self._drop_disk(handle)
+            self.evicted += 1
+
+    def put(self, data: bytes) -> str:
+        handle = secrets.token_urlsafe(16)
+        with self._lock:
+            self._load_disk_index()
+            self._memory[handle] = (data, time.time())
+            self._memory_size += len(data)
+            self._spill()
+            self.staged += 1
+        return handle
+
+    def get(self, handle: str) -> Optional[bytes]:
+        """
+        보관 중인 크롭을 반환합니다 (없거나 만료되었으면 None). 저장이 실패해 다시 시도할 수 있도록 삭제하지 않습니다.
+        """
+        if not is_valid_handle(handle):
+            return None
+        now = time.time()
+        with self._lock:
+            self._load_disk_index()
+            entry = self._memory.get(handle)
+            if entry is not None:
+                data, staged_at = entry
+                if now - staged_at <= self.ttl_seconds:
+                    self.hits += 1
+                    return data
+                self._memory.pop(handle)
+                self._memory_size -= len(data)
+                self.expired += 1
+                return None
+            disk_entry = self._disk.get(handle)
+            if disk_entry is None:
+                self.misses += 1
+                return None
+            if now - disk_entry[1] > self.ttl_seconds:
+                self._drop_disk(handle)
+                self.expired += 1
+                return None
+            try:
+                with open(self._path(handle), "rb") as f:
+                    data = f.read()
+            except FileNotFoundError:
+                self._disk.pop(handle, None)
+                self._disk_size -= disk_entry[0]
+                self.misses += 1
+                return None
+            self.hits += 1
+            return data
+
+    def collect(self) -> int:
+        """
+        TTL이 지난 크롭을 정리하고 정리한 개수를 반환합니다.
+        """
+        cutoff = time.time() - self.ttl_seconds
+        removed = 0
+        with self._lock:
+            self._load_disk_index()
+            while self._memory:
+                handle, (data, staged_at) = next(iter(self._memory.items()))
+                if staged_at > cutoff:
+                    break
+                self._memory.popitem(last=False)
+                self._memory_size -= len(data)
+                removed += 1
+            while self._disk:
+                handle, (_, staged_at) = next(iter(self._disk.items()))
+                if staged_at > cutoff:
+                    break
+                self._drop_disk(handle)
+                removed += 1
+            self.expired += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl_seconds,
+                "memory_entries": len(self._memory),
+                "memory_bytes": self._memory_size,
+                "memory_budget_bytes": self.memory_bytes,
+                "disk_entries": len(self._disk),
+                "disk_bytes": self._disk_size,
+                "disk_budget_bytes": self.disk_bytes,
+                "staged": self.staged,
+                "hits": self.hits,
+                "spilled": self.spilled,
+                "expired": self.expired,
+                "evicted": self.evicted,
+                "misses": self.misses,
+            }
+
+
+crop_stage = CropStage()
@@ -1,10 +1,17 @@
-from sqlalchemy import create_engine, Column, Integer, String, DateTime, event, UniqueConstraint, text
+from sqlalchemy import create_engine, Boolean, Column, Integer, String, DateTime, LargeBinary, Index, event, UniqueConstraint, text
 from sqlalchemy.ext.declarative import declarative_base
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool
 from datetime import datetime
+import os
 import sqlite3
+import threading
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./ocr_history.db"
+# async 엔드포인트용 (같은 DB 파일, aiosqlite 드라이버)
+ASYNC_SQLALCHEMY_DATABASE_URL = "sqlite+aiosqlite:///./ocr_history.db"
+DB_ASYNC_POOL_SIZE = int(os.getenv("DB_ASYNC_POOL_SIZE", "8"))
 
 # SQLite 연결 설정 개선
 connect_args = {
@@ -30,6 +37,31 @@ def set_sqlite_pragma(dbapi_conn, connection_record):
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# async 엔드포인트의 조회는 AsyncSessionLocal(get_async_db)을 사용합니다.
+# 쿼리는 연결마다 있는 aiosqlite 스레드에서 실행되므로 DB를 기다리는 동안에도 이벤트 루프가 멈추지 않습니다.
+# SessionLocal은 스레드풀에서 실행하는 코드(작업 큐, 공개 피드 집계 등)와 동기 엔드포인트용으로 유지합니다.
+async_engine = create_async_engine(
+    ASYNC_SQLALCHEMY_DATABASE_URL,
+    connect_args={"timeout": 20.0},
+    # aiosqlite 기본값(NullPool)은 세션마다 연결과 스레드를 새로 만듦
+    poolclass=AsyncAdaptedQueuePool,
+    pool_size=DB_ASYNC_POOL_SIZE,
+    max_overflow=DB_ASYNC_POOL_SIZE,
+    pool_recycle=3600,
+)
+event.listen(async_engine.sync_engine, "connect", set_sqlite_pragma)
+
+# commit 후에도 응답을 만들 때 속성을 다시 읽지 않도록 expire_on_commit=False (async에서는 지연 로딩 불가)
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False)
+
+# 쓰기 트랜잭션은 run_write_transaction으로 스레드풀에서 동기 세션으로 실행합니다 (async 엔드포인트는 run_in_threadpool로 호출).
+# - aiosqlite는 문장마다 이벤트 루프를 여러 번 오가므로, 요약 테이블까지 갱신하는 저장/삭제처럼 문장이 많은 트랜잭션은
+#   요청이 몰릴 때 읽기 요청 사이에서 매 문장 순서를 기다리게 됨. 스레드에서 한 번에 실행하면 루프 왕복은 1회
+# - SQLite는 쓰기 트랜잭션을 한 번에 하나만 허용하고, 동시에 쓰려는 연결은 busy_timeout 동안 간격을 늘려 가며
+#   폴링하므로, 프로세스 안의 쓰기는 write_lock으로 순서대로 처리 (다른 프로세스와는 기존처럼 busy_timeout)
+write_lock = threading.Lock()
+WriteSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine, expire_on_commit=False)
+
 Base = declarative_base()
 
 
@@ -42,10 +74,49 @@ class OCRRecord(Base):
     # 저장 버튼 1회 클릭 단위(업로드 세션)로 이용내역을 집계하기 위한 키
     save_session_id = Column(String, nullable=True, index=True)
     extracted_text = Column(String, nullable=False)
-    cropped_image = Column(String, nullable=True)  # base64 encoded image
+    # 레거시: base64 이미지. 새 레코드는 blob 저장소(blob_store.py)에 저장하고 image_sha256만 기록
+    # (기존 데이터는 db_tools.py migrate-blobs로 이동)
+    cropped_image = Column(String, nullable=True)
+    image_sha256 = Column(String, nullable=True, index=True)
     timestamp = Column(DateTime, default=datetime.utcnow)
     filename = Column(String, nullable=True)  # 원본 파일명
     page_number = Column(Integer, nullable=True)  # PDF 페이지 번호 (이미지인 경우 None)
+    # 저장/수정 시 extracted_text에서 한 번 계산하는 통계 (history_groups.text_stats, 기존 데이터는 db_tools.py backfill-stats)
+    char_count = Column(Integer, nullable=True)
+    is_json = Column(Boolean, nullable=True)  # JSON 객체(dict)로 파싱되는지 (고급 모드 추정)
+    kv_count = Column(Integer, nullable=True)  # JSON 객체의 key 개수
+
+    __table_args__ = (
+        # GET /history keyset 페이지네이션 (최신순, 파일명 필터)
+        Index("ix_ocr_records_email_timestamp_id", "email", "timestamp", "id"),
+        Index("ix_ocr_records_email_filename_timestamp_id", "email", "filename", "timestamp", "id"),
+        # 공개 절약 현황 집계 (전체 사용자, 최근 N일)
+        Index("ix_ocr_records_timestamp", "timestamp"),
+    )
+
+
+class HistoryGroup(Base):
+    """
+    파일/날짜별 히스토리 그룹 요약 (history_groups.py에서 레코드 변경과 같은 트랜잭션으로 갱신).
+    """
+    __tablename__ = "history_groups"
+    __table_args__ = (
+        UniqueConstraint("email", "filename", "group_date", name="uq_history_group"),
+        Index("ix_history_groups_email_latest", "email", "latest_timestamp"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, nullable=False)
+    filename = Column(String, nullable=False)  # 파일명이 없는 레코드는 "Unknown"
+    group_date = Column(String, nullable=False)  # YYYY-MM-DD (UTC)
+    total_records = Column(Integer, nullable=False, default=0)
+    pages_count = Column(Integer, nullable=False, default=0)
+    areas_count = Column(Integer, nullable=False, default=0)
+    total_chars = Column(Integer, nullable=False, default=0)
+    kv_median = Column(Integer, nullable=True)  # JSON(dict) 결과의 key:value 개수 중앙값 (없으면 일반 모드)
+    first_timestamp = Column(DateTime, nullable=False)
+    latest_timestamp = Column(DateTime, nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow)
 
 
 class Prompt(Base):
@@ -114,6 +185,8 @@ class CreditLedger(Base):
     __tablename__ = "credit_ledger"
     __table_args__ = (
         UniqueConstraint("email", "reason", "save_session_id", "page_key", name="uq_credit_once_per_page_per_session"),
+        # 이용 내역 최신순 keyset 페이지네이션
+        Index("ix_credit_ledger_email_created_id", "email", "created_at", "id"),
     )
 
     id = Column(Integer, primary_key=True, index=True)
@@ -127,9 +200,99 @@ class CreditLedger(Base):
     created_at = Column(DateTime, default=datetime.utcnow)
 
 
+class SaveSession(Base):
+    """
+    저장 세션(저장 버튼 1회 클릭) 요약 — 파일 단위 이용 내역용 (save_sessions.py에서 저장/삭제와 같은 트랜잭션으로 갱신).
+    """
+    __tablename__ = "save_sessions"
+    __table_args__ = (
+        UniqueConstraint("email", "save_session_id", "filename", name="uq_save_session"),
+        Index("ix_save_sessions_email_charged_id", "email", "last_charged_at", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, nullable=False)
+    save_session_id = Column(String, nullable=False)
+    filename = Column(String, nullable=False)
+    pages_count = Column(Integer, nullable=False, default=1)
+    records_count = Column(Integer, nullable=False, default=0)
+    delta_total = Column(Integer, nullable=False, default=0)  # 이 세션의 차감 합계 (음수)
+    first_saved_at = Column(DateTime, nullable=True)  # 레코드가 모두 삭제되면 None
+    last_saved_at = Column(DateTime, nullable=True)
+    last_charged_at = Column(DateTime, nullable=False)  # 마지막 차감 시각 (이용 내역 정렬 키)
+
+
+class OCRCacheEntry(Base):
+    """
+    OCR 결과 캐시 (영속 계층)
+    - cache_key: sha256(이미지 해시 + 프롬프트 + 모델 + 생성 옵션)
+    - 메모리 LRU에서 빠진 항목도 재시작 후까지 재사용하기 위한 테이블
+    """
+    __tablename__ = "ocr_cache"
+
+    cache_key = Column(String, primary_key=True)
+    extracted_text = Column(String, nullable=False)
+    size_bytes = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    accessed_at = Column(DateTime, default=datetime.utcnow, index=True)
+
+
+class OCRJob(Base):
+    """
+    비동기 OCR 작업 큐 (서버 재시작 후에도 유지)
+    - status: queued → running → succeeded | failed
+    - image_data: 입력 이미지 원본 (작업이 끝나면 비워서 DB 용량을 줄임)
+    - record_id: 결과가 저장된 OCRRecord id
+    """
+    __tablename__ = "ocr_jobs"
+    __table_args__ = (
+        Index("ix_ocr_jobs_status_id", "status", "id"),
+    )
+
+    id = Column(Integer, primary_key=True, index=True)
+    email = Column(String, nullable=False, index=True)
+    status = Column(String, nullable=False, default="queued")
+    filename = Column(String, nullable=True)
+    page_number = Column(Integer, nullable=True)
+    custom_prompt = Column(String, nullable=True)
+    image_mode = Column(String, nullable=True)
+    save_session_id = Column(String, nullable=True)
+    image_data = Column(LargeBinary, nullable=True)
+    result_text = Column(String, nullable=True)
+    error = Column(String, nullable=True)
+    record_id = Column(Integer, nullable=True)
+    attempts = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
+    started_at = Column(DateTime, nullable=True)
+    finished_at = Column(DateTime, nullable=True)
+
+
 def init_db():
+    from sqlalchemy import inspect
+
+    inspector = inspect(engine)
+    had_history_groups = inspector.has_table("history_groups")
+    had_save_sessions = inspector.has_table("save_sessions")
     Base.metadata.create_all(bind=engine)
-    _ensure_schema_migrations()
+    added_stats = _ensure_schema_migrations()
+    _ensure_search_index()
+    if added_stats or not (had_history_groups and had_save_sessions):
+        # 통계 컬럼이나 요약 테이블이 새로 생긴 경우 기존 레코드로 채움
+        # (그룹 요약은 통계 컬럼으로 집계하므로 통계를 먼저 채움)
+        from history_groups import backfill_text_stats, rebuild_history_groups
+        from save_sessions import rebuild_save_sessions
+
+        db = SessionLocal()
+        try:
+            if added_stats and backfill_text_stats(db):
+                had_history_groups = False
+            if not had_history_groups:
+                rebuild_history_groups(db)
+            if not had_save_sessions:
+                rebuild_save_sessions(db)
+            db.commit()
+        finally:
+            db.close()
 
 
 def _column_exists(conn, table_name: str, column_name: str) -> bool:
@@ -140,7 +303,7 @@ def _column_exists(conn, table_name: str, column_name: str) -> bool:
 def _ensure_schema_migrations():
     """
     SQLite는 Alembic 없이도 간단한 ALTER로 스키마를 보강할 수 있어,
-    개발 환경에서만 필요한 최소 마이그레이션을 적용합니다.
+    개발 환경에서만 필요한 최소 마이그레이션을 적용합니다. 통계 컬럼을 새로 추가했으면 True.
     """
     with engine.begin() as conn:
         # ocr_records.email 컬럼 추가 (로그인 사용자 히스토리 분리)
@@ -149,6 +312,39 @@ def _ensure_schema_migrations():
         # ocr_records.save_session_id 컬럼 추가 (파일/세션 단위 이용내역 집계)
         if not _column_exists(conn, "ocr_records", "save_session_id"):
             conn.execute(text("ALTER TABLE ocr_records ADD COLUMN save_session_id VARCHAR"))
+        # ocr_records.image_sha256 컬럼 추가 (이미지를 blob 저장소로 분리)
+        if not _column_exists(conn, "ocr_records", "image_sha256"):
+            conn.execute(text("ALTER TABLE ocr_records ADD COLUMN image_sha256 VARCHAR"))
+            conn.execute(text("CREATE INDEX IF NOT EXISTS ix_ocr_records_image_sha256 ON ocr_records (image_sha256)"))
+        # ocr_records 통계 컬럼 추가 (저장 시 계산, 기존 레코드는 init_db가 채움)
+        added_stats = False
+        for column_name, column_type in (("char_count", "INTEGER"), ("is_json", "BOOLEAN"), ("kv_count", "INTEGER")):
+            if not _column_exists(conn, "ocr_records", column_name):
+                conn.execute(text(f"ALTER TABLE ocr_records ADD COLUMN {column_name} {column_type}"))
+                added_stats = True
+        # GET /history keyset 페이지네이션 인덱스 (create_all은 기존 테이블에 인덱스를 추가하지 않음)
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_ocr_records_email_timestamp_id ON ocr_records (email, timestamp, id)"
+        ))
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_ocr_records_email_filename_timestamp_id "
+            "ON ocr_records (email, filename, timestamp, id)"
+        ))
+        conn.execute(text("CREATE INDEX IF NOT EXISTS ix_ocr_records_timestamp ON ocr_records (timestamp)"))
+        # 이용 내역 keyset 페이지네이션 인덱스
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS ix_credit_ledger_email_created_id ON credit_ledger (email, created_at, id)"
+        ))
+    return added_stats
+
+
+def _ensure_search_index():
+    # 히스토리 전문 검색 색인 (history_search.py). 새로 만들었으면 기존 레코드로 채움
+    from history_search import ensure_search_index, rebuild_search_index
+
+    with engine.begin() as conn:
+        if ensure_search_index(conn):
+            rebuild_search_index(conn)
 
 
 def get_db():
@@ -158,3 +354,27 @@ def get_db():
     finally:
         db.close()
 
+
+async def get_async_db():
+    async with AsyncSessionLocal() as db:
+        yield db
+
+
+def run_write_transaction(fn, *args):
+    """
+    fn(db, *args)를 write_lock 안에서 실행하고 commit한 뒤 결과를 반환합니다 (예외면 rollback 후 다시 발생).
+    블로킹 함수이므로 async 코드에서는 run_in_threadpool(run_write_transaction, fn, ...)로 호출합니다.
+    expire_on_commit=False라 반환한 ORM 객체는 세션이 닫힌 뒤에도 읽을 수 있습니다.
+    """
+    with write_lock:
+        db = WriteSessionLocal()
+        try:
+            result = fn(db, *args)
+            db.commit()
+            return result
+        except BaseException:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
@@ -5,6 +5,12 @@ SQLite DB utilities for vLM.
 - init: create tables + apply lightweight schema migrations (via database.init_db)
 - backup: create a consistent backup even while the server is running (uses sqlite3 backup API)
 - restore: restore DB from a backup file (recommended with backend stopped)
+- migrate-blobs: move legacy base64 cropped_image values into the blob store (OCR_BLOB_DIR)
+- gc-blobs: delete blobs that no OCR record references anymore
+- rebuild-groups: recompute the history_groups summary table from ocr_records
+- rebuild-sessions: recompute the save_sessions summary table from credit_ledger / ocr_records
+- rebuild-search: (re)create the full-text search index (ocr_records_fts) from ocr_records
+- backfill-stats: fill ocr_records.char_count / is_json / kv_count for records saved before they existed
 
 DB file default: backend/ocr_history.db
 """
@@ -12,6 +18,7 @@ DB file default: backend/ocr_history.db
 from __future__ import annotations
 
 import argparse
+import os
 import shutil
 import sqlite3
 import sys
@@ -27,16 +34,18 @@ def _timestamp() -> str:
     return datetime.now(timezone.utc).strftime("%Y%m%d-%H%M%S")
 
 
-def init_db_cmd(db_path: Path) -> None:
-    # database.py uses a fixed sqlite URL ("sqlite:///./ocr_history.db") relative to backend cwd.
-    # To keep behavior consistent, we run init from backend directory.
+def _chdir_backend() -> None:
+    # database.py uses a fixed sqlite URL ("sqlite:///./ocr_history.db") relative to backend cwd,
+    # and blob_store.py defaults OCR_BLOB_DIR to ./blobs the same way.
     backend_dir = Path(__file__).parent
     if backend_dir != Path.cwd():
-        # ensure relative sqlite path matches (./ocr_history.db)
-        import os
-
         os.chdir(str(backend_dir))
 
+
+def init_db_cmd(db_path: Path) -> None:
+    # To keep behavior consistent, we run init from backend directory.
+    _chdir_backend()
+
     from database import init_db  # local import to avoid import side effects for other commands
 
     init_db()
@@ -98,6 +107,226 @@ def restore_db_cmd(db_path: Path, from_path: Path, yes: bool) -> None:
     print(f"[ok] restored db: {db_path} (from {from_path})")
 
 
+def _db_size(db_path: Path) -> int:
+    return sum(p.stat().st_size for p in (db_path, db_path.with_suffix(".db-wal")) if p.exists())
+
+
+def migrate_blobs_cmd(db_path: Path, batch: int, vacuum: bool) -> None:
+    """
+    Moves base64 cropped_image values into the blob store in batches: each row gets image_sha256
+    and its cropped_image is cleared. Safe to re-run; rows that fail to decode are left untouched.
+    """
+    import base64
+    import binascii
+
+    _chdir_backend()
+    from blob_store import blob_store
+
+    before = _db_size(db_path)
+
+    conn = sqlite3.connect(str(db_path))
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ocr_records)")}
+    if "image_sha256" not in columns:
+        conn.close()
+        raise SystemExit("ocr_records.image_sha256 is missing; run `db_tools.py init` (or start the backend) first")
+    moved = skipped = 0
+    last_id = 0
+    try:
+        while True:
+            rows = conn.execute(
+                "SELECT id, cropped_image FROM ocr_records "
+                "WHERE id > ? AND cropped_image IS NOT NULL AND image_sha256 IS NULL "
+                "ORDER BY id LIMIT ?",
+                (last_id, batch),
+            ).fetchall()
+            if not rows:
+                break
+            updates = []
+            for record_id, value in rows:
+                last_id = record_id
+                if value.startswith("data:") and "," in value:
+                    value = value.split(",", 1)[1]
+                try:
+                    data = base64.b64decode(value, validate=True)
+                except (binascii.Error, ValueError):
+                    data = b""
+                if not data:
+                    skipped += 1
+                    print(f"[warn] record {record_id}: cropped_image is not valid base64, skipped")
+                    continue
+                updates.append((blob_store.put(data), record_id))
+            # blobs are on disk before the rows point at them
+            conn.executemany(
+                "UPDATE ocr_records SET image_sha256 = ?, cropped_image = NULL WHERE id = ?",
+                updates,
+            )
+            conn.commit()
+            moved += len(updates)
+            print(f"[info] migrated {moved} records (last id={last_id})")
+
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+        if vacuum:
+            conn.execute("VACUUM;")
+    finally:
+        conn.close()
+
+    after = _db_size(db_path)
+    print(f"[ok] migrate-blobs: {moved} moved, {skipped} skipped; db size {before} -> {after} bytes")
+    if not vacuum and moved:
+        print("[info] freed pages are reused by SQLite; run with --vacuum to shrink the file")
+
+
+def gc_blobs_cmd(db_path: Path, grace_seconds: int, dry_run: bool) -> None:
+    """
+    Deletes blobs that no record references. Blobs younger than the grace period are kept:
+    a save may have written its blob but not committed its record yet (saving an existing
+    blob again refreshes its mtime).
+    Each deletion re-checks the blob under the database write lock, so a record committed
+    while gc runs keeps its image.
+    """
+    import time
+
+    _chdir_backend()
+    from blob_store import blob_store
+
+    conn = sqlite3.connect(str(db_path), timeout=20.0, isolation_level=None)
+    try:
+        referenced = {
+            row[0]
+            for row in conn.execute("SELECT DISTINCT image_sha256 FROM ocr_records WHERE image_sha256 IS NOT NULL")
+        }
+
+        cutoff = time.time() - grace_seconds
+        removed = kept = freed = 0
+        for sha256, size, mtime in blob_store.iter_hashes():
+            if sha256 in referenced or mtime > cutoff:
+                kept += 1
+                continue
+            if dry_run:
+                removed += 1
+                freed += size
+                continue
+            # no record can commit while we hold the write lock
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                in_use = conn.execute(
+                    "SELECT 1 FROM ocr_records WHERE image_sha256 = ? LIMIT 1", (sha256,)
+                ).fetchone() is not None
+                try:
+                    recent = os.path.getmtime(blob_store.path(sha256)) > cutoff
+                except FileNotFoundError:
+                    recent = False
+                if in_use or recent:
+                    kept += 1
+                elif blob_store.delete(sha256):
+                    removed += 1
+                    freed += size
+            finally:
+                conn.execute("COMMIT")
+    finally:
+        conn.close()
+    verb = "would remove" if dry_run else "removed"
+    print(f"[ok] gc-blobs: {verb} {removed} blobs ({freed} bytes), kept {kept}")
+
+
+def _rebuild_summary(db_path: Path, table: str, rebuild, email: str) -> int:
+    # rebuild(session, email) from history_groups.py / save_sessions.py, run against db_path
+    from sqlalchemy import create_engine
+    from sqlalchemy.orm import sessionmaker
+
+    conn = sqlite3.connect(str(db_path))
+    try:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()
+    finally:
+        conn.close()
+    if not exists:
+        raise SystemExit(f"{table} table is missing; run `db_tools.py init` (or start the backend) first")
+
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"timeout": 20.0})
+    db = sessionmaker(bind=engine)()
+    try:
+        count = rebuild(db, email or None)
+        db.commit()
+    finally:
+        db.close()
+        engine.dispose()
+    return count
+
+
+def rebuild_groups_cmd(db_path: Path, email: str) -> None:
+    _chdir_backend()
+    from history_groups import rebuild_history_groups
+
+    count = _rebuild_summary(db_path, "history_groups", rebuild_history_groups, email)
+    print(f"[ok] rebuild-groups: {count} groups rebuilt for {email or 'all users'} (db={db_path})")
+
+
+def rebuild_sessions_cmd(db_path: Path, email: str) -> None:
+    _chdir_backend()
+    from save_sessions import rebuild_save_sessions
+
+    count = _rebuild_summary(db_path, "save_sessions", rebuild_save_sessions, email)
+    print(f"[ok] rebuild-sessions: {count} save sessions rebuilt for {email or 'all users'} (db={db_path})")
+
+
+def rebuild_search_cmd(db_path: Path, no_optimize: bool) -> None:
+    _chdir_backend()
+    import time
+
+    from sqlalchemy import create_engine
+
+    from history_search import ensure_search_index, rebuild_search_index
+
+    engine = create_engine(f"sqlite:///{db_path}", connect_args={"timeout": 20.0})
+    started = time.monotonic()
+    try:
+        with engine.begin() as conn:
+            ensure_search_index(conn)
+            rebuild_search_index(conn, optimize=not no_optimize)
+            count = conn.exec_driver_sql("SELECT COUNT(*) FROM ocr_records").scalar()
+    finally:
+        engine.dispose()
+    print(f"[ok] rebuild-search: indexed {count} records in {time.monotonic() - started:.1f}s (db={db_path})")
+
+
+def backfill_stats_cmd(db_path: Path, batch: int) -> None:
+    """
+    Computes char_count / is_json / kv_count for rows where char_count is NULL, in batches,
+    then rebuilds history_groups so the summaries use the new columns.
+    """
+    _chdir_backend()
+    from history_groups import text_stats
+
+    conn = sqlite3.connect(str(db_path))
+    columns = {row[1] for row in conn.execute("PRAGMA table_info(ocr_records)")}
+    if "char_count" not in columns:
+        conn.close()
+        raise SystemExit("ocr_records.char_count is missing; run `db_tools.py init` (or start the backend) first")
+    updated = 0
+    last_id = 0
+    try:
+        while True:
+            rows = conn.execute(
+                "SELECT id, extracted_text FROM ocr_records WHERE id > ? AND char_count IS NULL ORDER BY id LIMIT ?",
+                (last_id, batch),
+            ).fetchall()
+            if not rows:
+                break
+            last_id = rows[-1][0]
+            conn.executemany(
+                "UPDATE ocr_records SET char_count = ?, is_json = ?, kv_count = ? WHERE id = ?",
+                [(*text_stats(text), record_id) for record_id, text in rows],
+            )
+            conn.commit()
+            updated += len(rows)
+            print(f"[info] backfilled {updated} records (last id={last_id})")
+    finally:
+        conn.close()
+    print(f"[ok] backfill-stats: {updated} records updated")
+    if updated:
+        rebuild_groups_cmd(db_path, "")
+
+
 def main(argv: list[str]) -> int:
     parser = argparse.ArgumentParser(prog="db_tools.py")
     parser.add_argument(
@@ -121,6 +350,31 @@ def main(argv: list[str]) -> int:
     sub_restore.add_argument("--from", dest="from_path", required=True, help="backup file path")
     sub_restore.add_argument("--yes", action="store_true", help="confirm destructive restore")
 
+    sub_migrate = sub.add_parser("migrate-blobs", help="move base64 cropped images into the blob store")
+    sub_migrate.add_argument("--batch", type=int, default=200, help="rows per transaction (default: 200)")
+    sub_migrate.add_argument("--vacuum", action="store_true", help="VACUUM afterwards to shrink the DB file")
+
+    sub_gc = sub.add_parser("gc-blobs", help="delete blobs no longer referenced by any record")
+    sub_gc.add_argument(
+        "--grace-seconds",
+        type=int,
+        default=3600,
+        help="keep unreferenced blobs younger than this (default: 3600)",
+    )
+    sub_gc.add_argument("--dry-run", action="store_true", help="only report what would be removed")
+
+    sub_groups = sub.add_parser("rebuild-groups", help="recompute the history_groups summary table")
+    sub_groups.add_argument("--email", default="", help="only rebuild this user's groups")
+
+    sub_sessions = sub.add_parser("rebuild-sessions", help="recompute the save_sessions summary table")
+    sub_sessions.add_argument("--email", default="", help="only rebuild this user's sessions")
+
+    sub_search = sub.add_parser("rebuild-search", help="rebuild the full-text search index from ocr_records")
+    sub_search.add_argument("--no-optimize", action="store_true", help="skip merging index segments after the rebuild")
+
+    sub_stats = sub.add_parser("backfill-stats", help="fill char_count/is_json/kv_count for existing records")
+    sub_stats.add_argument("--batch", type=int, default=1000, help="rows per transaction (default: 1000)")
+
     args = parser.parse_args(argv)
     db_path = Path(args.db_path).expanduser().resolve()
 
@@ -142,6 +396,30 @@ def main(argv: list[str]) -> int:
         restore_db_cmd(db_path, Path(args.from_path).expanduser().resolve(), bool(args.yes))
         return 0
 
+    if args.cmd == "migrate-blobs":
+        migrate_blobs_cmd(db_path, max(1, args.batch), bool(args.vacuum))
+        return 0
+
+    if args.cmd == "rebuild-groups":
+        rebuild_groups_cmd(db_path, args.email)
+        return 0
+
+    if args.cmd == "rebuild-sessions":
+        rebuild_sessions_cmd(db_path, args.email)
+        return 0
+
+    if args.cmd == "rebuild-search":
+        rebuild_search_cmd(db_path, args.no_optimize)
+        return 0
+
+    if args.cmd == "backfill-stats":
+        backfill_stats_cmd(db_path, max(1, args.batch))
+        return 0
+
+    if args.cmd == "gc-blobs":
+        gc_blobs_cmd(db_path, max(0, args.grace_seconds), bool(args.dry_run))
+        return 0
+
     raise SystemExit("unknown command")
 
 
@@ -0,0 +1,278 @@
+"""
+파일/날짜별 히스토리 그룹 요약 (history_groups 테이블).
+
+기존 GET /history?grouped=true는 요청마다 최근 30일 OCRRecord 전체(이미지 포함)를 읽어
+파일명/날짜로 나누고, 그룹마다 페이지/영역/글자 수와 모든 extracted_text의 json.loads로 key:value 개수를 다시 계산했습니다.
+이제 (email, filename, 날짜) 그룹마다 요약 1행을 두고, 레코드를 추가/수정/삭제하는 트랜잭션 안에서
+해당 그룹만 다시 계산합니다. 그룹 조회는 요약 행만 읽습니다.
+
+- 그룹 키: (email, filename 또는 "Unknown", timestamp의 UTC 날짜)
+- 요약은 레코드마다 저장 시 한 번 계산해 둔 char_count / is_json / kv_count의 SQL 집계
+  (합계, 중앙값은 윈도 함수)로 만들며 extracted_text를 다시 파싱하지 않습니다.
+- 요약이 어긋났다면 db_tools.py rebuild-groups로 다시 만듭니다.
+"""
+
+import json
+from datetime import date, datetime, timedelta
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import case, distinct, func, or_
+from sqlalchemy.orm import Session
+
+from database import HistoryGroup, OCRRecord
+
+UNKNOWN_FILENAME = "Unknown"
+MINIMUM_WAGE_PER_HOUR = 10320  # 최저시급
+# 일반 모드(문서 전사) 기준: 180 CPM (분당 180글자)
+TYPING_CPM = 180
+
+GroupKey = Tuple[str, date]
+
+
+def group_key(filename: Optional[str], timestamp: datetime) -> GroupKey:
+    return (filename or UNKNOWN_FILENAME, timestamp.date())
+
+
+def _day_range(day: date) -> Tuple[datetime, datetime]:
+    start = datetime.combine(day, datetime.min.time())
+    return start, start + timedelta(days=1)
+
+
+def _group_filters(email: str, filename: str, day: date) -> List[Any]:
+    start, end = _day_range(day)
+    if filename == UNKNOWN_FILENAME:
+        # group_key와 같이 NULL / 빈 문자열도 "Unknown" 그룹
+        name_filter = or_(
+            OCRRecord.filename.is_(None), OCRRecord.filename == "", OCRRecord.filename == UNKNOWN_FILENAME
+        )
+    else:
+        name_filter = OCRRecord.filename == filename
+    return [OCRRecord.email == email, name_filter, OCRRecord.timestamp >= start, OCRRecord.timestamp < end]
+
+
+def text_stats(text: Optional[str]) -> Tuple[int, bool, Optional[int]]:
+    """
+    레코드 통계 (char_count, is_json, kv_count).
+    히스토리에는 모드가 따로 저장되지 않으므로, extracted_text가 JSON 객체(dict)로 파싱되면 "고급"으로 추정합니다.
+    is_json은 JSON 객체일 때만 True이고, kv_count는 그 key 개수입니다 (아니면 None).
+    """
+    text = text or ""
+    stripped = text.strip()
+    obj = None
+    if stripped:
+        try:
+            obj = json.loads(stripped)
+        except Exception:
+            obj = None
+    if isinstance(obj, dict):
+        return len(text), True, len(obj.keys())
+    return len(text), False, None
+
+
+def apply_text_stats(record: OCRRecord) -> None:
+    # extracted_text를 저장/수정할 때마다 호출
+    record.char_count, record.is_json, record.kv_count = text_stats(record.extracted_text)
+
+
+def backfill_text_stats(db: Session, batch_size: int = 1000) -> int:
+    """
+    통계 컬럼이 비어 있는(char_count IS NULL) 레코드의 통계를 채웁니다 (commit은 호출 측). 채운 레코드 수를 반환합니다.
+    """
+    updated = 0
+    last_id = 0
+    while True:
+        rows = (
+            db.query(OCRRecord.id, OCRRecord.extracted_text)
+            .filter(OCRRecord.id > last_id, OCRRecord.char_count.is_(None))
+            .order_by(OCRRecord.id)
+            .limit(batch_size)
+            .all()
+        )
+        if not rows:
+            return updated
+        last_id = rows[-1][0]
+        db.bulk_update_mappings(OCRRecord, [
+            dict(zip(("char_count", "is_json", "kv_count"), text_stats(text)), id=record_id)
+            for record_id, text in rows
+        ])
+        updated += len(rows)
+
+
+def _finish_summary(
+    total_records: int,
+    total_chars: int,
+    distinct_pages: int,
+    images_count: int,
+    kv_median: Optional[int],
+    first_timestamp: datetime,
+    latest_timestamp: datetime,
+) -> Dict[str, Any]:
+    # 페이지 수 계산: 고유한 페이지 번호 개수 + 이미지가 있으면 1페이지 추가
+    pages_count = distinct_pages
+    if images_count > 0:
+        pages_count = max(pages_count, 1)  # 이미지가 있으면 최소 1페이지
+    # area 추정: (총 레코드 = 영역×페이지) 라는 전제에서 영역 수를 역산
+    if pages_count > 0:
+        areas_count = max(1, int(round(total_records / pages_count)))
+    else:
+        areas_count = total_records
+    return {
+        "total_records": total_records,
+        "pages_count": pages_count,
+        "areas_count": areas_count,
+        "total_chars": int(total_chars),
+        "kv_median": kv_median,
+        "first_timestamp": first_timestamp,
+        "latest_timestamp": latest_timestamp,
+    }
+
+
+def aggregate_groups(db: Session, group_columns: List[Any], filters: List[Any], limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    filters에 해당하는 레코드를 group_columns로 묶은 요약 목록 (최근 그룹 순, limit 적용).
+    각 항목: {"key": group_columns 값 튜플, 요약 필드...}
+    key:value 개수는 JSON 객체 레코드들의 중앙값(정렬 후 n // 2번째)을 윈도 함수로 구합니다.
+    """
+    # 백필(db_tools.py backfill-stats) 전 레코드는 글자 수만 직접 계산
+    chars = func.coalesce(OCRRecord.char_count, func.length(OCRRecord.extracted_text))
+    stats = (
+        db.query(
+            *group_columns,
+            func.count(OCRRecord.id),
+            func.coalesce(func.sum(chars), 0),
+            func.count(distinct(OCRRecord.page_number)),
+            func.coalesce(func.sum(case((OCRRecord.page_number.is_(None), 1), else_=0)), 0),
+            func.min(OCRRecord.timestamp),
+            func.max(OCRRecord.timestamp),
+        )
+        .filter(*filters)
+        .group_by(*group_columns)
+        .order_by(func.max(OCRRecord.timestamp).desc())
+    )
+    if limit is not None:
+        stats = stats.limit(limit)
+    rows = stats.all()
+    if not rows:
+        return []
+
+    width = len(group_columns)
+    partition = group_columns or None
+    ranked = (
+        db.query(
+            *[column.label(f"g{i}") for i, column in enumerate(group_columns)],
+            OCRRecord.kv_count.label("kv_count"),
+            func.row_number().over(partition_by=partition, order_by=OCRRecord.kv_count).label("rn"),
+            func.count(OCRRecord.id).over(partition_by=partition).label("n"),
+        )
+        .filter(*filters, OCRRecord.is_json.is_(True))
+        .subquery()
+    )
+    medians = {
+        tuple(row[:width]): row[width]
+        for row in db.query(
+            *[ranked.c[f"g{i}"] for i in range(width)], ranked.c.kv_count
+        ).filter(ranked.c.rn - 1 == ranked.c.n // 2)
+    }
+
+    results = []
+    for row in rows:
+        key = tuple(row[:width])
+        total_records, total_chars, distinct_pages, images_count, first_timestamp, latest_timestamp = row[width:]
+        if not total_records:
+            continue  # group_columns 없이 집계하면 레코드가 없어도 1행이 나옴
+        summary = _finish_summary(
+            total_records, total_chars, distinct_pages, images_count,
+            medians.get(key), first_timestamp, latest_timestamp,
+        )
+        summary["key"] = key
+        results.append(summary)
+    return results
+
+
+def refresh_history_groups(db: Session, email: Optional[str], keys: Iterable[GroupKey]) -> None:
+    """
+    주어진 그룹들의 요약을 ocr_records에서 다시 계산해 반영합니다 (commit은 호출 측).
+    레코드 변경을 flush한 뒤 같은 트랜잭션에서 호출해야 합니다.
+    """
+    if not email:
+        return
+    for filename, day in set(keys):
+        found = aggregate_groups(db, [], _group_filters(email, filename, day))
+        summary = found[0] if found else None
+        group = (
+            db.query(HistoryGroup)
+            .filter(
+                HistoryGroup.email == email,
+                HistoryGroup.filename == filename,
+                HistoryGroup.group_date == day.isoformat(),
+            )
+            .first()
+        )
+        if summary is None:
+            if group is not None:
+                db.delete(group)
+            continue
+        if group is None:
+            group = HistoryGroup(email=email, filename=filename, group_date=day.isoformat())
+            db.add(group)
+        for field, value in summary.items():
+            if field != "key":
+                setattr(group, field, value)
+        group.updated_at = datetime.utcnow()
+    db.flush()
+
+
+def rebuild_history_groups(db: Session, email: Optional[str] = None) -> int:
+    """
+    ocr_records 전체(또는 한 사용자)에서 그룹 요약을 다시 만듭니다 (commit은 호출 측). 만든 그룹 수를 반환합니다.
+    """
+    groups = db.query(HistoryGroup)
+    records = db.query(OCRRecord.email, OCRRecord.filename, OCRRecord.timestamp).filter(
+        OCRRecord.email.isnot(None), OCRRecord.timestamp.isnot(None)
+    )
+    if email is not None:
+        groups = groups.filter(HistoryGroup.email == email)
+        records = records.filter(OCRRecord.email == email)
+    groups.delete(synchronize_session=False)
+
+    keys_by_email: Dict[str, set] = {}
+    for record_email, filename, timestamp in records.yield_per(1000):
+        keys_by_email.setdefault(record_email, set()).add(group_key(filename, timestamp))
+    for record_email, keys in keys_by_email.items():
+        refresh_history_groups(db, record_email, keys)
+    return sum(len(keys) for keys in keys_by_email.values())
+
+
+def estimate_savings(pages_count: int, total_chars: int, kv_median: Optional[int]) -> Tuple[float, str, float]:
+    """
+    절약 시간/금액 계산: (time_saved_minutes, time_basis, money_saved)
+    - 일반 모드: 글자 수 기반 타이핑 시간(공백 포함)
+    - 고급 모드: key:value 1개당 10초 × 페이지수
+    """
+    if kv_median is not None:
+        time_saved_minutes = (kv_median * pages_count * 10) / 60.0
+        time_basis = "advanced"
+    else:
+        time_saved_minutes = (float(total_chars) / float(TYPING_CPM)) if TYPING_CPM > 0 else 0.0
+        time_basis = "standard_chars"
+    money_saved = (time_saved_minutes / 60) * MINIMUM_WAGE_PER_HOUR
+    return time_saved_minutes, time_basis, money_saved
+
+
+def group_to_response(group: HistoryGroup) -> Dict[str, Any]:
+    time_saved_minutes, time_basis, money_saved = estimate_savings(
+        group.pages_count, group.total_chars, group.kv_median
+    )
+    return {
+        "filename": group.filename,
+        "total_records": group.total_records,
+        "pages_count": group.pages_count,
+        "areas_count": group.areas_count,
+        "time_saved_minutes": round(time_saved_minutes, 2),
+        "time_basis": time_basis,
+        "total_chars": int(group.total_chars),
+        "money_saved": round(money_saved, 2),
+        "latest_timestamp": group.latest_timestamp.isoformat(),
+        "first_timestamp": group.first_timestamp.isoformat(),
+        "date": group.group_date,
+    }
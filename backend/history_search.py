@@ -0,0 +1,192 @@
+"""
+히스토리 전문 검색 (SQLite FTS5, GET /history/search).
+
+지금까지 지난 결과는 /history 그룹을 넘겨 보며 찾거나, 클라이언트가 전부 내려받아 검색해야 했습니다.
+ocr_records의 extracted_text / filename을 FTS5 역색인(ocr_records_fts)으로 색인하고
+검색은 색인에서 일치하는 레코드만 읽습니다.
+
+- 외부 콘텐츠 테이블(content=ocr_records_search 뷰)이라 본문은 중복 저장하지 않고, 트리거가 INSERT/UPDATE/DELETE를 따라
+  색인을 갱신합니다. (ORM이든 db_tools.py든 ocr_records를 바꾸는 모든 경로에 적용)
+- 소유자(hex(email))도 토큰 하나로 색인해 MATCH 단계에서 호출한 사용자의 레코드로 좁힙니다.
+  (email을 JOIN 후에 거르면 흔한 검색어는 전체 사용자의 일치 항목을 모두 점수 매긴 뒤 버리게 됨)
+- 관련도: bm25, 파일명 일치에 가중치 2 (소유자 컬럼은 0)
+- 토크나이저: unicode61 (공백/구두점 기준). 한국어는 조사가 붙어 색인되므로("서울시에서")
+  검색어마다 접두사 검색("서울시"*)으로 바꿉니다. 2~3글자 접두사는 prefix 색인으로 빠르게 찾습니다.
+- 색인이 없던 DB는 init_db가 만들면서 기존 레코드를 채웁니다. 어긋났다면 db_tools.py rebuild-search로 다시 만듭니다.
+"""
+
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import DateTime, text
+from sqlalchemy.orm import Session
+
+SEARCH_TABLE = "ocr_records_fts"
+SEARCH_CONTENT_VIEW = "ocr_records_search"
+# 검색어 최대 개수 (모두 포함하는 레코드만 검색, AND)
+SEARCH_MAX_TERMS = 8
+# 스니펫 길이 (토큰 수)
+SEARCH_SNIPPET_TOKENS = 24
+SEARCH_SORTS = ("relevance", "recent")
+
+# highlight()/snippet() 표시 문자. 응답에서는 제거하고 (시작, 끝) 위치로 돌려줍니다.
+_MARK_OPEN = "\x02"
+_MARK_CLOSE = "\x03"
+
+SEARCH_INDEX_DDL = (
+    # 색인 컬럼과 같은 이름의 컬럼을 내주는 콘텐츠 뷰 (rebuild / snippet / highlight가 읽음)
+    f"""
+    CREATE VIEW IF NOT EXISTS {SEARCH_CONTENT_VIEW} AS
+    SELECT id, extracted_text, filename, hex(email) AS owner FROM ocr_records
+    """,
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5(
+        extracted_text, filename, owner,
+        content='{SEARCH_CONTENT_VIEW}', content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ocr_records_fts_ai AFTER INSERT ON ocr_records BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, extracted_text, filename, owner)
+        VALUES (new.id, new.extracted_text, new.filename, hex(new.email));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ocr_records_fts_ad AFTER DELETE ON ocr_records BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, extracted_text, filename, owner)
+        VALUES ('delete', old.id, old.extracted_text, old.filename, hex(old.email));
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS ocr_records_fts_au AFTER UPDATE OF extracted_text, filename, email ON ocr_records BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, extracted_text, filename, owner)
+        VALUES ('delete', old.id, old.extracted_text, old.filename, hex(old.email));
+        INSERT INTO {SEARCH_TABLE}(rowid, extracted_text, filename, owner)
+        VALUES (new.id, new.extracted_text, new.filename, hex(new.email));
+    END
+    """,
+)
+# ORDER BY rank에 쓰는 기본 순위 함수 (색인에 저장되는 설정)
+SEARCH_RANK = "bm25(1.0, 2.0, 0.0)"
+
+
+def ensure_search_index(conn) -> bool:
+    """
+    색인 테이블과 동기화 트리거를 만듭니다 (SQLAlchemy Connection). 색인 테이블을 새로 만들었으면 True.
+    """
+    existed = conn.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"), {"name": SEARCH_TABLE}
+    ).first() is not None
+    for statement in SEARCH_INDEX_DDL:
+        conn.execute(text(statement))
+    if not existed:
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rank) VALUES ('rank', :rank)"), {"rank": SEARCH_RANK})
+    return not existed
+
+
+def rebuild_search_index(conn, optimize: bool = True) -> None:
+    # ocr_records 전체로 색인을 다시 만들고 (외부 콘텐츠 테이블의 'rebuild' 명령) 세그먼트를 하나로 합칩니다
+    conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')"))
+    if optimize:
+        conn.execute(text(f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('optimize')"))
+
+
+def build_match_query(email: str, q: str) -> str:
+    """
+    사용자 검색어를 FTS5 MATCH 식으로 바꿉니다. 검색어마다 따옴표로 감싼 접두사 검색이며 모두 포함해야 합니다 (AND),
+    본문/파일명에서만 찾고 email 사용자의 레코드로 한정합니다.
+    FTS5 연산자(OR, NEAR, 컬럼 필터 등)는 일반 글자로 취급합니다. 검색할 단어가 없으면 ValueError.
+    """
+    terms = [t for t in re.split(r"\s+", q.strip()) if re.search(r"\w", t)]
+    if not terms:
+        raise ValueError("empty search query")
+    phrases = " ".join('"' + t.replace('"', '""') + '"*' for t in terms[:SEARCH_MAX_TERMS])
+    owner = email.encode("utf-8").hex().upper()  # SQLite hex()와 같은 값
+    return f'owner : "{owner}" AND {{extracted_text filename}} : ({phrases})'
+
+
+def _split_marks(value: Optional[str]) -> Tuple[Optional[str], List[List[int]]]:
+    # 표시 문자를 제거한 문자열과 강조 구간 [시작, 끝) 목록
+    if value is None:
+        return None, []
+    plain: List[str] = []
+    ranges: List[List[int]] = []
+    length = 0
+    start = None
+    for part in re.split(f"([{_MARK_OPEN}{_MARK_CLOSE}])", value):
+        if part == _MARK_OPEN:
+            start = length
+        elif part == _MARK_CLOSE:
+            if start is not None and length > start:
+                ranges.append([start, length])
+            start = None
+        else:
+            plain.append(part)
+            length += len(part)
+    return "".join(plain), ranges
+
+
+def search_records(
+    db: Session,
+    email: str,
+    match: str,
+    limit: int,
+    sort: str = "relevance",
+    after: Optional[Tuple[Optional[float], int]] = None,
+) -> Tuple[List[Dict[str, Any]], bool]:
+    """
+    email 사용자의 레코드 중 match(build_match_query(email, q) 결과)에 일치하는 것을 최대 limit개 반환합니다: (items, has_more)
+    - relevance: bm25 점수(rank, 작을수록 관련도 높음), 같으면 id 내림차순
+    - recent: id 내림차순 (저장 순서)
+    after는 직전 페이지 마지막 항목의 (rank, id) 이며 그 다음부터 조회합니다 (keyset).
+    관련도 점수는 색인 전체 통계를 쓰므로 페이지 사이에 레코드가 추가되면 순서가 조금 달라질 수 있습니다.
+    """
+    params: Dict[str, Any] = {"match": match, "email": email, "limit": limit + 1}
+    keyset = ""
+    if sort == "relevance":
+        order = f"{SEARCH_TABLE}.rank, {SEARCH_TABLE}.rowid DESC"
+        if after is not None:
+            keyset = f"AND ({SEARCH_TABLE}.rank > :after_rank OR ({SEARCH_TABLE}.rank = :after_rank AND {SEARCH_TABLE}.rowid < :after_id))"
+            params["after_rank"], params["after_id"] = after
+    else:
+        order = f"{SEARCH_TABLE}.rowid DESC"
+        if after is not None:
+            keyset = f"AND {SEARCH_TABLE}.rowid < :after_id"
+            params["after_id"] = after[1]
+
+    rows = db.execute(
+        text(
+            f"""
+            SELECT
+                r.id, r.filename, r.page_number, r.timestamp, r.image_sha256,
+                {SEARCH_TABLE}.rank AS rank,
+                snippet({SEARCH_TABLE}, 0, :open, :close, '…', {SEARCH_SNIPPET_TOKENS}) AS snippet,
+                highlight({SEARCH_TABLE}, 1, :open, :close) AS filename_marked
+            FROM {SEARCH_TABLE}
+            JOIN ocr_records AS r ON r.id = {SEARCH_TABLE}.rowid
+            WHERE {SEARCH_TABLE} MATCH :match AND r.email = :email {keyset}
+            ORDER BY {order}
+            LIMIT :limit
+            """
+        ).columns(timestamp=DateTime),
+        {**params, "open": _MARK_OPEN, "close": _MARK_CLOSE},
+    ).all()
+
+    has_more = len(rows) > limit
+    items = []
+    for row in rows[:limit]:
+        snippet, snippet_highlights = _split_marks(row.snippet)
+        _, filename_highlights = _split_marks(row.filename_marked)
+        items.append({
+            "id": row.id,
+            "filename": row.filename,
+            "page_number": row.page_number,
+            "timestamp": row.timestamp,
+            "image_sha256": row.image_sha256,
+            "rank": row.rank,
+            "snippet": snippet,
+            "snippet_highlights": snippet_highlights,
+            "filename_highlights": filename_highlights,
+        })
+    return items, has_more
@@ -0,0 +1,158 @@
+"""
+OCR 입력 이미지 전처리 (1회 디코딩).
+
+업로드된 크롭 이미지를 한 번만 디코딩하여
+- EXIF 방향 보정
+- 모드 정규화 (RGBA/P/CMYK 등 → RGB, 투명 영역은 흰 배경으로 합성)
+- 비전 인코더 픽셀 예산(OCR_IMAGE_MAX_PIXELS)에 맞춰 축소 (변 길이는 28의 배수)
+- 선택적으로 흑백(grayscale) 또는 이진화(binarize)
+를 적용한 뒤 한 번만 다시 인코딩합니다. 아무것도 바뀌지 않았다면 원본 바이트를 그대로 사용합니다.
+
+큰 크롭일수록 비전 토큰 수와 메모리 사용량이 줄어듭니다.
+"""
+
+import base64
+import io
+import math
+import os
+from typing import Optional
+
+from PIL import Image, ImageOps
+
+# Qwen2.5-VL은 14px 패치를 2x2로 병합하므로 28px 단위로 비전 토큰 1개가 됩니다.
+VISION_PATCH_SIZE = 28
+# 기본 예산: 1280x1280 픽셀 (약 2,090 비전 토큰)
+OCR_IMAGE_MAX_PIXELS = int(os.getenv("OCR_IMAGE_MAX_PIXELS", str(1280 * 1280)))
+# color | grayscale | binarize
+OCR_IMAGE_MODE = os.getenv("OCR_IMAGE_MODE", "color").strip().lower()
+OCR_IMAGE_BINARIZE_THRESHOLD = int(os.getenv("OCR_IMAGE_BINARIZE_THRESHOLD", "160"))
+
+IMAGE_MODES = ("color", "grayscale", "binarize")
+EXIF_ORIENTATION_TAG = 0x0112
+PASSTHROUGH_FORMATS = ("PNG", "JPEG")
+
+
+class PreprocessedImage:
+    """
+    전처리 결과.
+    - data/base64: 모델에 보낼 이미지
+    - original_base64: 응답/히스토리 저장용 원본 크롭 (변경이 없으면 base64와 같은 객체)
+    - report: 전/후 크기 정보
+    """
+
+    __slots__ = ("data", "base64", "original_base64", "report")
+
+    def __init__(self, data: bytes, base64_str: str, original_base64: str, report: dict):
+        self.data = data
+        self.base64 = base64_str
+        self.original_base64 = original_base64
+        self.report = report
+
+
+def _target_size(width: int, height: int, max_pixels: int) -> Optional[tuple]:
+    """
+    픽셀 예산을 넘으면 비율을 유지하며 축소한 크기(28의 배수)를, 넘지 않으면 None을 반환합니다.
+    """
+    if max_pixels <= 0 or width * height <= max_pixels:
+        return None
+    scale = math.sqrt(max_pixels / float(width * height))
+    new_w = max(VISION_PATCH_SIZE, int(width * scale) // VISION_PATCH_SIZE * VISION_PATCH_SIZE)
+    new_h = max(VISION_PATCH_SIZE, int(height * scale) // VISION_PATCH_SIZE * VISION_PATCH_SIZE)
+    return new_w, new_h
+
+
+def _normalize_mode(img: Image.Image) -> Image.Image:
+    if img.mode in ("RGB", "L"):
+        return img
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        rgba = img.convert("RGBA")
+        background = Image.new("RGB", rgba.size, (255, 255, 255))
+        background.paste(rgba, mask=rgba.getchannel("A"))
+        return background
+    return img.convert("RGB")
+
+
+def resolve_image_mode(image_mode: Optional[str]) -> str:
+    """
+    요청 값(없으면 OCR_IMAGE_MODE)을 정규화합니다. 알 수 없는 값은 ValueError.
+    """
+    mode = (image_mode or OCR_IMAGE_MODE or "color").strip().lower()
+    if mode not in IMAGE_MODES:
+        raise ValueError(f"invalid image_mode: {mode} (expected one of {', '.join(IMAGE_MODES)})")
+    return mode
+
+
+def preprocess_image(
+    file_bytes: bytes,
+    max_pixels: int = OCR_IMAGE_MAX_PIXELS,
+    image_mode: Optional[str] = None,
+) -> PreprocessedImage:
+    """
+    이미지를 1회 디코딩/1회 인코딩으로 전처리합니다.
+    디코딩 실패(손상/비이미지 파일)는 ValueError로 알립니다.
+    CPU 작업이므로 async 엔드포인트에서는 run_in_threadpool로 호출하세요.
+    """
+    if not file_bytes:
+        raise ValueError("Empty file received")
+
+    mode = resolve_image_mode(image_mode)
+
+    try:
+        src = Image.open(io.BytesIO(file_bytes))
+        # load()는 전체 픽셀을 디코딩하므로 verify() 없이도 손상된 파일을 걸러냄
+        src.load()
+    except Exception as e:
+        raise ValueError(str(e))
+
+    original = {
+        "width": src.size[0],
+        "height": src.size[1],
+        "bytes": len(file_bytes),
+        "mode": src.mode,
+        "format": src.format,
+    }
+
+    # EXIF 방향 태그가 있을 때만 회전 (exif_transpose는 태그가 없어도 복사본을 만듦)
+    oriented = src.getexif().get(EXIF_ORIENTATION_TAG, 1) not in (0, 1)
+    img = ImageOps.exif_transpose(src) if oriented else src
+    img = _normalize_mode(img)
+
+    target = _target_size(img.size[0], img.size[1], max_pixels)
+    if target:
+        img = img.resize(target, Image.LANCZOS)
+
+    if mode == "grayscale":
+        if img.mode != "L":
+            img = img.convert("L")
+    elif mode == "binarize":
+        gray = ImageOps.autocontrast(img.convert("L"))
+        threshold = OCR_IMAGE_BINARIZE_THRESHOLD
+        img = gray.point(lambda p: 255 if p > threshold else 0, mode="1")
+
+    # 모델이 바로 읽을 수 없는 포맷(GIF/BMP/TIFF 등)은 변경이 없어도 PNG로 다시 인코딩
+    changed = img is not src or original["format"] not in PASSTHROUGH_FORMATS
+    original_base64 = base64.b64encode(file_bytes).decode("utf-8")
+    if changed:
+        buf = io.BytesIO()
+        img.save(buf, format="PNG", optimize=False)
+        data = buf.getvalue()
+        data_base64 = base64.b64encode(data).decode("utf-8")
+    else:
+        data = file_bytes
+        data_base64 = original_base64
+
+    report = {
+        "original": original,
+        "processed": {
+            "width": img.size[0],
+            "height": img.size[1],
+            "bytes": len(data),
+            "mode": img.mode,
+            "format": "PNG" if changed else original["format"],
+        },
+        "resized": bool(target),
+        "reoriented": oriented,
+        "image_mode": mode,
+        "max_pixels": max_pixels,
+    }
+    return PreprocessedImage(data, data_base64, original_base64, report)
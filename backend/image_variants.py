@@ -0,0 +1,185 @@
+"""
+히스토리 이미지 변형(썸네일/포맷) 캐시.
+
+GET /history/{id}/image?size=thumb|medium|full&format=webp|png 은 저장된 크롭 원본(blob)을
+요청한 크기/포맷으로 변환해 바이너리로 돌려줍니다. 변환은 처음 요청될 때만 하고 결과는 디스크에 캐시합니다.
+
+- 크기: 긴 변 기준 축소 (원본보다 크게 늘리지 않음), full은 원본 크기
+- 캐시 이름: {sha256}-{size}.{format} (원본이 바뀌지 않으므로 무효화 불필요)
+- 용량 예산 OCR_VARIANT_CACHE_BYTES를 넘으면 가장 오래 사용하지 않은 것부터 삭제 (LRU, 재시작 후에는 mtime 순)
+"""
+
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from PIL import Image, ImageOps
+
+# database.py의 sqlite 경로와 마찬가지로 backend 실행 위치 기준
+OCR_VARIANT_DIR = os.getenv("OCR_VARIANT_DIR", "./image_variants")
+OCR_VARIANT_CACHE_BYTES = int(os.getenv("OCR_VARIANT_CACHE_BYTES", str(256 * 1024 * 1024)))  # 기본 256MB
+OCR_VARIANT_WEBP_QUALITY = int(os.getenv("OCR_VARIANT_WEBP_QUALITY", "80"))
+
+# 크기 이름 → 긴 변 최대 픽셀 (None: 원본 크기)
+VARIANT_SIZES: Dict[str, Optional[int]] = {"thumb": 160, "medium": 640, "full": None}
+# 포맷 이름 → (PIL 포맷, MIME 타입)
+VARIANT_FORMATS: Dict[str, Tuple[str, str]] = {"webp": ("WEBP", "image/webp"), "png": ("PNG", "image/png")}
+
+
+def render_variant(data: bytes, size: str, fmt: str) -> bytes:
+    """
+    원본 이미지 바이트를 요청한 크기/포맷으로 다시 인코딩합니다. 디코딩할 수 없으면 ValueError.
+    """
+    max_edge = VARIANT_SIZES[size]
+    pil_format = VARIANT_FORMATS[fmt][0]
+    try:
+        image = Image.open(io.BytesIO(data))
+        image = ImageOps.exif_transpose(image)
+    except Exception as e:
+        raise ValueError(f"cannot decode image: {e}") from e
+    if image.mode not in ("RGB", "RGBA", "L", "LA"):
+        image = image.convert("RGBA" if "transparency" in image.info or image.mode in ("P", "PA") else "RGB")
+    if max_edge is not None and max(image.size) > max_edge:
+        image.thumbnail((max_edge, max_edge), Image.LANCZOS)
+    out = io.BytesIO()
+    if pil_format == "WEBP":
+        image.save(out, "WEBP", quality=OCR_VARIANT_WEBP_QUALITY, method=4)
+    else:
+        image.save(out, "PNG", optimize=max_edge is not None)
+    return out.getvalue()
+
+
+class VariantCache:
+    """
+    (sha256, size, format) → 변환된 이미지 바이트 (디스크 파일로 캐시). 파일 I/O와 이미지 변환이 있으므로 run_in_threadpool로 호출합니다.
+    """
+
+    def __init__(self, directory: str = OCR_VARIANT_DIR, max_bytes: int = OCR_VARIANT_CACHE_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+
+        # 파일 이름 -> size, 오래 사용하지 않은 순
+        self._entries: "OrderedDict[str, int]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self._loaded = False
+
+        self.hits = 0
+        self.generated = 0
+        self.evicted = 0
+
+    @staticmethod
+    def _name(sha256: str, size: str, fmt: str) -> str:
+        return f"{sha256}-{size}.{fmt}"
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _load_index(self) -> None:
+        # 재시작 후에도 디스크에 남은 변형을 이어서 사용 (사용 순서는 파일 mtime)
+        if self._loaded:
+            return
+        self._loaded = True
+        os.makedirs(self.directory, exist_ok=True)
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.startswith(".tmp-"):
+                continue
+            try:
+                st = os.stat(self._path(name))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, name, st.st_size))
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._size += size
+
+    def _evict(self) -> None:
+        # lock 안에서 호출
+        while self._size > self.max_bytes and len(self._entries) > 1:
+            name, size = self._entries.popitem(last=False)
+            self._size -= size
+            self.evicted += 1
+            try:
+                os.remove(self._path(name))
+            except OSError:
+                # 이미 지워졌거나 (Windows) 다른 요청이 읽는 중: 색인에서만 빼고 재시작 시 다시 정리
+                pass
+
+    def _lookup(self, name: str) -> Optional[bytes]:
+        # 파일은 lock 안에서 열어 둠: 이후 다른 요청의 _evict가 지워도 열린 핸들로 끝까지 읽을 수 있음
+        with self._lock:
+            self._load_index()
+            if name not in self._entries:
+                return None
+            path = self._path(name)
+            try:
+                f = open(path, "rb")
+            except FileNotFoundError:
+                self._size -= self._entries.pop(name)
+                return None
+            try:
+                os.utime(path)
+            except OSError:
+                pass
+            self._entries.move_to_end(name)
+            self.hits += 1
+        with f:
+            return f.read()
+
+    def get_or_create(self, sha256: str, size: str, fmt: str, source: bytes) -> bytes:
+        """
+        캐시된 변형 바이트를 반환합니다. 없으면 source(원본 바이트)로 만들어 저장합니다.
+        같은 변형을 동시에 처음 요청하면 각각 변환하지만 결과 파일은 동일합니다.
+        """
+        name = self._name(sha256, size, fmt)
+        cached = self._lookup(name)
+        if cached is not None:
+            return cached
+
+        data = render_variant(source, size, fmt)
+        os.makedirs(self.directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._path(name))
+        except BaseException:
+            try:
+                os.remove(tmp_path)
+            except FileNotFoundError:
+                pass
+            raise
+
+        with self._lock:
+            previous = self._entries.pop(name, None)
+            if previous is not None:
+                self._size -= previous
+            self._entries[name] = len(data)
+            self._size += len(data)
+            self.generated += 1
+            self._evict()
+        return data
+
+    def cached(self, sha256: str, size: str, fmt: str) -> Optional[bytes]:
+        """
+        이미 만들어진 변형만 조회합니다 (원본을 읽지 않고 응답할 수 있는지 확인용).
+        """
+        return self._lookup(self._name(sha256, size, fmt))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "bytes": self._size,
+                "budget_bytes": self.max_bytes,
+                "hits": self.hits,
+                "generated": self.generated,
+                "evicted": self.evicted,
+            }
+
+
+variant_cache = VariantCache()
@@ -0,0 +1,405 @@
+"""
+Ollama 비동기 추론 클라이언트 (다중 백엔드 라우터).
+
+- 여러 Ollama 서버(OLLAMA_HOSTS)를 하나의 풀로 묶고, 호출마다 진행 중인 요청이 가장 적은
+  정상 백엔드로 보냅니다(least-outstanding-requests).
+- 백엔드마다 ollama.AsyncClient 1개(= 공유 httpx 커넥션 풀)와 동시 호출 상한을 둡니다.
+  모든 백엔드가 상한에 도달하면 요청은 대기열에서 순서대로 기다립니다.
+  GPU가 포화 상태여도 이벤트 루프는 막히지 않으므로 /auth/me, /history 같은 가벼운 API는
+  추론과 무관하게 바로 응답할 수 있습니다.
+- 주기적인 헬스 체크(/api/tags)와 호출 실패로 연속 실패가 쌓인 백엔드는 풀에서 제외(eject)하고,
+  헬스 체크가 다시 성공하면 재투입(readmit)합니다.
+- 백엔드별 호출 수, 오류 수, 지연 시간(p50/p95, 스트리밍은 첫 토큰까지의 시간 포함)을 집계합니다.
+"""
+
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Deque, Dict, List, Optional, Tuple, Union
+
+import httpx
+import ollama
+
+OCR_MODEL = os.getenv("OCR_MODEL", "qwen2.5vl:7b")
+
+DEFAULT_OLLAMA_HOST = "http://127.0.0.1:11434"
+# 쉼표로 구분한 백엔드 목록. "url=4"처럼 백엔드별 동시 호출 상한을 지정할 수 있음
+# (없으면 OLLAMA_HOST 1대)
+OLLAMA_HOSTS = os.getenv("OLLAMA_HOSTS", "")
+
+# 백엔드별 기본 동시 호출 수 (초과 요청은 대기열에서 순서대로 대기)
+OLLAMA_MAX_CONCURRENCY = int(os.getenv("OLLAMA_MAX_CONCURRENCY", "2"))
+# 백엔드별 커넥션 풀 크기 (keep-alive 연결 재사용)
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "16"))
+# 연결 타임아웃은 짧게, 읽기 타임아웃은 긴 생성(num_predict=16384)을 고려해 넉넉하게
+OLLAMA_CONNECT_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_CONNECT_TIMEOUT_SECONDS", "10"))
+OLLAMA_READ_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_READ_TIMEOUT_SECONDS", "600"))
+
+# 헬스 체크
+OLLAMA_HEALTH_INTERVAL_SECONDS = float(os.getenv("OLLAMA_HEALTH_INTERVAL_SECONDS", "10"))
+OLLAMA_HEALTH_TIMEOUT_SECONDS = float(os.getenv("OLLAMA_HEALTH_TIMEOUT_SECONDS", "3"))
+# 연속 실패(헬스 체크 + 연결 오류) 횟수가 이 값에 도달하면 풀에서 제외
+OLLAMA_EJECT_AFTER_FAILURES = int(os.getenv("OLLAMA_EJECT_AFTER_FAILURES", "3"))
+
+# 지연 시간 통계용 최근 표본 수
+_LATENCY_SAMPLES = 512
+
+
+def parse_hosts(spec: str, default_concurrency: int = OLLAMA_MAX_CONCURRENCY) -> List[Tuple[str, int]]:
+    """
+    "http://gpu-a:11434=4, http://gpu-b:11434" → [("http://gpu-a:11434", 4), ("http://gpu-b:11434", 2)]
+    """
+    hosts: List[Tuple[str, int]] = []
+    for item in (spec or "").split(","):
+        item = item.strip()
+        if not item:
+            continue
+        url, cap = item, default_concurrency
+        if "=" in item:
+            head, tail = item.rsplit("=", 1)
+            if tail.strip().isdigit():
+                url, cap = head.strip(), int(tail)
+        hosts.append((url.rstrip("/"), max(1, cap)))
+    return hosts
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(pct * (len(values) - 1))))]
+
+
+# 백엔드 교체 후 다시 시도해도 되는 오류 (요청이 모델에 도달하지 못함)
+_RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.RemoteProtocolError)
+
+
+class Backend:
+    """
+    Ollama 서버 1대: 클라이언트, 동시 호출 상한, 상태, 지연 시간 통계.
+    """
+
+    def __init__(self, host: str, max_concurrency: int, max_connections: int):
+        self.host = host
+        self.max_concurrency = max(1, int(max_concurrency))
+        self.max_connections = max(1, int(max_connections))
+        self._client: Optional[ollama.AsyncClient] = None
+
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.last_error: Optional[str] = None
+        self.last_checked: Optional[float] = None
+        self.ejections = 0
+
+        self.in_flight = 0
+        self.total_calls = 0
+        self.total_errors = 0
+        self._latency_ms: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+        self._first_token_ms: Deque[float] = deque(maxlen=_LATENCY_SAMPLES)
+
+    def get_client(self) -> ollama.AsyncClient:
+        # httpx.AsyncClient는 실행 중인 이벤트 루프 안에서 만들어야 하므로 지연 생성
+        if self._client is None:
+            self._client = ollama.AsyncClient(
+                host=self.host,
+                timeout=httpx.Timeout(
+                    OLLAMA_READ_TIMEOUT_SECONDS,
+                    connect=OLLAMA_CONNECT_TIMEOUT_SECONDS,
+                ),
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                ),
+            )
+        return self._client
+
+    @property
+    def has_capacity(self) -> bool:
+        return self.in_flight < self.max_concurrency
+
+    def record_success(self, latency_ms: float, first_token_ms: Optional[float] = None) -> None:
+        self.consecutive_failures = 0
+        self._latency_ms.append(latency_ms)
+        if first_token_ms is not None:
+            self._first_token_ms.append(first_token_ms)
+
+    def record_failure(self, error: BaseException) -> None:
+        self.total_errors += 1
+        self.consecutive_failures += 1
+        self.last_error = f"{type(error).__name__}: {str(error)[:200]}"
+        if self.healthy and self.consecutive_failures >= OLLAMA_EJECT_AFTER_FAILURES:
+            self.healthy = False
+            self.ejections += 1
+            print(f"[inference] ejected backend {self.host}: {self.last_error}")
+
+    def readmit(self) -> None:
+        self.consecutive_failures = 0
+        self.last_error = None
+        if not self.healthy:
+            self.healthy = True
+            print(f"[inference] readmitted backend {self.host}")
+
+    async def check_health(self) -> bool:
+        self.last_checked = time.time()
+        try:
+            await asyncio.wait_for(self.get_client().list(), timeout=OLLAMA_HEALTH_TIMEOUT_SECONDS)
+        except Exception as e:
+            if isinstance(e, asyncio.TimeoutError):
+                e = TimeoutError(f"health check timed out after {OLLAMA_HEALTH_TIMEOUT_SECONDS}s")
+            self.record_failure(e)
+            return False
+        self.readmit()
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        latency = list(self._latency_ms)
+        first_token = list(self._first_token_ms)
+        return {
+            "host": self.host,
+            "healthy": self.healthy,
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "total_calls": self.total_calls,
+            "total_errors": self.total_errors,
+            "consecutive_failures": self.consecutive_failures,
+            "ejections": self.ejections,
+            "last_error": self.last_error,
+            "latency_ms_p50": round(_percentile(latency, 0.5), 1),
+            "latency_ms_p95": round(_percentile(latency, 0.95), 1),
+            "first_token_ms_p50": round(_percentile(first_token, 0.5), 1),
+            "first_token_ms_p95": round(_percentile(first_token, 0.95), 1),
+        }
+
+    async def aclose(self) -> None:
+        if self._client is not None:
+            await self._client._client.aclose()
+            self._client = None
+
+
+class InferenceClient:
+    """
+    다중 백엔드 ollama.AsyncClient 라우터.
+    - stream_chat: 토큰(content) 단위 비동기 제너레이터
+    - chat: 스트리밍 없이 전체 응답
+    모든 호출은 백엔드별 동시성 제한을 거칩니다. 연결 단계에서 실패하면(응답을 받기 전) 다른 백엔드로 재시도합니다.
+    """
+
+    def __init__(
+        self,
+        hosts: Optional[List[Tuple[str, int]]] = None,
+        max_concurrency: int = OLLAMA_MAX_CONCURRENCY,
+        max_connections: int = OLLAMA_MAX_CONNECTIONS,
+        health_interval: float = OLLAMA_HEALTH_INTERVAL_SECONDS,
+    ):
+        if hosts is None:
+            hosts = parse_hosts(OLLAMA_HOSTS, max_concurrency) or [
+                ((os.getenv("OLLAMA_HOST") or DEFAULT_OLLAMA_HOST).rstrip("/"), max_concurrency)
+            ]
+        self.backends: List[Backend] = [Backend(host, cap, max_connections) for host, cap in hosts]
+        self.health_interval = health_interval
+        self._capacity: Optional[asyncio.Condition] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+        # 관측용 카운터
+        self.waiting = 0
+        self.total_calls = 0
+        self.total_retries = 0
+        self.total_wait_seconds = 0.0
+
+    @property
+    def max_concurrency(self) -> int:
+        return sum(b.max_concurrency for b in self.backends)
+
+    @property
+    def in_flight(self) -> int:
+        return sum(b.in_flight for b in self.backends)
+
+    def _condition(self) -> asyncio.Condition:
+        if self._capacity is None:
+            self._capacity = asyncio.Condition()
+        return self._capacity
+
+    def _pick(self, exclude: List[Backend]) -> Optional[Backend]:
+        candidates = [b for b in self.backends if b not in exclude]
+        healthy = [b for b in candidates if b.healthy]
+        # 모두 제외된 상태라면 전체 장애보다는 전부 시도하는 편이 나음
+        pool = healthy or candidates
+        free = [b for b in pool if b.has_capacity]
+        if not free:
+            return None
+        # 진행 중인 요청 비율이 가장 낮은 백엔드, 같으면 최근 지연 시간이 짧은 쪽
+        return min(free, key=lambda b: (b.in_flight / b.max_concurrency, _percentile(list(b._latency_ms)[-32:], 0.5)))
+
+    async def _acquire(self, exclude: List[Backend]) -> Backend:
+        queued_at = time.monotonic()
+        cond = self._condition()
+        self.waiting += 1
+        try:
+            async with cond:
+                while True:
+                    backend = self._pick(exclude)
+                    if backend is not None:
+                        break
+                    await cond.wait()
+                backend.in_flight += 1
+        finally:
+            self.waiting -= 1
+        self.total_wait_seconds += time.monotonic() - queued_at
+        backend.total_calls += 1
+        return backend
+
+    async def _release(self, backend: Backend) -> None:
+        backend.in_flight -= 1
+        cond = self._condition()
+        async with cond:
+            cond.notify_all()
+
+    def _can_retry(self, tried: List[Backend]) -> bool:
+        return any(b not in tried for b in self.backends)
+
+    async def stream_chat(
+        self,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None,
+        model: str = OCR_MODEL,
+        format: Union[str, Dict[str, Any]] = "",
+    ) -> AsyncIterator[str]:
+        """
+        모델 응답을 content 조각 단위로 yield 합니다.
+        format: "" | "json" | JSON 스키마(dict) — 스키마를 주면 Ollama가 스키마에 맞는 JSON만 생성합니다.
+        호출 측에서 중간에 끊으려면 contextlib.aclosing으로 감싸서 사용하세요
+        (제너레이터가 닫히면 HTTP 스트림도 닫혀 Ollama 쪽 생성이 취소됩니다).
+        """
+        self.total_calls += 1
+        tried: List[Backend] = []
+        while True:
+            backend = await self._acquire(tried)
+            tried.append(backend)
+            started = time.monotonic()
+            first_token_ms: Optional[float] = None
+            try:
+                stream = await backend.get_client().chat(
+                    model=model,
+                    messages=messages,
+                    stream=True,
+                    format=format,
+                    options=options or {},
+                )
+                try:
+                    async for chunk in stream:
+                        message = chunk.get("message") or {}
+                        content = message.get("content")
+                        if content:
+                            if first_token_ms is None:
+                                first_token_ms = (time.monotonic() - started) * 1000
+                            yield content
+                finally:
+                    await stream.aclose()
+                backend.record_success((time.monotonic() - started) * 1000, first_token_ms)
+                return
+            except GeneratorExit:
+                # 호출 측이 중간에 끊음 (조기 중단 등): 백엔드 오류가 아님
+                backend.record_success((time.monotonic() - started) * 1000, first_token_ms)
+                raise
+            except _RETRYABLE_ERRORS as e:
+                backend.record_failure(e)
+                # 이미 토큰을 내보냈다면 다른 백엔드로 이어 붙일 수 없음
+                if first_token_ms is not None or not self._can_retry(tried):
+                    raise
+                self.total_retries += 1
+            except Exception as e:
+                if not isinstance(e, ollama.ResponseError):
+                    backend.record_failure(e)
+                else:
+                    backend.total_errors += 1
+                raise
+            finally:
+                await self._release(backend)
+
+    async def chat(
+        self,
+        messages: List[Dict[str, Any]],
+        options: Optional[Dict[str, Any]] = None,
+        model: str = OCR_MODEL,
+        format: Union[str, Dict[str, Any]] = "",
+    ) -> Dict[str, Any]:
+        self.total_calls += 1
+        tried: List[Backend] = []
+        while True:
+            backend = await self._acquire(tried)
+            tried.append(backend)
+            started = time.monotonic()
+            try:
+                response = await backend.get_client().chat(
+                    model=model,
+                    messages=messages,
+                    stream=False,
+                    format=format,
+                    options=options or {},
+                )
+                backend.record_success((time.monotonic() - started) * 1000)
+                return response
+            except _RETRYABLE_ERRORS as e:
+                backend.record_failure(e)
+                if not self._can_retry(tried):
+                    raise
+                self.total_retries += 1
+            except Exception as e:
+                if not isinstance(e, ollama.ResponseError):
+                    backend.record_failure(e)
+                else:
+                    backend.total_errors += 1
+                raise
+            finally:
+                await self._release(backend)
+
+    async def check_health(self) -> None:
+        await asyncio.gather(*(b.check_health() for b in self.backends))
+        # 재투입된 백엔드가 있으면 대기 중인 요청을 깨움
+        cond = self._condition()
+        async with cond:
+            cond.notify_all()
+
+    async def _health_loop(self) -> None:
+        while True:
+            try:
+                await self.check_health()
+            except Exception as e:
+                print(f"[inference] health check loop error: {e}")
+            await asyncio.sleep(self.health_interval)
+
+    def start(self) -> None:
+        """
+        헬스 체크 루프 시작 (startup hook에서 호출).
+        """
+        if self._health_task is None and self.health_interval > 0:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    def stats(self) -> Dict[str, Any]:
+        total_errors = sum(b.total_errors for b in self.backends)
+        return {
+            "max_concurrency": self.max_concurrency,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "total_calls": self.total_calls,
+            "total_errors": total_errors,
+            "total_retries": self.total_retries,
+            "avg_wait_ms": round(self.total_wait_seconds * 1000 / self.total_calls, 2) if self.total_calls else 0.0,
+            "healthy_backends": sum(1 for b in self.backends if b.healthy),
+            "backends": [b.stats() for b in self.backends],
+        }
+
+    async def aclose(self) -> None:
+        if self._health_task is not None:
+            self._health_task.cancel()
+            try:
+                await self._health_task
+            except (asyncio.CancelledError, Exception):
+                pass
+            self._health_task = None
+        for backend in self.backends:
+            await backend.aclose()
+
+
+inference_client = InferenceClient()
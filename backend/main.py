@@ -1,22 +1,41 @@
 from fastapi import FastAPI, File, UploadFile, Depends, HTTPException, Form, Query, Body, Header
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import Response
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from sqlalchemy import insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List
-import ollama
+import asyncio
 import base64
-import re
-import io
+import hashlib
+import time
+import uuid
 import json
 import subprocess
 import tempfile
 import os
 from pathlib import Path
-from PIL import Image
-from database import init_db, get_db, OCRRecord, Prompt, ExtractKeys, UserAccount, Purchase, CreditLedger, SessionLocal, UserAuth
-from datetime import datetime, timedelta, timezone
+from contextlib import aclosing
+from inference import inference_client, OCR_MODEL
+from ocr_cache import ocr_cache, ocr_single_flight, make_cache_key, image_sha256
+from image_preprocess import preprocess_image, resolve_image_mode, OCR_IMAGE_MAX_PIXELS
+from crop_staging import crop_stage, is_valid_handle, OCR_STAGE_GC_INTERVAL_SECONDS
+from blob_store import blob_store, is_valid_sha256
+from image_variants import variant_cache, VARIANT_FORMATS, VARIANT_SIZES
+from recent_savings import RecentSavingsFeed, PUBLIC_SAVINGS_DAYS, PUBLIC_SAVINGS_MAX_LIMIT, PUBLIC_SAVINGS_TTL_SECONDS
+from save_sessions import OCR_SAVE_CHARGE_REASON, refresh_save_sessions, session_to_usage
+from credit_balance import claim_page_charges, debit_credits, ensure_account, get_balance, grant_credits
+from history_search import build_match_query, search_records, SEARCH_SORTS
+from history_groups import aggregate_groups, apply_text_stats, estimate_savings, group_key, group_to_response, refresh_history_groups, text_stats
+from ocr_jobs import OCRJobQueue, JobError, JOB_STATUSES, finish_job
+from ocr_postprocess import postprocess_ocr_text, JsonObjectScanner, OCR_JSON_EARLY_STOP_ENABLED
+from structured_extraction import normalize_keys, build_schema, build_prompt, validate_extraction, format_extraction
+from ocr_guards import RepetitionDetector, EarlyStop, OCR_EARLY_STOP_ENABLED, early_stop_stats, record_early_stop
+from database import init_db, get_db, get_async_db, run_write_transaction, async_engine, OCRRecord, HistoryGroup, SaveSession, Prompt, ExtractKeys, UserAccount, Purchase, CreditLedger, SessionLocal, UserAuth
+from datetime import date, datetime, timedelta, timezone
 from pydantic import BaseModel
-from typing import Optional
+from typing import Callable, Dict, Optional, Tuple
 from jose import jwt, JWTError
 from passlib.context import CryptContext
 
@@ -33,6 +52,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # 페이지네이션 커서 (GET /billing/usage?mode=file)
+    expose_headers=["X-Next-Cursor"],
 )
 
 # 데이터베이스 초기화
@@ -266,290 +287,348 @@ def _startup_seed_user():
             pass
 
 
-def clean_ocr_response(text: str) -> str:
+@app.on_event("startup")
+async def _startup_inference_client():
+    # 백엔드 헬스 체크 루프 시작 (OLLAMA_HOSTS)
+    inference_client.start()
+
+
+_crop_gc_task: Optional[asyncio.Task] = None
+
+
+async def _collect_staged_crops_loop():
+    while True:
+        try:
+            removed = await run_in_threadpool(crop_stage.collect)
+            if removed:
+                print(f"[staging] removed {removed} unsaved crop(s)")
+        except Exception as e:
+            print(f"[staging] collect failed: {e}")
+        await asyncio.sleep(OCR_STAGE_GC_INTERVAL_SECONDS)
+
+
+@app.on_event("startup")
+async def _startup_crop_gc():
+    # 저장되지 않은 채 TTL이 지난 크롭 정리
+    global _crop_gc_task
+    if _crop_gc_task is None:
+        _crop_gc_task = asyncio.create_task(_collect_staged_crops_loop())
+
+
+@app.on_event("shutdown")
+async def _shutdown_crop_gc():
+    global _crop_gc_task
+    if _crop_gc_task is not None:
+        _crop_gc_task.cancel()
+        _crop_gc_task = None
+
+
+@app.on_event("shutdown")
+async def _shutdown_inference_client():
+    # 공유 커넥션 풀 정리
+    await inference_client.aclose()
+
+
+@app.on_event("shutdown")
+async def _shutdown_async_db():
+    # 풀에 남은 aiosqlite 연결(과 연결마다 있는 스레드)을 정리
+    await async_engine.dispose()
+
+
+# 기본 프롬프트 설정
+OCR_SYSTEM_PROMPT = "You are a precise OCR engine. Extract ONLY the text that is ACTUALLY VISIBLE in the image. Do NOT generate patterns, sequences, or repeated numbers. Do NOT extrapolate or guess what might be there. Extract EXACTLY what you see, character by character, from left to right, top to bottom. Each character, word, and line should appear only once. Do NOT repeat any text. Do NOT create number sequences. Do NOT duplicate content. Read the image carefully and output only the actual visible text, including Korean (한글), English, numbers, and symbols. Stop when you reach the end of visible text."
+
+OCR_USER_PROMPT = "Extract ONLY the text that is ACTUALLY VISIBLE in this cropped image. Read from left to right, top to bottom, line by line. Extract each line exactly once. Do NOT generate patterns. Do NOT create number sequences like '10, 11, 12...'. Do NOT repeat any text. Do NOT extrapolate beyond what is visible. Output only the actual text you can see in the image:"
+
+OCR_OPTIONS = {
+    "num_predict": 16384,  # 토큰 수 대폭 증가 (최대한)
+    "temperature": 0.0,    # 완전히 결정론적으로 (0.0 = 완전히 결정론적)
+    "top_p": 0.9,          # 핵 샘플링 (더 정확한 추출)
+    "top_k": 40,           # 상위 k개 토큰만 고려
+    "stop": [],            # 중간에 멈추지 않도록
+    "num_ctx": 32768,      # 컨텍스트 윈도우 최대 증가
+    "repeat_penalty": 1.2,  # 반복 패널티 (반복 방지)
+}
+
+# 여러 번 시도하여 완전한 응답을 받도록 함
+OCR_MAX_ATTEMPTS = 3
+
+
+async def generate_ocr_text(
+    image_base64: str,
+    user_prompt: str,
+    on_event: Optional[Callable[[str, dict], None]] = None,
+    stop_on_json: bool = False,
+    schema: Optional[dict] = None,
+) -> Tuple[str, Optional[dict]]:
     """
-    OCR 응답에서 불필요한 설명이나 따옴표를 제거하고, 중복 라인을 제거합니다.
+    Ollama 스트리밍 응답을 비동기로 수집하여 (원문(raw) 텍스트, 조기 중단 정보)를 반환합니다.
+    응답이 짧거나 잘린 것으로 보이면 최대 OCR_MAX_ATTEMPTS번까지 재시도합니다.
+    생성 도중 반복/숫자 나열 같은 퇴행이 감지되면 즉시 생성을 취소하고 앞부분만 사용합니다.
+    stop_on_json이면(고급 모드) 최상위 JSON 객체가 닫히고 검증되는 즉시 생성을 취소합니다 (뒤따르는 설명문 생략).
+    schema가 주어지면 Ollama format으로 넘겨 스키마에 맞는 JSON만 생성하게 하고, 재시도하지 않습니다.
+    on_event가 주어지면 진행 상황을 ("attempt" | "delta" | "early_stop", payload)로 전달합니다.
     """
-    # "The image contains the text "..." 형식 제거
-    text = re.sub(r'^The image contains the text\s*["\']', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'^The text in the image is\s*["\']', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'^The image shows the text\s*["\']', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'^Here is the text from the image\s*[:]?\s*["\']', '', text, flags=re.IGNORECASE)
-    text = re.sub(r'^Extracted text\s*[:]?\s*["\']', '', text, flags=re.IGNORECASE)
-    
-    # 끝에 있는 따옴표 제거
-    text = re.sub(r'["\']\s*$', '', text)
-    
-    # "..." 형식에서 실제 텍스트만 추출
-    quoted_match = re.search(r'["\']([^"\']+)["\']', text)
-    if quoted_match:
-        text = quoted_match.group(1)
-    
-    # 잘림 표시 제거 (..., … 등)
-    text = re.sub(r'\.\.\.\s*$', '', text)
-    text = re.sub(r'…\s*$', '', text)
-    text = re.sub(r'\.\.\s*$', '', text)
-    text = re.sub(r'\s*by\s+c\.\.\.\s*$', '', text, flags=re.IGNORECASE)  # "by c..." 형식 제거
-    
-    # 같은 라인 내에서 문구 반복 제거
-    # 예: "광고 프로젝트의 진행 및 광고 프로젝트의 진행 및 ..." -> "광고 프로젝트의 진행 및"
-    def remove_repeated_phrases(text_line: str) -> str:
-        """
-        같은 라인 내에서 반복되는 문구를 제거합니다.
-        """
-        if not text_line or len(text_line.strip()) < 10:
-            return text_line
-        
-        # 방법 1: 정규표현식으로 같은 문구가 3번 이상 반복되는 패턴 찾기
-        # 최소 5자 이상의 문구가 공백으로 구분되어 반복되는 경우
-        # 예: "광고 프로젝트의 진행 및 광고 프로젝트의 진행 및 ..."
-        pattern = r'(.{5,}?)(?:\s+\1){2,}'
-        
-        def replace_repeat(match):
-            # 반복된 문구를 한 번만 반환
-            return match.group(1)
-        
-        result = re.sub(pattern, replace_repeat, text_line)
-        
-        # 방법 2: 단어 그룹 반복 확인 (더 정확한 감지)
-        # 2-8개 단어로 구성된 그룹이 3번 이상 반복되는 경우
-        words = result.split()
-        if len(words) > 15:  # 충분히 긴 경우만 검사
-            # 역순으로 검사하여 가장 긴 반복 패턴부터 찾기
-            max_group_size = min(8, len(words) // 3)
-            
-            for group_size in range(max_group_size, 1, -1):  # 큰 그룹부터 작은 그룹까지
-                i = 0
-                while i <= len(words) - group_size * 3:
-                    group = words[i:i + group_size]
-                    
-                    # 이 그룹이 연속으로 몇 번 반복되는지 확인
-                    repeat_count = 1
-                    pos = i + group_size
-                    
-                    while pos + group_size <= len(words):
-                        next_group = words[pos:pos + group_size]
-                        if next_group == group:
-                            repeat_count += 1
-                            pos += group_size
-                        else:
-                            break
-                    
-                    # 3번 이상 반복되면 첫 번째만 유지하고 나머지 제거
-                    if repeat_count >= 3:
-                        # 반복된 부분 제거
-                        new_words = words[:i + group_size]
-                        new_words.extend(words[i + group_size * repeat_count:])
-                        words = new_words
-                        # 다시 처음부터 검사
-                        i = 0
-                        continue
-                    
-                    i += 1
-                
-                # 반복 패턴을 찾았으면 더 작은 그룹은 검사하지 않음
-                if len(words) < len(result.split()):
+    raw_text = ""
+    early_stop = None
+    messages = [
+        {
+            "role": "system",
+            "content": OCR_SYSTEM_PROMPT
+        },
+        {
+            "role": "user",
+            "content": user_prompt,
+            "images": [image_base64]
+        }
+    ]
+
+    for attempt in range(OCR_MAX_ATTEMPTS):
+        detector = RepetitionDetector()
+        json_scanner = JsonObjectScanner() if stop_on_json and OCR_JSON_EARLY_STOP_ENABLED else None
+        if on_event:
+            on_event("attempt", {"attempt": attempt + 1})
+        # 스트리밍 응답 수집 (이벤트 루프를 막지 않음)
+        # 퇴행 감지 / JSON 객체 완성 시 break → 스트림이 닫히면서 Ollama 쪽 생성도 취소됨
+        async with aclosing(inference_client.stream_chat(messages, options=OCR_OPTIONS, format=schema or "")) as stream:
+            async for content in stream:
+                if detector.feed(content) and OCR_EARLY_STOP_ENABLED:
                     break
-            
-            result = ' '.join(words)
-        
-        return result
-    
-    # 비정상적으로 긴 숫자 시퀀스 제거 (같은 라인 내에서 숫자가 10개 이상 반복되는 경우)
-    # 예: "10, 11, 12, 13, ... 365," -> 제거
-    lines = text.split('\n')
-    cleaned_lines = []
-    
-    for line in lines:
-        # 문구 반복 제거 먼저 수행
-        line = remove_repeated_phrases(line)
-        # 숫자 시퀀스 패턴 찾기 (예: "10, 11, 12, 13" 또는 "10,11,12,13")
-        # 숫자가 10개 이상 연속으로 나오는 경우를 감지
-        # 더 강력한 패턴: 숫자, 콤마, 공백이 반복되는 패턴
-        number_sequence_pattern = r'(\d+\s*[,，]\s*){10,}'
-        
-        # 숫자 시퀀스가 있는지 확인
-        match = re.search(number_sequence_pattern, line)
-        if match:
-            start_pos = match.start()
-            
-            # 숫자 시퀀스 시작 전의 텍스트 확인
-            before_text = line[:start_pos]
-            
-            # 숫자 시퀀스가 시작된 이후의 모든 숫자 시퀀스 길이 확인
-            # 숫자 시퀀스 부분 추출
-            sequence_part = line[start_pos:]
-            # 숫자 개수 세기
-            numbers_in_sequence = re.findall(r'\d+', sequence_part)
-            
-            # 숫자가 10개 이상이면 제거
-            if len(numbers_in_sequence) >= 10:
-                # 괄호가 열려있는지 확인
-                open_paren_count = before_text.count('(') - before_text.count(')')
-                
-                if open_paren_count > 0:
-                    # 괄호 안의 숫자 시퀀스인 경우
-                    # 괄호 시작 부분을 찾아서 숫자 시퀀스 전까지 유지
-                    last_open_paren = before_text.rfind('(')
-                    if last_open_paren >= 0:
-                        # 괄호 시작부터 숫자 시퀀스 전까지의 텍스트 유지
-                        # 예: "소재지 대전 유성구 (카인 : 10, 11, ..." -> "소재지 대전 유성구 (카인 :"
-                        line = line[:start_pos].rstrip()
-                        # 끝에 불필요한 구두점 제거 (콜론은 유지)
-                        line = re.sub(r'[,\s]+$', '', line)
-                        # 닫는 괄호가 없으면 추가하지 않음 (원본 텍스트 유지)
-                    else:
-                        # 괄호가 없거나 찾을 수 없는 경우, 숫자 시퀀스 시작 전까지 유지
-                        line = line[:start_pos].rstrip()
-                        line = re.sub(r'[,\s:：]+$', '', line)
-                else:
-                    # 괄호 밖의 숫자 시퀀스인 경우
-                    # 숫자 시퀀스 시작 전까지의 텍스트만 유지
-                    line = line[:start_pos].rstrip()
-                    # 끝에 불필요한 구두점 제거
-                    line = re.sub(r'[,\s:：]+$', '', line)
-        
-        # 추가 검사: 라인 전체가 숫자 시퀀스로만 구성되어 있는 경우 제거
-        if line.strip():
-            # 라인이 숫자와 콤마, 공백만으로 구성되어 있고 길이가 매우 긴 경우
-            if re.match(r'^[\s\d,，]+$', line) and len(line) > 50:
-                # 숫자가 10개 이상인지 확인
-                numbers = re.findall(r'\d+', line)
-                if len(numbers) >= 10:
-                    # 이 라인은 완전히 제거
-                    continue
-        
-        cleaned_lines.append(line)
-    
-    text = '\n'.join(cleaned_lines)
-    
-    # 중복 라인 제거 (연속된 동일한 라인 제거)
-    lines = text.split('\n')
-    cleaned_lines = []
-    prev_line = None
-    
-    for line in lines:
-        line_stripped = line.strip()
-        # 빈 라인은 유지하되, 연속된 빈 라인은 하나만 유지
-        if not line_stripped:
-            if cleaned_lines and cleaned_lines[-1].strip():
-                cleaned_lines.append('')
-            continue
-        
-        # 이전 라인과 동일하지 않으면 추가
-        if line_stripped != prev_line:
-            cleaned_lines.append(line)
-            prev_line = line_stripped
-    
-    text = '\n'.join(cleaned_lines)
-    
-    # 여러 줄 패턴의 반복 제거
-    # 예: "A\nB\nA\nB\nA\nB" -> "A\nB"
-    lines = text.split('\n')
-    if len(lines) > 4:  # 최소 4줄 이상일 때만 패턴 검사
-        # 패턴 길이를 2부터 전체의 절반까지 시도
-        max_pattern_length = min(len(lines) // 2, 10)  # 최대 10줄 패턴까지 검사
-        
-        for pattern_len in range(2, max_pattern_length + 1):
-            # 패턴이 반복되는지 확인
-            pattern = lines[:pattern_len]
-            # 빈 줄을 제외한 패턴 텍스트 생성
-            pattern_text = '\n'.join([l.strip() for l in pattern if l.strip()])
-            
-            if not pattern_text:  # 빈 패턴은 건너뛰기
-                continue
-            
-            # 패턴이 3번 이상 반복되는지 확인
-            repeat_count = 1
-            pos = pattern_len
-            
-            while pos + pattern_len <= len(lines):
-                current_pattern = lines[pos:pos + pattern_len]
-                # 빈 줄을 제외한 현재 패턴 텍스트 생성
-                current_pattern_text = '\n'.join([l.strip() for l in current_pattern if l.strip()])
-                
-                if current_pattern_text == pattern_text:
-                    repeat_count += 1
-                    pos += pattern_len
-                else:
+                if on_event:
+                    on_event("delta", {"text": content})
+                if json_scanner is not None and json_scanner.feed(content):
                     break
-            
-            # 패턴이 3번 이상 반복되면 첫 번째 패턴만 유지
-            if repeat_count >= 3:
-                # 반복된 패턴 제거
-                remaining_lines = lines[repeat_count * pattern_len:]
-                text = '\n'.join(pattern + remaining_lines)
-                break  # 첫 번째로 발견된 패턴만 제거
+
+        if json_scanner is not None and json_scanner.value is not None:
+            # 객체 뒤의 설명문은 버림 (앞부분의 ```json 등은 extract_json_from_text가 처리)
+            raw_text = json_scanner.text[: json_scanner.end].strip()
+            record_early_stop(EarlyStop("json_complete", json_scanner.end, ""), 0)
+            early_stop = {
+                "detector": "json_complete",
+                "detail": f"top-level JSON object closed at char {json_scanner.end}",
+                "attempt": attempt + 1,
+                "tokens_generated": detector.chunks,
+                "tokens_saved_estimate": None,
+            }
+            print(f"JSON complete after {detector.chunks} tokens, generation cancelled")
+            if on_event:
+                on_event("early_stop", early_stop)
+            break
+
+        current_text = (detector.finish() if OCR_EARLY_STOP_ENABLED else detector.text).strip()
+
+        # 응답이 이전보다 길면 업데이트
+        if len(current_text) > len(raw_text):
+            raw_text = current_text
+            print(f"Attempt {attempt + 1}: Extracted {len(raw_text)} characters")
+
+        if detector.result is not None and OCR_EARLY_STOP_ENABLED:
+            tokens_saved = OCR_OPTIONS["num_predict"] - detector.chunks
+            record_early_stop(detector.result, tokens_saved)
+            early_stop = {
+                "detector": detector.result.detector,
+                "detail": detector.result.detail,
+                "attempt": attempt + 1,
+                "tokens_generated": detector.chunks,
+                "tokens_saved_estimate": tokens_saved,
+            }
+            print(f"Early stop ({detector.result.detector}) after {detector.chunks} tokens: {detector.result.detail}")
+            if on_event:
+                on_event("early_stop", early_stop)
+            # temperature=0에서 재시도해도 같은 퇴행이 반복되므로 더 시도하지 않음
+            break
+
+        # 스키마 제약 출력은 길이와 무관하게 완결된 응답
+        if schema is not None:
+            break
+
+        # 응답이 충분히 길면 중단 (최소 100자 이상)
+        if len(raw_text) > 100 and not raw_text.endswith(('...', '…', '.')):
+            break
+
+    print(f"Final extracted text length: {len(raw_text)} characters")
+    return raw_text, early_stop
+
+
+def ocr_cache_key(
+    image_bytes: bytes,
+    user_prompt: str,
+    custom_prompt: Optional[str],
+    image_mode: str,
+    schema: Optional[dict] = None,
+) -> str:
+    """
+    OCR 결과 캐시 키: 이미지 해시 + 실제 사용된 프롬프트 + 모델 + 생성 옵션 (+ 전처리/후처리 설정, 출력 스키마)
+    """
+    extra = {}
+    if schema is not None:
+        extra["schema"] = schema
+        postprocess = "schema"
+    else:
+        postprocess = "json" if custom_prompt and custom_prompt.strip() else "clean"
+    return make_cache_key(
+        image_sha256(image_bytes),
+        OCR_SYSTEM_PROMPT,
+        user_prompt,
+        OCR_MODEL,
+        OCR_OPTIONS,
+        postprocess=postprocess,
+        preprocess={"max_pixels": OCR_IMAGE_MAX_PIXELS, "image_mode": image_mode},
+        **extra,
+    )
+
+
+async def _generate_ocr_result(
+    file_bytes: bytes,
+    user_prompt: str,
+    custom_prompt: Optional[str],
+    image_mode: str,
+    cache_key: str,
+    on_event: Optional[Callable[[str, dict], None]] = None,
+    extract_keys: Optional[List[str]] = None,
+) -> Tuple[str, Optional[dict], dict, str]:
+    """
+    캐시 미스 경로: 전처리 → 모델 호출 → 후처리 → 캐시 저장.
+    (extracted_text, early_stop, preprocess, 원본 크롭 base64)를 반환합니다.
+    extract_keys가 주어지면 키 목록 스키마로 제약된 JSON을 생성하고 키 순서대로 정리합니다.
+    """
+    # 이미지 검증 + 전처리 (1회 디코딩: 방향/모드 정규화, 픽셀 예산 축소, 1회 인코딩)
+    try:
+        prepared = await run_in_threadpool(preprocess_image, file_bytes, OCR_IMAGE_MAX_PIXELS, image_mode)
+    except ValueError as img_error:
+        print(f"Image validation error: {img_error}")
+        # 이미지 검증 실패 시 더 명확한 오류 메시지 제공
+        raise HTTPException(status_code=400, detail=f"Invalid image file: {str(img_error)}")
+    preprocess = prepared.report
+    before, after = preprocess["original"], preprocess["processed"]
+    print(
+        f"Received image: {before['width']}x{before['height']} pixels, format: {before['format']}"
+        f" -> model input {after['width']}x{after['height']} ({after['bytes']} bytes)"
+    )
+    if on_event:
+        on_event("preprocess", preprocess)
+
+    # Ollama를 사용하여 OCR 수행 (비동기 클라이언트 + 동시성 제한)
+    schema = build_schema(extract_keys) if extract_keys else None
+    raw_text, early_stop = await generate_ocr_text(
+        prepared.base64, user_prompt, on_event,
+        stop_on_json=schema is not None or bool(custom_prompt and custom_prompt.strip()),
+        schema=schema,
+    )
+    data = validate_extraction(raw_text, extract_keys)[0] if extract_keys else None
+    if data is not None:
+        extracted_text = format_extraction(data)
+    else:
+        # 스키마를 지원하지 않는 서버 등으로 JSON 객체가 아니면 기존 고급 모드 후처리
+        extracted_text = postprocess_ocr_text(raw_text, user_prompt if extract_keys else custom_prompt)
+    if extracted_text:
+        await run_in_threadpool(ocr_cache.put, cache_key, extracted_text)
+    # 응답/저장용 크롭 이미지는 원본 그대로 (전처리 중 이미 인코딩해 둔 값 재사용)
+    return extracted_text, early_stop, preprocess, prepared.original_base64
+
+
+async def run_ocr(
+    file_bytes: bytes,
+    filename: Optional[str],
+    page_number: Optional[int],
+    custom_prompt: Optional[str],
+    use_cache: bool = True,
+    image_mode: Optional[str] = None,
+    on_event: Optional[Callable[[str, dict], None]] = None,
+    stage_crop: bool = False,
+    return_image: bool = True,
+    extract_keys_id: Optional[int] = None,
+) -> dict:
+    """
+    크롭 이미지 1건에 대한 OCR 전체 과정(캐시 조회 → 전처리 → 모델 호출 → 후처리).
+    /ocr, /ocr/batch, /ocr/stream이 공통으로 사용합니다.
+    extract_keys_id가 주어지면 저장된 추출 항목(ExtractKeys)의 스키마로 제약된 JSON을 생성하고(custom_prompt 무시),
+    응답의 extraction에 검증 결과(누락된 키 등)를 담습니다.
+    on_event는 generate_ocr_text의 진행 이벤트에 더해 전처리 직후 "preprocess"를 받습니다.
+    stage_crop이면 크롭 원본을 서버에 보관하고 crop_handle을 돌려줍니다(/history/save에서 이미지 대신 사용).
+    return_image=false이면 응답에서 cropped_image(base64)를 생략합니다.
+    """
+    # 파일이 비어있지 않은지 확인
+    if len(file_bytes) == 0:
+        raise HTTPException(status_code=400, detail="Empty file received")
+    try:
+        image_mode = resolve_image_mode(image_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # 패턴 제거 후 다시 한 번 연속된 동일한 라인 제거 (남은 중복 제거)
-    lines = text.split('\n')
-    final_lines = []
-    prev_line = None
+    extract_keys = None
+    extraction = None
+    if extract_keys_id is not None:
+        extraction = await run_in_threadpool(_load_extract_keys, extract_keys_id)
+        extract_keys = extraction["keys"]
+        user_prompt = build_prompt(extract_keys)
+    # 사용자 지정 프롬프트가 있으면 사용, 없으면 기본값 사용
+    elif custom_prompt and custom_prompt.strip():
+        user_prompt = custom_prompt.strip()
+    else:
+        user_prompt = OCR_USER_PROMPT
     
-    for line in lines:
-        line_stripped = line.strip()
-        if not line_stripped:
-            if final_lines and final_lines[-1].strip():
-                final_lines.append('')
-            continue
-        
-        if line_stripped != prev_line:
-            final_lines.append(line)
-            prev_line = line_stripped
+    # 동일 이미지 + 프롬프트 + 옵션 결과가 캐시에 있으면 디코딩/모델 호출 모두 생략
+    cache_key = ocr_cache_key(
+        file_bytes, user_prompt, custom_prompt, image_mode,
+        schema=build_schema(extract_keys) if extract_keys else None,
+    )
+    extracted_text = await run_in_threadpool(ocr_cache.get, cache_key) if use_cache else None
+    cached = extracted_text is not None
+    early_stop = None
+    preprocess = None
+    coalesced = False
+    
+    if cached:
+        cropped_image_base64 = base64.b64encode(file_bytes).decode('utf-8')
+    else:
+        # 같은 키로 진행 중인 생성이 있으면 합류 (스트리밍 요청은 진행 이벤트가 필요하므로 새로 생성)
+        (extracted_text, early_stop, preprocess, cropped_image_base64), coalesced = await ocr_single_flight.do(
+            cache_key,
+            lambda: _generate_ocr_result(
+                file_bytes, user_prompt, custom_prompt, image_mode, cache_key, on_event, extract_keys,
+            ),
+            join=on_event is None,
+        )
     
-    text = '\n'.join(final_lines)
+    if extraction is not None:
+        # 캐시 적중/합류 결과도 같은 기준으로 검증 (정리된 결과만 캐시되므로 다시 계산)
+        extraction.update(validate_extraction(extracted_text, extract_keys)[1])
     
-    # 앞뒤 공백 제거
-    text = text.strip()
+    crop_handle = await run_in_threadpool(crop_stage.put, file_bytes) if stage_crop else None
     
-    return text
+    # OCR 결과만 반환 (자동 저장하지 않음)
+    # '저장' 버튼을 눌렀을 때만 /history/save 엔드포인트를 통해 저장됨
+    return {
+        "extracted_text": extracted_text,
+        "cropped_image": cropped_image_base64 if return_image else None,
+        "crop_handle": crop_handle,
+        "filename": filename,
+        "page_number": page_number,
+        "cached": cached,
+        "coalesced": coalesced,
+        "early_stop": early_stop,
+        "preprocess": preprocess,
+        "extraction": extraction,
+    }
 
 
-def extract_json_from_text(text: str) -> str:
+def _load_extract_keys(keys_id: int) -> dict:
     """
-    텍스트에서 JSON 블록을 추출하고 포맷팅합니다.
-    JSON을 찾지 못하면 원본 텍스트를 반환합니다.
+    구조화 추출에 사용할 추출 항목(ExtractKeys)을 읽습니다. 없으면 404, 키가 유효하지 않으면 400.
     """
-    # 1. JSON 코드 블록 찾기 (```json ... ``` 또는 ``` ... ```)
-    json_block_pattern = r'```(?:json)?\s*(\{.*?\})\s*```'
-    match = re.search(json_block_pattern, text, re.DOTALL)
-    if match:
-        json_str = match.group(1).strip()
-    else:
-        # 2. ``` 없이 첫 번째 { 부터 마지막 } 까지 찾기 (더 견고한 방법)
-        start_idx = text.find('{')
-        if start_idx == -1:
-            # JSON 객체 시작 기호가 없음
-            return text
-        
-        # { 부터 시작해서 중괄호 매칭하여 JSON 객체 찾기
-        brace_count = 0
-        end_idx = start_idx
-        for i in range(start_idx, len(text)):
-            if text[i] == '{':
-                brace_count += 1
-            elif text[i] == '}':
-                brace_count -= 1
-                if brace_count == 0:
-                    end_idx = i + 1
-                    break
-        
-        if brace_count != 0:
-            # 중괄호가 매칭되지 않음
-            return text
-        
-        json_str = text[start_idx:end_idx].strip()
-    
+    db = SessionLocal()
     try:
-        # JSON 파싱 시도
-        json_obj = json.loads(json_str)
-        # JSON을 포맷팅된 문자열로 변환 (들여쓰기 포함)
-        formatted_json = json.dumps(json_obj, ensure_ascii=False, indent=2)
-        return formatted_json
-    except json.JSONDecodeError as e:
-        # JSON 파싱 실패 - 원본 텍스트 반환
-        print(f"JSON parsing failed: {e}")
-        return text
+        row = db.query(ExtractKeys).filter(ExtractKeys.id == keys_id).first()
+        if not row:
+            raise HTTPException(status_code=404, detail="ExtractKeys not found")
+        try:
+            keys = normalize_keys(json.loads(row.keys))
+        except (ValueError, TypeError) as e:
+            raise HTTPException(status_code=400, detail=f"Invalid ExtractKeys {keys_id}: {e}")
+        return {"extract_keys_id": row.id, "name": row.name, "keys": keys}
+    finally:
+        db.close()
 
 
 @app.post("/ocr")
@@ -558,10 +637,18 @@ async def ocr_image(
     filename: str = Form(None),
     page_number: int = Form(None),
     custom_prompt: str = Form(None),
-    db: Session = Depends(get_db)
+    use_cache: bool = Form(True),
+    image_mode: str = Form(None),
+    return_image: bool = Form(True),
+    extract_keys_id: int = Form(None),
 ):
     """
     크롭된 이미지 파일을 받아서 OCR을 수행합니다.
+    use_cache=false이면 캐시 조회를 건너뛰고 새로 생성합니다(결과는 캐시에 갱신).
+    image_mode: color | grayscale | binarize (기본값: OCR_IMAGE_MODE)
+    응답의 crop_handle을 /history/save에 넘기면 이미지를 다시 올릴 필요가 없습니다.
+    return_image=false이면 cropped_image(base64)를 응답에서 생략합니다.
+    extract_keys_id: 구조화 추출 모드. 저장된 키 목록의 JSON 스키마로 제약된 결과와 extraction(누락된 키 등)을 반환합니다.
     """
     try:
         # 파일 읽기
@@ -573,295 +660,387 @@ async def ocr_image(
             filename = file.filename
         # 페이지 번호가 없으면 None 유지
         
-        # 이미지 검증 및 디버깅
-        try:
-            # 파일이 비어있지 않은지 확인
-            if len(file_bytes) == 0:
-                raise HTTPException(status_code=400, detail="Empty file received")
-            
-            img = Image.open(io.BytesIO(file_bytes))
-            # 이미지가 제대로 로드되었는지 확인
-            img.verify()
-            img = Image.open(io.BytesIO(file_bytes))  # verify 후 다시 열기
-            print(f"Received image: {img.size[0]}x{img.size[1]} pixels, format: {img.format}")
-        except Exception as img_error:
-            print(f"Image validation error: {img_error}")
-            # 이미지 검증 실패 시 더 명확한 오류 메시지 제공
-            raise HTTPException(status_code=400, detail=f"Invalid image file: {str(img_error)}")
-        
-        # 이미지를 base64로 인코딩
-        image_base64 = base64.b64encode(file_bytes).decode('utf-8')
-        
-        # Ollama를 사용하여 OCR 수행
-        # 여러 번 시도하여 완전한 응답을 받도록 함
-        max_attempts = 3
-        raw_text = ""
-        
-        # 기본 프롬프트 설정
-        default_system_prompt = "You are a precise OCR engine. Extract ONLY the text that is ACTUALLY VISIBLE in the image. Do NOT generate patterns, sequences, or repeated numbers. Do NOT extrapolate or guess what might be there. Extract EXACTLY what you see, character by character, from left to right, top to bottom. Each character, word, and line should appear only once. Do NOT repeat any text. Do NOT create number sequences. Do NOT duplicate content. Read the image carefully and output only the actual visible text, including Korean (한글), English, numbers, and symbols. Stop when you reach the end of visible text."
-        
-        default_user_prompt = "Extract ONLY the text that is ACTUALLY VISIBLE in this cropped image. Read from left to right, top to bottom, line by line. Extract each line exactly once. Do NOT generate patterns. Do NOT create number sequences like '10, 11, 12...'. Do NOT repeat any text. Do NOT extrapolate beyond what is visible. Output only the actual text you can see in the image:"
-        
-        # 사용자 지정 프롬프트가 있으면 사용, 없으면 기본값 사용
-        user_prompt = custom_prompt.strip() if custom_prompt and custom_prompt.strip() else default_user_prompt
-        
-        for attempt in range(max_attempts):
-            full_response = ""
-            stream = ollama.chat(
-                model="qwen2.5vl:7b",
-                messages=[
-                    {
-                        "role": "system",
-                        "content": default_system_prompt
-                    },
-                    {
-                        "role": "user",
-                        "content": user_prompt,
-                        "images": [image_base64]
-                    }
-                ],
-                stream=True,
-                options={
-                    "num_predict": 16384,  # 토큰 수 대폭 증가 (최대한)
-                    "temperature": 0.0,    # 완전히 결정론적으로 (0.0 = 완전히 결정론적)
-                    "top_p": 0.9,          # 핵 샘플링 (더 정확한 추출)
-                    "top_k": 40,           # 상위 k개 토큰만 고려
-                    "stop": [],            # 중간에 멈추지 않도록
-                    "num_ctx": 32768,      # 컨텍스트 윈도우 최대 증가
-                    "repeat_penalty": 1.2,  # 반복 패널티 (반복 방지)
-                }
-            )
-            
-            # 스트리밍 응답 수집
-            for chunk in stream:
-                if chunk.get("message") and chunk["message"].get("content"):
-                    full_response += chunk["message"]["content"]
-            
-            current_text = full_response.strip()
-            
-            # 응답이 이전보다 길면 업데이트
-            if len(current_text) > len(raw_text):
-                raw_text = current_text
-                print(f"Attempt {attempt + 1}: Extracted {len(raw_text)} characters")
-            
-            # 응답이 충분히 길면 중단 (최소 100자 이상)
-            if len(raw_text) > 100 and not raw_text.endswith(('...', '…', '.')):
-                break
-        
-        print(f"Final extracted text length: {len(raw_text)} characters")
-        
-        # "..." 같은 잘림 표시 제거 (더 강력한 패턴 매칭)
-        raw_text = re.sub(r'\s*by\s+c\.\.\.\s*$', '', raw_text, flags=re.IGNORECASE)
-        raw_text = re.sub(r'\.\.\.\s*$', '', raw_text)
-        raw_text = re.sub(r'…\s*$', '', raw_text)
-        raw_text = raw_text.rstrip('…').rstrip('...').rstrip('..').rstrip('.')
-        
-        # JSON 형식인지 확인하고 포맷팅
-        # 사용자 지정 프롬프트가 있으면 JSON 추출 시도
-        if custom_prompt and custom_prompt.strip():
-            # JSON 추출 시도
-            json_formatted = extract_json_from_text(raw_text)
-            if json_formatted != raw_text:
-                # JSON이 성공적으로 추출됨
-                extracted_text = json_formatted
-            else:
-                # JSON이 아니면 기본 정리 로직 사용
-                extracted_text = clean_ocr_response(raw_text)
-        else:
-            # 기본 프롬프트 사용 시 기본 정리 로직
-            extracted_text = clean_ocr_response(raw_text)
-        
-        # 크롭된 이미지를 base64로 인코딩하여 저장
-        cropped_image_base64 = base64.b64encode(file_bytes).decode('utf-8')
-        
-        # OCR 결과만 반환 (자동 저장하지 않음)
-        # '저장' 버튼을 눌렀을 때만 /history/save 엔드포인트를 통해 저장됨
-        return {
-            "extracted_text": extracted_text,
-            "cropped_image": cropped_image_base64,
-            "filename": filename,
-            "page_number": page_number
-        }
+        return await run_ocr(
+            file_bytes, filename, page_number, custom_prompt, use_cache, image_mode,
+            stage_crop=True, return_image=return_image, extract_keys_id=extract_keys_id,
+        )
     
+    except HTTPException:
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"OCR processing failed: {str(e)}")
 
 
+# 배치 요청 1건 안에서 동시에 처리할 크롭 수 (모델 호출 자체는 OLLAMA_MAX_CONCURRENCY로 별도 제한)
+OCR_BATCH_CONCURRENCY = int(os.getenv("OCR_BATCH_CONCURRENCY", "4"))
+OCR_BATCH_MAX_ITEMS = int(os.getenv("OCR_BATCH_MAX_ITEMS", "500"))
+
+
+@app.post("/ocr/batch")
+async def ocr_batch(
+    files: List[UploadFile] = File(...),
+    items: str = Form(None),
+    custom_prompt: str = Form(None),
+    use_cache: bool = Form(True),
+    image_mode: str = Form(None),
+    return_image: bool = Form(True),
+    extract_keys_id: int = Form(None),
+):
+    """
+    여러 크롭 이미지를 한 번의 요청으로 OCR 합니다.
+    - files: 크롭 이미지들 (multipart, 같은 필드명 반복)
+    - items: files와 같은 순서, 같은 개수의 JSON 배열 [{"filename", "page_number", "custom_prompt", "image_mode", "extract_keys_id"}, ...] (optional)
+    - custom_prompt, image_mode, extract_keys_id: items에 값이 없을 때 사용할 공통 설정 (optional)
+    - return_image: false이면 각 결과의 cropped_image를 생략 (crop_handle로 저장)
+
+    결과는 NDJSON(application/x-ndjson)으로 완료되는 순서대로 한 줄씩 스트리밍합니다.
+    각 줄의 index로 요청 순서를 식별하며, 개별 항목 실패는 ok=false로만 보고하고 배치 전체를 중단하지 않습니다.
+    마지막 줄은 {"done": true, ...} 요약입니다.
+    """
+    if not files:
+        raise HTTPException(status_code=400, detail="No files provided")
+    if len(files) > OCR_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Too many files (max {OCR_BATCH_MAX_ITEMS})")
+
+    item_specs = []
+    if items:
+        try:
+            item_specs = json.loads(items)
+        except json.JSONDecodeError as e:
+            raise HTTPException(status_code=400, detail=f"items must be a JSON array: {e}")
+        if not isinstance(item_specs, list) or not all(isinstance(x, dict) for x in item_specs):
+            raise HTTPException(status_code=400, detail="items must be a JSON array of objects")
+        # 순서로 짝을 맞추므로 개수가 다르면 어느 항목이 어느 파일인지 알 수 없음
+        if len(item_specs) != len(files):
+            raise HTTPException(
+                status_code=400,
+                detail=f"items has {len(item_specs)} entries but {len(files)} files were uploaded",
+            )
+
+    page_numbers = []
+    for index, spec in enumerate(item_specs):
+        page_number = spec.get("page_number")
+        if page_number is None or str(page_number).strip() == "":
+            page_numbers.append(None)
+            continue
+        try:
+            page_numbers.append(int(page_number))
+        except (TypeError, ValueError):
+            raise HTTPException(status_code=400, detail=f"items[{index}].page_number must be an integer")
+
+    # 업로드 본문은 이미 수신된 상태이므로 먼저 모두 읽어 둠
+    jobs = []
+    for index, upload in enumerate(files):
+        spec = item_specs[index] if item_specs else {}
+        jobs.append({
+            "index": index,
+            "file_bytes": await upload.read(),
+            "filename": spec.get("filename") or upload.filename,
+            "page_number": page_numbers[index] if page_numbers else None,
+            "custom_prompt": spec.get("custom_prompt") or custom_prompt,
+            "image_mode": spec.get("image_mode") or image_mode,
+            "extract_keys_id": spec.get("extract_keys_id") or extract_keys_id,
+        })
+
+    async def process(job: dict) -> dict:
+        try:
+            result = await run_ocr(
+                job["file_bytes"], job["filename"], job["page_number"], job["custom_prompt"], use_cache, job["image_mode"],
+                stage_crop=True, return_image=return_image, extract_keys_id=job["extract_keys_id"],
+            )
+            return {"index": job["index"], "ok": True, **result}
+        except HTTPException as e:
+            return {"index": job["index"], "ok": False, "status_code": e.status_code, "error": str(e.detail),
+                    "filename": job["filename"], "page_number": job["page_number"]}
+        except Exception as e:
+            return {"index": job["index"], "ok": False, "status_code": 500, "error": f"OCR processing failed: {str(e)}",
+                    "filename": job["filename"], "page_number": job["page_number"]}
+
+    async def stream_results():
+        started = time.monotonic()
+        pending: asyncio.Queue = asyncio.Queue()
+        for job in jobs:
+            pending.put_nowait(job)
+        finished: asyncio.Queue = asyncio.Queue()
+
+        async def worker():
+            while True:
+                try:
+                    job = pending.get_nowait()
+                except asyncio.QueueEmpty:
+                    return
+                await finished.put(await process(job))
+
+        workers = [asyncio.create_task(worker()) for _ in range(max(1, min(OCR_BATCH_CONCURRENCY, len(jobs))))]
+        succeeded = 0
+        try:
+            for _ in range(len(jobs)):
+                result = await finished.get()
+                if result["ok"]:
+                    succeeded += 1
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+            yield json.dumps({
+                "done": True,
+                "total": len(jobs),
+                "succeeded": succeeded,
+                "failed": len(jobs) - succeeded,
+                "elapsed_ms": round((time.monotonic() - started) * 1000, 1),
+            }) + "\n"
+        finally:
+            # 클라이언트가 중간에 끊으면 남은 작업 취소
+            for w in workers:
+                w.cancel()
+
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
+def _sse_event(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/ocr/stream")
+async def ocr_stream(
+    file: UploadFile = File(...),
+    filename: str = Form(None),
+    page_number: int = Form(None),
+    custom_prompt: str = Form(None),
+    use_cache: bool = Form(True),
+    image_mode: str = Form(None),
+    return_image: bool = Form(True),
+    extract_keys_id: int = Form(None),
+):
+    """
+    /ocr의 Server-Sent Events 버전. 모델이 생성하는 텍스트를 도착하는 즉시 전달합니다.
+    이벤트 순서:
+    - preprocess: 전처리 전/후 크기 (캐시 적중 시 생략)
+    - attempt: 생성 시도 시작 (재시도 시 클라이언트는 이전 delta를 버려야 함)
+    - delta: {"text": 부분 텍스트}
+    - early_stop: 퇴행 감지로 생성 중단
+    - final: /ocr 응답과 동일한 정리된 결과 (clean_ocr_response / extract_json_from_text 적용)
+    - error: {"status_code", "detail"}
+    """
+    file_bytes = await file.read()
+    if not filename:
+        filename = file.filename
+
+    async def event_stream():
+        events: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(
+            run_ocr(
+                file_bytes, filename, page_number, custom_prompt, use_cache, image_mode,
+                on_event=lambda kind, payload: events.put_nowait((kind, payload)),
+                stage_crop=True,
+                return_image=return_image,
+                extract_keys_id=extract_keys_id,
+            )
+        )
+        task.add_done_callback(lambda _: events.put_nowait(None))
+        try:
+            while True:
+                item = await events.get()
+                if item is None:
+                    break
+                yield _sse_event(*item)
+            try:
+                yield _sse_event("final", task.result())
+            except HTTPException as e:
+                yield _sse_event("error", {"status_code": e.status_code, "detail": str(e.detail)})
+            except Exception as e:
+                yield _sse_event("error", {"status_code": 500, "detail": f"OCR processing failed: {str(e)}"})
+        finally:
+            # 클라이언트가 연결을 끊으면 생성도 취소
+            if not task.done():
+                task.cancel()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/ocr/cache/stats")
+async def ocr_cache_stats():
+    """
+    OCR 결과 캐시 적중/미스/축출 통계 + 동시 동일 요청 합류(single_flight), 임시 보관 크롭(staged_crops),
+    히스토리 이미지 변형(image_variants), 공개 절약 현황 스냅샷(public_recent_savings) 통계.
+    """
+    stats = ocr_cache.stats()
+    stats["single_flight"] = ocr_single_flight.stats()
+    stats["staged_crops"] = crop_stage.stats()
+    stats["image_variants"] = variant_cache.stats()
+    stats["public_recent_savings"] = recent_savings_feed.stats()
+    return stats
+
+
+@app.get("/inference/stats")
+async def inference_stats():
+    """
+    추론 클라이언트 상태 (동시 실행 수, 대기 수, 평균 대기 시간, 백엔드별 상태/지연 시간, 퇴행 조기 중단 통계).
+    """
+    stats = inference_client.stats()
+    stats["early_stop"] = dict(early_stop_stats)
+    return stats
+
+
+# GET /history 목록(grouped=false)에서 선택할 수 있는 필드 (fields=)
+HISTORY_FIELDS = ("id", "extracted_text", "timestamp", "filename", "page_number", "image_sha256", "image_url", "cropped_image")
+# 기본값은 이미지(base64) 제외
+HISTORY_DEFAULT_FIELDS = ("id", "extracted_text", "timestamp", "filename", "page_number", "image_url")
+HISTORY_PAGE_LIMIT_MAX = 500
+
+
+def _encode_history_cursor(timestamp: datetime, record_id: int) -> str:
+    raw = json.dumps({"t": timestamp.isoformat(), "i": record_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_history_cursor(cursor: str) -> Tuple[datetime, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value = json.loads(raw)
+        return datetime.fromisoformat(value["t"]), int(value["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _parse_history_fields(fields: Optional[str]) -> List[str]:
+    if not fields:
+        return list(HISTORY_DEFAULT_FIELDS)
+    selected = [f.strip() for f in fields.split(",") if f.strip()]
+    unknown = [f for f in selected if f not in HISTORY_FIELDS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"unknown fields: {', '.join(unknown)} (allowed: {', '.join(HISTORY_FIELDS)})",
+        )
+    return ["id"] + [f for f in dict.fromkeys(selected) if f != "id"]
+
+
+def _list_history_page(
+    db: Session,
+    email: str,
+    limit: int,
+    cursor: Optional[str],
+    fields: List[str],
+    filename: Optional[str],
+    date_from: Optional[date],
+    date_to: Optional[date],
+    page_number: Optional[int],
+) -> dict:
+    """
+    (timestamp, id) 내림차순 keyset 페이지네이션.
+    ix_ocr_records_email_timestamp_id / ix_ocr_records_email_filename_timestamp_id 인덱스 범위 스캔으로
+    페이지마다 최대 limit+1행만 읽으며, 요청한 필드의 컬럼만 조회합니다.
+    """
+    from sqlalchemy import tuple_
+
+    columns = {"id": OCRRecord.id, "timestamp": OCRRecord.timestamp}
+    for field in fields:
+        if field in ("extracted_text", "filename", "page_number"):
+            columns[field] = getattr(OCRRecord, field)
+        elif field in ("image_sha256", "image_url"):
+            columns["image_sha256"] = OCRRecord.image_sha256
+        elif field == "cropped_image":
+            columns["image_sha256"] = OCRRecord.image_sha256
+            columns["cropped_image"] = OCRRecord.cropped_image
+
+    query = db.query(*columns.values()).filter(OCRRecord.email == email)
+    if filename is not None:
+        query = query.filter(OCRRecord.filename == filename)
+    if date_from is not None:
+        query = query.filter(OCRRecord.timestamp >= datetime.combine(date_from, datetime.min.time()))
+    if date_to is not None:
+        query = query.filter(OCRRecord.timestamp < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    if page_number is not None:
+        query = query.filter(OCRRecord.page_number == page_number)
+    if cursor:
+        cursor_timestamp, cursor_id = _decode_history_cursor(cursor)
+        query = query.filter(tuple_(OCRRecord.timestamp, OCRRecord.id) < tuple_(cursor_timestamp, cursor_id))
+    rows = query.order_by(OCRRecord.timestamp.desc(), OCRRecord.id.desc()).limit(limit + 1).all()
+
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    items = []
+    for row in rows:
+        item = {}
+        for field in fields:
+            if field == "timestamp":
+                item[field] = row.timestamp.isoformat() if row.timestamp else None
+            elif field == "image_url":
+                item[field] = _record_image_url(row)
+            elif field == "cropped_image":
+                item[field] = _record_image_base64(row)
+            else:
+                item[field] = getattr(row, field)
+        items.append(item)
+    next_cursor = _encode_history_cursor(rows[-1].timestamp, rows[-1].id) if has_more else None
+    return {"items": items, "next_cursor": next_cursor}
+
+
 @app.get("/history")
 async def get_history(
     grouped: bool = False,
     include_records: bool = False,
+    limit: int = Query(50, ge=1, le=HISTORY_PAGE_LIMIT_MAX),
+    cursor: Optional[str] = Query(None),
+    fields: Optional[str] = Query(None),
+    filename: Optional[str] = Query(None),
+    date_from: Optional[date] = Query(None),
+    date_to: Optional[date] = Query(None),
+    page_number: Optional[int] = Query(None),
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     OCR 히스토리를 반환합니다.
     grouped=True이면 파일별로 그룹화하여 반환합니다.
     include_records=True이면 각 그룹에 records 배열을 포함합니다 (기본값: False, 성능 최적화).
+    grouped=False이면 최신순 페이지 단위로 반환합니다: {"items": [...], "next_cursor": ...}
+    - 다음 페이지는 next_cursor를 cursor로 넘겨 조회 (null이면 마지막 페이지)
+    - fields=id,extracted_text,... 로 필드 선택 (기본: 이미지 제외, cropped_image는 명시해야 포함)
+    - filename, date_from/date_to(YYYY-MM-DD, UTC, 양 끝 포함), page_number 필터
     """
     try:
         email = require_auth_email(authorization)
 
-        if grouped:
-            # 통계만 필요하므로 필요한 컬럼만 선택하여 성능 최적화
-            from sqlalchemy import select
-            from datetime import datetime, timedelta
-            
-            # 최근 30일 데이터만 가져와서 성능 개선 (필요시 조정 가능)
-            thirty_days_ago = datetime.utcnow() - timedelta(days=30)
-            records = db.query(OCRRecord).filter(
-                OCRRecord.email == email,
-                OCRRecord.timestamp >= thirty_days_ago
-            ).order_by(OCRRecord.timestamp.desc()).all()
-        else:
-            records = db.query(OCRRecord).filter(OCRRecord.email == email).order_by(OCRRecord.timestamp.desc()).all()
-        
-        if grouped:
-            # 파일명별로 먼저 분류
-            from collections import defaultdict
-            from datetime import timedelta, date
-            
-            # 파일명별로 레코드 그룹화
-            filename_groups = defaultdict(list)
-            for record in records:
-                filename = record.filename or "Unknown"
-                filename_groups[filename].append(record)
-            
-            # 각 파일명 그룹 내에서 날짜(일) 기반으로 세부 그룹 생성
-            files_dict = {}
-            MINIMUM_WAGE_PER_HOUR = 10320  # 최저시급
-            
-            for filename, file_records in filename_groups.items():
-                # 같은 파일명의 레코드들을 시간순으로 정렬 (최신순)
-                file_records.sort(key=lambda x: x.timestamp, reverse=True)
-                
-                # 날짜별로 그룹화 (일단위)
-                daily_groups = defaultdict(list)
-                for record in file_records:
-                    record_date = record.timestamp.date()
-                    daily_groups[record_date].append(record)
-                
-                # 각 날짜별 그룹 생성
-                for record_date, daily_records in daily_groups.items():
-                    # 날짜별 그룹 키 생성
-                    group_date_str = record_date.strftime("%Y%m%d")
-                    current_group_key = f"{filename}_{group_date_str}"
-                    
-                    # 고유한 페이지 번호 집합 계산 (실제 처리된 페이지 수)
-                    pages_set = set()
-                    images_count = 0
-                    for record in daily_records:
-                        if record.page_number is not None:
-                            pages_set.add(record.page_number)
-                        else:
-                            images_count += 1  # 이미지 개수 카운트
-                    
-                    # 페이지 수 계산: 고유한 페이지 번호 개수 + 이미지가 있으면 1페이지 추가
-                    unique_pages_count = len(pages_set)
-                    if images_count > 0:
-                        unique_pages_count = max(unique_pages_count, 1)  # 이미지가 있으면 최소 1페이지
-                    
-                    # 절약 시간/금액 계산
-                    # - 일반 모드: (영역 × 페이지) 1건당 1분
-                    # - 고급 모드: key:value 1개당 10초 × 페이지수
-                    #   (히스토리에는 모드가 따로 저장되지 않으므로, extracted_text가 JSON(dict)로 파싱되면 "고급"으로 추정)
-                    total_records = len(daily_records)
-
-                    # area 추정: (총 레코드 = 영역×페이지) 라는 전제에서 영역 수를 역산
-                    areas_est = 0
-                    if unique_pages_count and unique_pages_count > 0:
-                        areas_est = max(1, int(round(total_records / unique_pages_count))) if total_records > 0 else 0
-                    else:
-                        areas_est = total_records
-
-                    # JSON key:value 개수 추정
-                    kv_counts = []
-                    for r in daily_records:
-                        txt = (r.extracted_text or "").strip()
-                        if not txt:
-                            continue
-                        try:
-                            obj = json.loads(txt)
-                            if isinstance(obj, dict):
-                                kv_counts.append(len(obj.keys()))
-                        except Exception:
-                            continue
-
-                    # 일반 모드(문서 전사) 기준: 180 CPM (분당 180글자)
-                    TYPING_CPM = 180
-                    total_chars = 0
-                    for r in daily_records:
-                        total_chars += len((r.extracted_text or ""))
-
-                    is_advanced_est = len(kv_counts) > 0
-                    if is_advanced_est:
-                        # 대표 key:value 개수(중앙값)
-                        kv_counts_sorted = sorted(kv_counts)
-                        kv_est = kv_counts_sorted[len(kv_counts_sorted) // 2]
-                        time_saved_minutes = (kv_est * unique_pages_count * 10) / 60.0
-                        time_basis = "advanced"
-                    else:
-                        # 글자 수 기반 타이핑 시간(공백 포함)으로 산정
-                        time_saved_minutes = (float(total_chars) / float(TYPING_CPM)) if TYPING_CPM > 0 else 0.0
-                        time_basis = "standard_chars"
-
-                    money_saved = (time_saved_minutes / 60) * MINIMUM_WAGE_PER_HOUR
-                    
-                    current_group = {
-                        "filename": filename,
-                        "total_records": total_records,
-                        "pages_count": unique_pages_count,
-                        "areas_count": areas_est,
-                        "time_saved_minutes": round(time_saved_minutes, 2),
-                        "time_basis": time_basis,
-                        "total_chars": int(total_chars),
-                        "money_saved": round(money_saved, 2),
-                        "latest_timestamp": max(r.timestamp for r in daily_records),
-                        "first_timestamp": min(r.timestamp for r in daily_records),
-                        "date": record_date.isoformat()
-                    }
-                    
-                    # 레코드 목록 생성 (include_records=True일 때만, 성능 최적화)
-                    # cropped_image는 크기가 크므로 제외 (필요시 GET /history/{id}로 조회)
-                    # 응답 크기 최적화: 92MB 이미지 데이터를 제외하여 서버 부하 감소
-                    if include_records:
-                        records_list = []
-                        for record in daily_records:
-                            records_list.append({
-                                "id": record.id,
-                                "extracted_text": record.extracted_text,
-                                # cropped_image 제외: 응답 크기 최적화 (필요시 GET /history/{id}로 조회)
-                                "timestamp": record.timestamp.isoformat(),
-                                "page_number": record.page_number
-                            })
-                        current_group["records"] = records_list
-                    files_dict[current_group_key] = current_group
-            
-            # 파일 목록을 최신 순으로 정렬하고 타임스탬프를 문자열로 변환
-            files_list = []
-            for file_data in sorted(
-                files_dict.values(),
-                key=lambda x: x["latest_timestamp"],
-                reverse=True
-            ):
-                file_data["latest_timestamp"] = file_data["latest_timestamp"].isoformat()
-                file_data["first_timestamp"] = file_data["first_timestamp"].isoformat()
-                files_list.append(file_data)
-            
-            return files_list
-        else:
-            # 기존 방식: 모든 기록 반환
-            return [
-                {
-                    "id": record.id,
-                    "extracted_text": record.extracted_text,
-                    "cropped_image": record.cropped_image,
-                    "timestamp": record.timestamp.isoformat(),
-                    "filename": record.filename,
-                    "page_number": record.page_number
-                }
-                for record in records
-            ]
+        if not grouped:
+            return await db.run_sync(
+                _list_history_page, email, limit, cursor, _parse_history_fields(fields),
+                filename, date_from, date_to, page_number,
+            )
+
+        # 파일/날짜별 요약(history_groups)만 읽음: 최근 30일 (필요시 조정 가능)
+        thirty_days_ago = datetime.utcnow() - timedelta(days=30)
+        groups = (await db.scalars(
+            select(HistoryGroup)
+            .where(HistoryGroup.email == email, HistoryGroup.latest_timestamp >= thirty_days_ago)
+            .order_by(HistoryGroup.latest_timestamp.desc())
+        )).all()
+        files_list = [group_to_response(group) for group in groups]
+
+        # 레코드 목록 생성 (include_records=True일 때만, 성능 최적화)
+        # cropped_image는 크기가 크므로 제외 (필요시 GET /history/{id}/image로 조회)
+        if include_records and groups:
+            by_key = {(g["filename"], g["date"]): g for g in files_list}
+            for g in files_list:
+                g["records"] = []
+            rows = (await db.execute(
+                select(OCRRecord.id, OCRRecord.extracted_text, OCRRecord.timestamp, OCRRecord.page_number, OCRRecord.filename)
+                .where(OCRRecord.email == email, OCRRecord.timestamp >= min(g.first_timestamp for g in groups))
+                .order_by(OCRRecord.timestamp.desc(), OCRRecord.id.desc())
+            )).all()
+            for row in rows:
+                name, day = group_key(row.filename, row.timestamp)
+                group = by_key.get((name, day.isoformat()))
+                if group is not None:
+                    group["records"].append({
+                        "id": row.id,
+                        "extracted_text": row.extracted_text,
+                        "timestamp": row.timestamp.isoformat(),
+                        "page_number": row.page_number
+                    })
+        return files_list
     except HTTPException:
         raise
     except Exception as e:
@@ -871,130 +1050,169 @@ async def get_history(
         raise HTTPException(status_code=500, detail=f"Failed to fetch history: {str(e)}")
 
 
-@app.get("/public/recent-savings")
-async def public_recent_savings(
-    limit: int = Query(6, ge=1, le=50),
-    days: int = Query(30, ge=1, le=365),
-    db: Session = Depends(get_db),
+SEARCH_PAGE_LIMIT_MAX = 100
+
+
+def _encode_search_cursor(rank: Optional[float], record_id: int) -> str:
+    raw = json.dumps({"r": rank, "i": record_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_search_cursor(cursor: str, sort: str) -> Tuple[Optional[float], int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value = json.loads(raw)
+        rank = float(value["r"]) if sort == "relevance" else None
+        return rank, int(value["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+@app.get("/history/search")
+async def search_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    sort: str = Query("relevance"),
+    limit: int = Query(20, ge=1, le=SEARCH_PAGE_LIMIT_MAX),
+    cursor: Optional[str] = Query(None),
+    authorization: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
-    공개용 '최근 절약 현황' (전체 사용자 기준, 최신순).
-    - 인증 불필요
-    - 개인정보 최소화를 위해 email은 마스킹해서 반환
-    - 성능을 위해 최근 N일 데이터만 조회
-
+    내 OCR 히스토리에서 본문(extracted_text)/파일명을 전문 검색합니다 (history_search.py, SQLite FTS5).
+    검색어는 공백으로 나눈 단어마다 접두사 검색이며 모두 포함하는 레코드만 반환합니다.
+    - sort=relevance(기본, bm25 관련도순) | recent(최신 저장순)
+    - 응답: {"items": [...], "next_cursor": ...}, 다음 페이지는 next_cursor를 cursor로 넘겨 조회
+    - snippet: 일치 부분 주변 본문, snippet_highlights / filename_highlights: 강조할 [시작, 끝) 문자 위치 목록
+    """
+    email = require_auth_email(authorization)
+    if sort not in SEARCH_SORTS:
+        raise HTTPException(status_code=400, detail=f"sort must be one of: {', '.join(SEARCH_SORTS)}")
+    try:
+        match = build_match_query(email, q)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="q must contain at least one word")
+    after = _decode_search_cursor(cursor, sort) if cursor else None
+
+    rows, has_more = await db.run_sync(search_records, email, match, limit, sort, after)
+    items = []
+    for row in rows:
+        items.append({
+            "id": row["id"],
+            "filename": row["filename"],
+            "page_number": row["page_number"],
+            "timestamp": row["timestamp"].isoformat() if row["timestamp"] else None,
+            "image_url": f"/blobs/{row['image_sha256']}" if row["image_sha256"] else None,
+            # 높을수록 관련도 높음
+            "score": round(-row["rank"], 4),
+            "snippet": row["snippet"],
+            "snippet_highlights": row["snippet_highlights"],
+            "filename_highlights": row["filename_highlights"],
+        })
+    next_cursor = None
+    if has_more:
+        last = rows[-1]
+        next_cursor = _encode_search_cursor(last["rank"] if sort == "relevance" else None, last["id"])
+    return {"items": items, "next_cursor": next_cursor}
+
+
+def _build_recent_savings(days: int, limit: int) -> List[dict]:
+    """
+    공개 피드 스냅샷 집계 (recent_savings.RecentSavingsFeed가 스레드풀에서 호출).
     반환은 /history?grouped=true와 유사하되, 그룹 키에 email을 포함하여
     동일 파일명이라도 사용자별로 섞이지 않게 합니다.
     """
-    from collections import defaultdict
-    from datetime import datetime, timedelta
-
-    thirty_days_ago = datetime.utcnow() - timedelta(days=days)
-    records = (
-        db.query(OCRRecord)
-        .filter(OCRRecord.timestamp >= thirty_days_ago)
-        .order_by(OCRRecord.timestamp.desc())
-        .all()
-    )
+    from sqlalchemy import func
 
-    # 그룹화 키: (email, filename, date)
-    grouped_map = defaultdict(list)
-    for r in records:
-        owner = (r.email or "unknown").strip().lower()
-        filename = r.filename or "Unknown"
-        record_date = r.timestamp.date()
-        grouped_map[(owner, filename, record_date)].append(r)
-
-    MINIMUM_WAGE_PER_HOUR = 10320
-    TYPING_CPM = 180
+    since = datetime.utcnow() - timedelta(days=days)
+    # 그룹화 키: (email, filename, date) — 저장 시 계산한 통계 컬럼의 SQL 집계, 최신 그룹 limit개만
+    owner = func.lower(func.trim(func.coalesce(OCRRecord.email, "unknown")))
+    db = SessionLocal()
+    try:
+        groups = aggregate_groups(
+            db,
+            [owner, func.coalesce(func.nullif(OCRRecord.filename, ""), "Unknown"), func.date(OCRRecord.timestamp)],
+            [OCRRecord.timestamp >= since],
+            limit=limit,
+        )
+    finally:
+        db.close()
 
     results = []
-    for (owner, filename, record_date), daily_records in grouped_map.items():
-        # 최신순 정렬
-        daily_records.sort(key=lambda x: x.timestamp, reverse=True)
-
-        pages_set = set()
-        images_count = 0
-        for r in daily_records:
-            if r.page_number is not None:
-                pages_set.add(r.page_number)
-            else:
-                images_count += 1
-
-        unique_pages_count = len(pages_set)
-        if images_count > 0:
-            unique_pages_count = max(unique_pages_count, 1)
-
-        total_records = len(daily_records)
-        if unique_pages_count and unique_pages_count > 0:
-            areas_est = max(1, int(round(total_records / unique_pages_count))) if total_records > 0 else 0
-        else:
-            areas_est = total_records
-
-        kv_counts = []
-        total_chars = 0
-        for r in daily_records:
-            txt = (r.extracted_text or "")
-            total_chars += len(txt)
-            s = txt.strip()
-            if not s:
-                continue
-            try:
-                obj = json.loads(s)
-                if isinstance(obj, dict):
-                    kv_counts.append(len(obj.keys()))
-            except Exception:
-                pass
-
-        is_advanced_est = len(kv_counts) > 0
-        if is_advanced_est:
-            kv_counts_sorted = sorted(kv_counts)
-            kv_est = kv_counts_sorted[len(kv_counts_sorted) // 2]
-            time_saved_minutes = (kv_est * unique_pages_count * 10) / 60.0
-            time_basis = "advanced"
-        else:
-            time_saved_minutes = (float(total_chars) / float(TYPING_CPM)) if TYPING_CPM > 0 else 0.0
-            time_basis = "standard_chars"
-
-        money_saved = (time_saved_minutes / 60) * MINIMUM_WAGE_PER_HOUR
-
+    for group in groups:
+        owner_email, filename, record_date = group["key"]
+        time_saved_minutes, time_basis, money_saved = estimate_savings(
+            group["pages_count"], group["total_chars"], group["kv_median"]
+        )
         results.append(
             {
                 "filename": filename,
-                "total_records": total_records,
-                "pages_count": unique_pages_count,
-                "areas_count": areas_est,
+                "total_records": group["total_records"],
+                "pages_count": group["pages_count"],
+                "areas_count": group["areas_count"],
                 "time_saved_minutes": round(time_saved_minutes, 2),
                 "time_basis": time_basis,
-                "total_chars": int(total_chars),
+                "total_chars": group["total_chars"],
                 "money_saved": round(money_saved, 2),
-                "latest_timestamp": daily_records[0].timestamp.isoformat() if daily_records else None,
-                "first_timestamp": daily_records[-1].timestamp.isoformat() if daily_records else None,
-                "date": record_date.isoformat(),
-                "user_email_masked": _mask_email(owner),
+                "latest_timestamp": group["latest_timestamp"].isoformat(),
+                "first_timestamp": group["first_timestamp"].isoformat(),
+                "date": record_date,
+                "user_email_masked": _mask_email(owner_email),
             }
         )
+    return results
+
+
+recent_savings_feed = RecentSavingsFeed(_build_recent_savings)
+# 스냅샷 주기보다 오래 캐시하지 않도록 (CDN/브라우저)
+PUBLIC_SAVINGS_CACHE_CONTROL = f"public, max-age={int(min(PUBLIC_SAVINGS_TTL_SECONDS, 60))}"
+
+
+@app.on_event("startup")
+async def _startup_recent_savings():
+    recent_savings_feed.start()
+
+
+@app.on_event("shutdown")
+async def _shutdown_recent_savings():
+    await recent_savings_feed.stop()
 
-    # 최신순 정렬 후 limit 적용
-    results.sort(key=lambda x: x["latest_timestamp"] or "", reverse=True)
-    return results[:limit]
+
+@app.get("/public/recent-savings")
+async def public_recent_savings(
+    response: Response,
+    limit: int = Query(6, ge=1, le=PUBLIC_SAVINGS_MAX_LIMIT),
+    days: int = Query(30, description=f"집계 기간 (일): {', '.join(map(str, PUBLIC_SAVINGS_DAYS))} 중 하나"),
+):
+    """
+    공개용 '최근 절약 현황' (전체 사용자 기준, 최신순).
+    - 인증 불필요
+    - 개인정보 최소화를 위해 email은 마스킹해서 반환
+    - 백그라운드에서 주기적으로(및 저장 후) 갱신하는 스냅샷을 잘라 반환 (recent_savings.py)
+    """
+    if days not in PUBLIC_SAVINGS_DAYS:
+        raise HTTPException(
+            status_code=400, detail=f"days must be one of {', '.join(map(str, PUBLIC_SAVINGS_DAYS))}"
+        )
+    response.headers["Cache-Control"] = PUBLIC_SAVINGS_CACHE_CONTROL
+    return await recent_savings_feed.get(days, limit)
 
 
 @app.get("/history/{record_id}")
-async def get_record(record_id: int, authorization: Optional[str] = Header(None), db: Session = Depends(get_db)):
+async def get_record(record_id: int, authorization: Optional[str] = Header(None), db: AsyncSession = Depends(get_async_db)):
     """
     단일 OCR 기록을 조회합니다. 이미지 포함.
     """
     try:
         email = require_auth_email(authorization)
-        record = db.query(OCRRecord).filter(OCRRecord.id == record_id, OCRRecord.email == email).first()
+        record = await db.scalar(select(OCRRecord).where(OCRRecord.id == record_id, OCRRecord.email == email))
         if not record:
             raise HTTPException(status_code=404, detail="Record not found")
         
         return {
             "id": record.id,
             "extracted_text": record.extracted_text,
-            "cropped_image": record.cropped_image,
+            "cropped_image": await run_in_threadpool(_record_image_base64, record),
+            "image_url": _record_image_url(record),
             "timestamp": record.timestamp.isoformat(),
             "filename": record.filename,
             "page_number": record.page_number
@@ -1005,30 +1223,99 @@ async def get_record(record_id: int, authorization: Optional[str] = Header(None)
         raise HTTPException(status_code=500, detail=f"Failed to fetch record: {str(e)}")
 
 
+# 레코드가 삭제될 수 있어 immutable로 두지 않고, 하루 뒤에는 ETag로 재검증
+HISTORY_IMAGE_CACHE_CONTROL = "private, max-age=86400"
+
+
+@app.get("/history/{record_id}/image")
+async def get_record_image(
+    record_id: int,
+    size: str = Query("medium"),
+    image_format: str = Query("webp", alias="format"),
+    authorization: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    OCR 기록의 크롭 이미지를 바이너리로 반환합니다 (size=thumb|medium|full, format=webp|png).
+    변형은 처음 요청될 때 만들어 디스크에 캐시하고, If-None-Match가 일치하면 304를 반환합니다.
+    """
+    email = require_auth_email(authorization)
+    if size not in VARIANT_SIZES:
+        raise HTTPException(status_code=400, detail=f"size must be one of: {', '.join(VARIANT_SIZES)}")
+    if image_format not in VARIANT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"format must be one of: {', '.join(VARIANT_FORMATS)}")
+
+    row = (await db.execute(
+        select(OCRRecord.id, OCRRecord.image_sha256).where(OCRRecord.id == record_id, OCRRecord.email == email)
+    )).first()
+    if row is None:
+        raise HTTPException(status_code=404, detail="Record not found")
+
+    sha256 = row.image_sha256
+    source: Optional[bytes] = None
+    if not sha256:
+        # blob 저장소 이전(db_tools.py migrate-blobs) 전의 레코드: base64 컬럼을 읽어 해시로 캐시 이름을 만듦
+        legacy = await db.scalar(select(OCRRecord.cropped_image).where(OCRRecord.id == record_id))
+        if not legacy:
+            raise HTTPException(status_code=404, detail="Record has no image")
+        source = _decode_image_base64(legacy)
+        sha256 = hashlib.sha256(source).hexdigest()
+
+    etag = f'"{sha256}-{size}-{image_format}"'
+    headers = {"ETag": etag, "Cache-Control": HISTORY_IMAGE_CACHE_CONTROL}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+
+    def variant_bytes() -> Optional[bytes]:
+        # 경로 대신 바이트를 받음: 응답을 보내는 사이 캐시 eviction이 파일을 지워도 500이 나지 않도록
+        cached = variant_cache.cached(sha256, size, image_format)
+        if cached is not None:
+            return cached
+        data = source if source is not None else blob_store.get(sha256)
+        if data is None:
+            return None
+        return variant_cache.get_or_create(sha256, size, image_format, data)
+
+    try:
+        content = await run_in_threadpool(variant_bytes)
+    except ValueError:
+        raise HTTPException(status_code=422, detail="Stored image cannot be decoded")
+    if content is None:
+        raise HTTPException(status_code=404, detail="Image data missing")
+    return Response(content=content, media_type=VARIANT_FORMATS[image_format][1], headers=headers)
+
+
 @app.put("/history/{record_id}")
 async def update_record(
     record_id: int,
     extracted_text: str = Form(...),
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db),
 ):
     """
     OCR 기록의 텍스트를 수정합니다.
     """
     try:
         email = require_auth_email(authorization)
-        record = db.query(OCRRecord).filter(OCRRecord.id == record_id, OCRRecord.email == email).first()
-        if not record:
-            raise HTTPException(status_code=404, detail="Record not found")
-        
-        record.extracted_text = extracted_text
-        db.commit()
-        db.refresh(record)
+
+        def update(db: Session) -> OCRRecord:
+            record = db.query(OCRRecord).filter(OCRRecord.id == record_id, OCRRecord.email == email).first()
+            if not record:
+                raise HTTPException(status_code=404, detail="Record not found")
+            record.extracted_text = extracted_text
+            apply_text_stats(record)
+            db.flush()
+            refresh_history_groups(db, email, [group_key(record.filename, record.timestamp)])
+            return record
+
+        record = await run_in_threadpool(run_write_transaction, update)
+        recent_savings_feed.invalidate()
         
         return {
             "id": record.id,
             "extracted_text": record.extracted_text,
-            "cropped_image": record.cropped_image,
+            "cropped_image": await run_in_threadpool(_record_image_base64, record),
+            "image_url": _record_image_url(record),
             "timestamp": record.timestamp.isoformat(),
             "filename": record.filename,
             "page_number": record.page_number
@@ -1040,18 +1327,26 @@ async def update_record(
 
 
 @app.delete("/history/{record_id}")
-async def delete_record(record_id: int, authorization: Optional[str] = Header(None), db: Session = Depends(get_db)):
+async def delete_record(record_id: int, authorization: Optional[str] = Header(None)):
     """
     OCR 기록을 삭제합니다.
     """
     try:
         email = require_auth_email(authorization)
-        record = db.query(OCRRecord).filter(OCRRecord.id == record_id, OCRRecord.email == email).first()
-        if not record:
-            raise HTTPException(status_code=404, detail="Record not found")
-        
-        db.delete(record)
-        db.commit()
+
+        def delete(db: Session) -> None:
+            record = db.query(OCRRecord).filter(OCRRecord.id == record_id, OCRRecord.email == email).first()
+            if not record:
+                raise HTTPException(status_code=404, detail="Record not found")
+            key = group_key(record.filename, record.timestamp)
+            session_key = (record.save_session_id, record.filename)
+            db.delete(record)
+            db.flush()
+            refresh_history_groups(db, email, [key])
+            refresh_save_sessions(db, email, [session_key])
+
+        await run_in_threadpool(run_write_transaction, delete)
+        recent_savings_feed.invalidate()
         
         return {"message": "Record deleted successfully", "id": record_id}
     except HTTPException:
@@ -1064,7 +1359,6 @@ async def delete_record(record_id: int, authorization: Optional[str] = Header(No
 async def delete_multiple_records(
     record_ids: List[int] = Body(..., description="삭제할 레코드 ID 목록"),
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
 ):
     """
     여러 OCR 기록을 한 번에 삭제합니다.
@@ -1073,22 +1367,27 @@ async def delete_multiple_records(
         if not record_ids or len(record_ids) == 0:
             raise HTTPException(status_code=400, detail="No record IDs provided")
         
-        email = require_auth_email(authorization)
-        # 존재하는 레코드만 조회 (본인 소유만)
-        records = db.query(OCRRecord).filter(OCRRecord.id.in_(record_ids), OCRRecord.email == email).all()
-        
-        if not records:
-            raise HTTPException(status_code=404, detail="No records found")
-        
+        email = require_auth_email(authorization)
+
+        def delete(db: Session) -> List[int]:
+            # 존재하는 레코드만 조회 (본인 소유만)
+            records = db.query(OCRRecord).filter(OCRRecord.id.in_(record_ids), OCRRecord.email == email).all()
+            if not records:
+                raise HTTPException(status_code=404, detail="No records found")
+            keys = [group_key(record.filename, record.timestamp) for record in records]
+            session_keys = [(record.save_session_id, record.filename) for record in records]
+            # 모든 레코드 삭제
+            for record in records:
+                db.delete(record)
+            db.flush()
+            refresh_history_groups(db, email, keys)
+            refresh_save_sessions(db, email, session_keys)
+            return [record.id for record in records]
+
         # 삭제될 ID 수집
-        deleted_ids = [record.id for record in records]
+        deleted_ids = await run_in_threadpool(run_write_transaction, delete)
         not_found_ids = [rid for rid in record_ids if rid not in deleted_ids]
-        
-        # 모든 레코드 삭제
-        for record in records:
-            db.delete(record)
-        
-        db.commit()
+        recent_savings_feed.invalidate()
         
         return {
             "message": f"{len(deleted_ids)} records deleted successfully",
@@ -1099,121 +1398,521 @@ async def delete_multiple_records(
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete records: {str(e)}")
+
+
+def _decode_image_base64(value: str) -> bytes:
+    """
+    저장 요청의 cropped_image(base64, data URL 접두어 허용)를 원본 바이트로 변환합니다. 잘못된 값이면 400.
+    """
+    if value.startswith("data:") and "," in value:
+        value = value.split(",", 1)[1]
+    try:
+        return base64.b64decode(value, validate=True)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="cropped_image is not valid base64")
+
+
+def _record_image_base64(record: OCRRecord) -> Optional[str]:
+    # 이미지를 함께 돌려주는 단건 조회용 (blob 저장소 이전 레코드는 기존 컬럼 사용)
+    if record.image_sha256:
+        data = blob_store.get(record.image_sha256)
+        return base64.b64encode(data).decode('utf-8') if data is not None else None
+    return record.cropped_image
+
+
+def _record_image_url(record: OCRRecord) -> Optional[str]:
+    return f"/blobs/{record.image_sha256}" if record.image_sha256 else None
+
+
+# blob은 내용 주소(sha256)라 바뀌지 않으므로 브라우저가 오래 캐시해도 됨 (사용자별 데이터라 private)
+BLOB_CACHE_CONTROL = "private, max-age=31536000, immutable"
+
+
+def _etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    candidates = [c.strip() for c in if_none_match.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
+
+
+@app.get("/blobs/{sha256}")
+async def get_blob(
+    sha256: str,
+    authorization: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    db: AsyncSession = Depends(get_async_db),
+):
+    """
+    저장된 크롭 이미지 원본(바이너리)을 스트리밍합니다. 본인 레코드가 참조하는 이미지만 조회할 수 있습니다.
+    ETag는 sha256이며, If-None-Match가 일치하면 304를 반환합니다.
+    """
+    email = require_auth_email(authorization)
+    owned = None
+    if is_valid_sha256(sha256):
+        owned = await db.scalar(
+            select(OCRRecord.id).where(OCRRecord.email == email, OCRRecord.image_sha256 == sha256).limit(1)
+        )
+    if owned is None:
+        raise HTTPException(status_code=404, detail="Image not found")
+
+    etag = f'"{sha256}"'
+    headers = {"ETag": etag, "Cache-Control": BLOB_CACHE_CONTROL}
+    if _etag_matches(if_none_match, etag):
+        return Response(status_code=304, headers=headers)
+    info = await run_in_threadpool(blob_store.stat, sha256)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Image data missing")
+    return FileResponse(blob_store.path(sha256), media_type=info[1], headers=headers)
+
+
+OCR_SAVE_COST_PER_PAGE = 10
+
+
+def _add_ocr_records_with_charge(
+    db: Session,
+    email: str,
+    filename: str,
+    save_session_id: Optional[str],
+    items: List[dict],
+):
+    """
+    한 저장 세션의 OCRRecord들을 추가하고, 세션 내 '페이지당 1회' 크레딧을 차감합니다 (commit은 호출 측).
+    items: {"extracted_text", "image_sha256", "page_number"} 목록. 이미지 원본은 호출 측이 미리 blob 저장소에 씁니다.
+    run_write_transaction(쓰기 락 + commit)으로 실행합니다.
+    - 아직 차감되지 않은 페이지를 한 번에 모아 조건부 UPDATE 한 번으로 차감합니다 (credit_balance.py).
+      부족하면 HTTPException(402)이고 아무것도 저장하지 않습니다.
+    - 레코드는 executemany 한 번으로 INSERT합니다.
+    반환: (ocr_records, 저장 후 크레딧 잔액, 이번에 차감한 페이지 수)
+    """
+    # 사용자 계정 upsert (트랜잭션 첫 문장이 쓰기라 시작부터 쓰기 잠금을 잡음)
+    ensure_account(db, email)
+
+    # 저장(1회 클릭) 내에서 '페이지당 1회'만 차감
+    # page_key: PDF면 page_number, 이미지 등 page_number None이면 -1로 취급(=1페이지)
+    session_id = (save_session_id or "").strip() or f"legacy-{filename}"
+    page_numbers: Dict[int, Optional[int]] = {}
+    for item in items:
+        page_number = item["page_number"]
+        page_numbers.setdefault(page_number if page_number is not None else -1, page_number)
+
+    # 동일 (email, session_id, page_key) 중복 차감 방지 (uq_credit_once_per_page_per_session)
+    new_pages = claim_page_charges(
+        db, email, OCR_SAVE_CHARGE_REASON, session_id, filename, page_numbers, OCR_SAVE_COST_PER_PAGE
+    )
+    if new_pages:
+        cost = OCR_SAVE_COST_PER_PAGE * len(new_pages)
+        credits_balance = debit_credits(db, email, cost)
+        if credits_balance is None:
+            raise HTTPException(
+                status_code=402,
+                detail=f"크레딧이 부족합니다. 필요: {cost}, 보유: {get_balance(db, email)}",
+            )
+    else:
+        credits_balance = get_balance(db, email)
+
+    timestamp = datetime.utcnow()
+    rows = []
+    for item in items:
+        char_count, is_json, kv_count = text_stats(item["extracted_text"])
+        rows.append({
+            "email": email,
+            "save_session_id": session_id,
+            "extracted_text": item["extracted_text"],
+            # 커밋이 실패하면 참조 없는 blob이 남을 수 있음 (db_tools.py gc-blobs로 정리)
+            "image_sha256": item["image_sha256"],
+            "timestamp": timestamp,
+            "filename": filename,
+            "page_number": item["page_number"],
+            "char_count": char_count,
+            "is_json": is_json,
+            "kv_count": kv_count,
+        })
+    # RETURNING을 쓰면 SQLite에서는 순서 보장을 위해 1행씩 INSERT하므로, executemany 후 같은 트랜잭션에서 id 순으로 다시 읽음
+    db.execute(insert(OCRRecord), rows)
+    ocr_records = (
+        db.query(OCRRecord)
+        .filter(
+            OCRRecord.email == email,
+            OCRRecord.save_session_id == session_id,
+            OCRRecord.filename == filename,
+            OCRRecord.timestamp == timestamp,
+        )
+        .order_by(OCRRecord.id)
+        .all()
+    )
+    refresh_history_groups(db, email, [group_key(filename, timestamp)])
+    refresh_save_sessions(db, email, [(session_id, filename)])
+    return ocr_records, credits_balance, len(new_pages)
+
+
+def _add_ocr_record_with_charge(
+    db: Session,
+    email: str,
+    extracted_text: str,
+    image_sha256: Optional[str],
+    filename: str,
+    page_number: Optional[int],
+    save_session_id: Optional[str],
+):
+    """
+    OCRRecord 1건을 추가하고 페이지당 1회 크레딧을 차감합니다 (_add_ocr_records_with_charge의 1건 버전).
+    반환: (ocr_record, 저장 후 크레딧 잔액)
+    """
+    ocr_records, credits_balance, _ = _add_ocr_records_with_charge(
+        db, email, filename, save_session_id,
+        [{"extracted_text": extracted_text, "image_sha256": image_sha256, "page_number": page_number}],
+    )
+    return ocr_records[0], credits_balance
+
+
 @app.post("/history/save")
 async def save_ocr_result(
     extracted_text: str = Form(...),
-    cropped_image: str = Form(...),
+    cropped_image: str = Form(None),
+    crop_handle: str = Form(None),
     filename: str = Form(...),
     page_number: int = Form(None),
     save_session_id: str = Form(None),
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
 ):
     """
     OCR 결과를 history에 저장합니다.
     '저장' 버튼을 눌렀을 때만 호출됩니다.
+    이미지는 /ocr 응답의 crop_handle(권장) 또는 cropped_image(base64) 중 하나로 전달합니다.
     """
     try:
         # 로그인 사용자 기준 저장
         email = require_auth_email(authorization)
 
-        # 사용자 계정 upsert
-        user = db.query(UserAccount).filter(UserAccount.email == email).first()
-        if not user:
-            user = UserAccount(email=email, plan_key=None, credits_balance=0)
-            db.add(user)
-            db.flush()
-
-        # 저장(1회 클릭) 내에서 '페이지당 1회'만 차감
-        # page_key: PDF면 page_number, 이미지 등 page_number None이면 -1로 취급(=1페이지)
-        page_key = page_number if page_number is not None else -1
-        session_id = (save_session_id or "").strip() or f"legacy-{filename}"
-        reason = "ocr_save_page_charge"
-
-        # 동일 (email, session_id, page_key) 중복 차감 방지
-        existing_charge = (
-            db.query(CreditLedger)
-            .filter(
-                CreditLedger.email == email,
-                CreditLedger.reason == reason,
-                CreditLedger.save_session_id == session_id,
-                CreditLedger.page_key == page_key,
-            )
-            .first()
-        )
-
-        if not existing_charge:
-            cost_per_page = 10
-            if (user.credits_balance or 0) < cost_per_page:
+        if crop_handle:
+            image_bytes = await run_in_threadpool(crop_stage.get, crop_handle) if is_valid_handle(crop_handle) else None
+            if image_bytes is None:
                 raise HTTPException(
-                    status_code=402,
-                    detail=f"크레딧이 부족합니다. 필요: {cost_per_page}, 보유: {user.credits_balance or 0}",
-                )
-
-            user.credits_balance = (user.credits_balance or 0) - cost_per_page
-            db.add(
-                CreditLedger(
-                    email=email,
-                    delta=-cost_per_page,
-                    reason=reason,
-                    filename=filename,
-                    page_key=page_key,
-                    save_session_id=session_id,
-                    meta=json.dumps(
-                        {"cost_per_page": cost_per_page, "page_number": page_number},
-                        ensure_ascii=False,
-                    ),
+                    status_code=410,
+                    detail="Staged crop expired or not found. Run OCR again or send cropped_image.",
                 )
-            )
+        elif cropped_image:
+            image_bytes = _decode_image_base64(cropped_image)
+        else:
+            raise HTTPException(status_code=400, detail="cropped_image or crop_handle is required")
 
-        ocr_record = OCRRecord(
-            email=email,
-            save_session_id=session_id,
-            extracted_text=extracted_text,
-            cropped_image=cropped_image,
-            timestamp=datetime.utcnow(),
-            filename=filename,
-            page_number=page_number
+        image_sha256 = await run_in_threadpool(blob_store.put, image_bytes) if image_bytes else None
+        ocr_record, credits_balance = await run_in_threadpool(
+            run_write_transaction, _add_ocr_record_with_charge,
+            email, extracted_text, image_sha256, filename, page_number, save_session_id,
         )
-        db.add(ocr_record)
-        db.commit()
-        db.refresh(ocr_record)
+        recent_savings_feed.invalidate()
+        # crop_handle은 저장 후에도 TTL까지 유지 (저장 중간에 실패한 요청을 다시 보낼 수 있도록)
         
         return {
             "id": ocr_record.id,
             "extracted_text": ocr_record.extracted_text,
-            "cropped_image": ocr_record.cropped_image,
+            # 방금 올린 이미지를 base64로 되돌려 보내지 않음 (image_url로 조회)
+            "image_sha256": ocr_record.image_sha256,
+            "image_url": _record_image_url(ocr_record),
             "timestamp": ocr_record.timestamp.isoformat(),
             "filename": ocr_record.filename,
             "page_number": ocr_record.page_number,
             "user_email": email,
-            "credits_balance": user.credits_balance,
+            "credits_balance": credits_balance,
         }
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to save OCR result: {str(e)}")
 
 
+# 한 번에 저장할 수 있는 영역 수 (예: 30페이지 × 4영역 = 120)
+SAVE_BATCH_MAX_ITEMS = 500
+
+
+class SaveBatchItem(BaseModel):
+    extracted_text: str
+    cropped_image: Optional[str] = None
+    crop_handle: Optional[str] = None
+    page_number: Optional[int] = None
+
+
+class SaveBatchRequest(BaseModel):
+    filename: str
+    save_session_id: Optional[str] = None
+    items: List[SaveBatchItem]
+
+
+def _store_batch_images(items: List[SaveBatchItem]) -> List[Optional[str]]:
+    """
+    항목마다 이미지(crop_handle 또는 cropped_image)를 읽어 blob 저장소에 쓰고 sha256 목록을 반환합니다.
+    하나라도 잘못되었으면 blob을 쓰기 전에 HTTPException (400/410).
+    """
+    images = []
+    for index, item in enumerate(items):
+        if item.crop_handle:
+            image_bytes = crop_stage.get(item.crop_handle) if is_valid_handle(item.crop_handle) else None
+            if image_bytes is None:
+                raise HTTPException(
+                    status_code=410,
+                    detail=f"items[{index}]: Staged crop expired or not found. Run OCR again or send cropped_image.",
+                )
+        elif item.cropped_image:
+            try:
+                image_bytes = _decode_image_base64(item.cropped_image)
+            except HTTPException as e:
+                raise HTTPException(status_code=e.status_code, detail=f"items[{index}]: {e.detail}")
+        else:
+            raise HTTPException(status_code=400, detail=f"items[{index}]: cropped_image or crop_handle is required")
+        images.append(image_bytes)
+    return [blob_store.put(image_bytes) if image_bytes else None for image_bytes in images]
+
+
+@app.post("/history/save-batch")
+async def save_ocr_results_batch(payload: SaveBatchRequest, authorization: Optional[str] = Header(None)):
+    """
+    한 저장 세션(파일)의 OCR 결과를 한 번에 저장합니다. /history/save를 영역마다 호출하는 대신 사용합니다.
+    모든 항목을 한 트랜잭션으로 저장하고(전부 저장되거나 전부 실패), 크레딧은 저장 세션 내 페이지당 1회만 차감합니다.
+    """
+    try:
+        email = require_auth_email(authorization)
+        if not payload.filename.strip():
+            raise HTTPException(status_code=400, detail="filename is required")
+        if not payload.items:
+            raise HTTPException(status_code=400, detail="items is empty")
+        if len(payload.items) > SAVE_BATCH_MAX_ITEMS:
+            raise HTTPException(status_code=400, detail=f"Too many items (max {SAVE_BATCH_MAX_ITEMS})")
+
+        image_hashes = await run_in_threadpool(_store_batch_images, payload.items)
+        items = [
+            {"extracted_text": item.extracted_text, "image_sha256": image_sha256, "page_number": item.page_number}
+            for item, image_sha256 in zip(payload.items, image_hashes)
+        ]
+        ocr_records, credits_balance, charged_pages = await run_in_threadpool(
+            run_write_transaction, _add_ocr_records_with_charge,
+            email, payload.filename, payload.save_session_id, items,
+        )
+        recent_savings_feed.invalidate()
+
+        return {
+            "filename": payload.filename,
+            "save_session_id": ocr_records[0].save_session_id,
+            "saved_count": len(ocr_records),
+            "records": [
+                {
+                    "id": record.id,
+                    "image_sha256": record.image_sha256,
+                    "image_url": _record_image_url(record),
+                    "timestamp": record.timestamp.isoformat(),
+                    "page_number": record.page_number,
+                }
+                for record in ocr_records
+            ],
+            "charged_pages": charged_pages,
+            "credits_charged": charged_pages * OCR_SAVE_COST_PER_PAGE,
+            "user_email": email,
+            "credits_balance": credits_balance,
+        }
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Failed to save OCR results: {str(e)}")
+
+
+async def _process_ocr_job(job: dict) -> dict:
+    """
+    작업 큐 handler: OCR 수행 후 결과를 OCRRecord로 저장(저장 세션 내 페이지당 1회 차감)합니다.
+    레코드 저장과 작업 완료(succeeded, record_id)는 한 트랜잭션이라, 저장 후 재시작/취소로 작업이 다시 처리되어도
+    레코드가 두 번 저장되지 않습니다.
+    """
+    try:
+        result = await run_ocr(
+            job["image_data"] or b"", job["filename"], job["page_number"], job["custom_prompt"],
+            True, job["image_mode"],
+        )
+    except HTTPException as e:
+        raise JobError(str(e.detail))
+
+    def save_and_finish(db: Session, image_sha256: Optional[str]) -> int:
+        ocr_record, _ = _add_ocr_record_with_charge(
+            db, job["email"], result["extracted_text"], image_sha256,
+            job["filename"] or "unknown", job["page_number"], job["save_session_id"],
+        )
+        if not finish_job(db, job["id"], "succeeded", result["extracted_text"], ocr_record.id):
+            # 그사이 종료 처리로 대기열에 되돌아간 작업: 저장을 취소하고 다음 처리에 맡김
+            raise RuntimeError(f"job {job['id']} is no longer running")
+        return ocr_record.id
+
+    def save() -> int:
+        image_sha256 = blob_store.put(job["image_data"]) if job["image_data"] else None
+        record_id = run_write_transaction(save_and_finish, image_sha256)
+        recent_savings_feed.invalidate()
+        return record_id
+
+    try:
+        record_id = await run_in_threadpool(save)
+    except HTTPException as e:
+        # 크레딧 부족 등: OCR 결과는 작업에 남겨 둠
+        raise JobError(str(e.detail), result_text=result["extracted_text"])
+    return {"result_text": result["extracted_text"], "record_id": record_id}
+
+
+job_queue = OCRJobQueue(handler=_process_ocr_job)
+
+
+@app.on_event("startup")
+async def _startup_job_workers():
+    await job_queue.start()
+
+
+@app.on_event("shutdown")
+async def _shutdown_job_workers():
+    await job_queue.stop()
+
+
+@app.post("/jobs", status_code=202)
+async def create_ocr_job(
+    file: UploadFile = File(...),
+    filename: str = Form(None),
+    page_number: int = Form(None),
+    custom_prompt: str = Form(None),
+    image_mode: str = Form(None),
+    save_session_id: str = Form(None),
+    authorization: Optional[str] = Header(None),
+):
+    """
+    OCR 작업을 대기열에 등록합니다. 결과는 완료 시 OCRRecord(히스토리)에 저장됩니다.
+    save_session_id가 같은 작업끼리는 /history/save와 동일하게 페이지당 1회만 차감됩니다.
+    """
+    email = require_auth_email(authorization)
+    file_bytes = await file.read()
+    if len(file_bytes) == 0:
+        raise HTTPException(status_code=400, detail="Empty file received")
+    try:
+        image_mode = resolve_image_mode(image_mode)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    job = await run_in_threadpool(
+        job_queue.submit,
+        email,
+        file_bytes,
+        filename or file.filename,
+        page_number,
+        custom_prompt,
+        image_mode,
+        (save_session_id or "").strip() or f"job-{uuid.uuid4().hex}",
+    )
+    job_queue.notify()
+    return job
+
+
+@app.get("/jobs/stats")
+async def ocr_job_stats(window_minutes: int = Query(60, ge=1, le=24 * 60)):
+    """
+    작업 큐 지표: 대기열 길이, 실행 중 수, 최근 완료 작업의 대기/실행 시간 (추론 서버 규모 산정용).
+    """
+    return await run_in_threadpool(job_queue.stats, window_minutes)
+
+
+@app.get("/jobs/{job_id}")
+async def get_ocr_job(job_id: int, authorization: Optional[str] = Header(None)):
+    email = require_auth_email(authorization)
+    job = await run_in_threadpool(job_queue.get, job_id, email)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+@app.get("/jobs")
+async def list_ocr_jobs(
+    status: Optional[str] = Query(None),
+    limit: int = Query(50, ge=1, le=500),
+    authorization: Optional[str] = Header(None),
+):
+    email = require_auth_email(authorization)
+    if status and status not in JOB_STATUSES:
+        raise HTTPException(status_code=400, detail=f"invalid status (expected one of {', '.join(JOB_STATUSES)})")
+    return await run_in_threadpool(job_queue.list_jobs, email, status, limit)
+
+
 @app.get("/billing/user")
-async def get_billing_user(authorization: Optional[str] = Header(None), db: Session = Depends(get_db)):
+async def get_billing_user(authorization: Optional[str] = Header(None), db: AsyncSession = Depends(get_async_db)):
     email = require_auth_email(authorization)
-    user = db.query(UserAccount).filter(UserAccount.email == email).first()
+    user = await db.scalar(select(UserAccount).where(UserAccount.email == email))
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return {"email": user.email, "plan_key": user.plan_key, "credits_balance": user.credits_balance}
 
 
+def _encode_usage_cursor(created_at: datetime, kind_rank: int, row_id: int) -> str:
+    raw = json.dumps({"t": created_at.isoformat(), "k": kind_rank, "i": row_id}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def _decode_usage_cursor(cursor: str) -> Tuple[datetime, int, int]:
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        value = json.loads(raw)
+        return datetime.fromisoformat(value["t"]), int(value["k"]), int(value["i"])
+    except Exception:
+        raise HTTPException(status_code=400, detail="invalid cursor")
+
+
+def _billing_usage_by_file(db: Session, email: str, limit: int, cursor: Optional[str], response: Response) -> List[dict]:
+    """
+    파일(업로드/저장 세션) 단위 이용 내역, 최신순 keyset 페이지네이션.
+    - OCR 차감: save_sessions 요약 1행 = 한 줄 (pages_count/areas_per_page/delta)
+    - 구매 등 기타: 기존 ledger row 형태 (filename 없을 수 있음)
+    두 목록을 (시각, 종류, id) 내림차순으로 합칩니다. 다음 페이지가 있으면 X-Next-Cursor 헤더로 전달합니다.
+    """
+    from sqlalchemy import tuple_
+
+    # 같은 시각이면 OCR 세션(1)이 기타 ledger(0)보다 먼저
+    sessions = db.query(SaveSession).filter(SaveSession.email == email)
+    others = db.query(CreditLedger).filter(CreditLedger.email == email, CreditLedger.reason != OCR_SAVE_CHARGE_REASON)
+    if cursor:
+        cursor_at, cursor_kind, cursor_id = _decode_usage_cursor(cursor)
+        if cursor_kind == 1:
+            sessions = sessions.filter(tuple_(SaveSession.last_charged_at, SaveSession.id) < tuple_(cursor_at, cursor_id))
+            others = others.filter(CreditLedger.created_at <= cursor_at)
+        else:
+            sessions = sessions.filter(SaveSession.last_charged_at < cursor_at)
+            others = others.filter(tuple_(CreditLedger.created_at, CreditLedger.id) < tuple_(cursor_at, cursor_id))
+    session_rows = sessions.order_by(SaveSession.last_charged_at.desc(), SaveSession.id.desc()).limit(limit + 1).all()
+    other_rows = others.order_by(CreditLedger.created_at.desc(), CreditLedger.id.desc()).limit(limit + 1).all()
+
+    merged = [(row.last_charged_at, 1, row.id, session_to_usage(row)) for row in session_rows]
+    for r in other_rows:
+        merged.append((
+            r.created_at or datetime.min, 0, r.id,
+            {
+                "kind": "ledger",
+                "delta": r.delta,
+                "reason": r.reason,
+                "filename": r.filename,
+                "page_key": r.page_key,
+                "save_session_id": r.save_session_id,
+                "meta": r.meta,
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+            },
+        ))
+    merged.sort(key=lambda x: x[:3], reverse=True)
+    if len(merged) > limit:
+        last = merged[limit - 1]
+        response.headers["X-Next-Cursor"] = _encode_usage_cursor(last[0], last[1], last[2])
+    return [item for *_, item in merged[:limit]]
+
+
 @app.get("/billing/usage")
 async def get_billing_usage(
+    response: Response,
     authorization: Optional[str] = Header(None),
     limit: int = 100,
     mode: str = "raw",
-    db: Session = Depends(get_db),
+    cursor: Optional[str] = Query(None),
+    db: AsyncSession = Depends(get_async_db),
 ):
+    """
+    이용 내역. mode=raw: ledger 최신순, mode=file: 저장 세션(파일) 단위 (cursor로 다음 페이지, X-Next-Cursor 헤더)
+    """
     email = require_auth_email(authorization)
 
     mode = (mode or "raw").strip().lower()
@@ -1221,108 +1920,14 @@ async def get_billing_usage(
         raise HTTPException(status_code=400, detail="invalid mode")
 
     if mode == "file":
-        # 파일(업로드/저장 세션) 단위 집계
-        # - OCR 차감: (filename, save_session_id) 단위로 pages_count/areas_per_page/delta를 한 줄로 반환
-        # - 구매 등 기타: 기존 ledger row 형태로 반환 (filename 없을 수 있음)
-        from sqlalchemy import func, case
-
-        max_limit = max(1, min(limit, 200))
-
-        # 최근 OCR 차감 세션들부터 가져오기
-        ocr_groups = (
-            db.query(
-                CreditLedger.filename.label("filename"),
-                CreditLedger.save_session_id.label("save_session_id"),
-                func.sum(CreditLedger.delta).label("delta_sum"),
-                func.max(CreditLedger.created_at).label("created_at"),
-            )
-            .filter(
-                CreditLedger.email == email,
-                CreditLedger.reason == "ocr_save_page_charge",
-                CreditLedger.filename.isnot(None),
-                CreditLedger.save_session_id.isnot(None),
-            )
-            .group_by(CreditLedger.filename, CreditLedger.save_session_id)
-            .order_by(func.max(CreditLedger.created_at).desc())
-            .limit(max_limit)
-            .all()
-        )
-
-        results = []
-        for g in ocr_groups:
-            # 이 세션에서 저장된 OCRRecord로 pages/areas 계산
-            rec_stats = (
-                db.query(
-                    func.count(OCRRecord.id).label("total_records"),
-                    func.count(func.distinct(OCRRecord.page_number)).label("distinct_pages"),
-                    func.sum(case((OCRRecord.page_number.is_(None), 1), else_=0)).label("null_pages"),
-                )
-                .filter(
-                    OCRRecord.email == email,
-                    OCRRecord.filename == g.filename,
-                    OCRRecord.save_session_id == g.save_session_id,
-                )
-                .one()
-            )
-
-            distinct_pages = int(rec_stats.distinct_pages or 0)
-            has_null_page = (rec_stats.null_pages or 0) > 0
-            pages_count = distinct_pages + (1 if has_null_page else 0)
-            if pages_count <= 0:
-                pages_count = 1
-
-            total_records = int(rec_stats.total_records or 0)
-            # “몇개 영역”은 페이지당 영역 개수로 표기(=총 레코드 / 페이지수)
-            areas_per_page = (total_records / pages_count) if pages_count else 0
-
-            results.append(
-                {
-                    "kind": "ocr",
-                    "filename": g.filename,
-                    "pages_count": pages_count,
-                    "areas_per_page": round(areas_per_page, 2),
-                    "delta": int(g.delta_sum or 0),
-                    "created_at": g.created_at.isoformat() if g.created_at else None,
-                    "save_session_id": g.save_session_id,
-                }
-            )
+        return await db.run_sync(_billing_usage_by_file, email, max(1, min(limit, 200)), cursor, response)
 
-        # 최근 구매/지급(ocr 이외)도 함께 보여주기 (limit의 1/2 정도)
-        other_rows = (
-            db.query(CreditLedger)
-            .filter(CreditLedger.email == email, CreditLedger.reason != "ocr_save_page_charge")
-            .order_by(CreditLedger.created_at.desc())
-            .limit(max(1, max_limit // 2))
-            .all()
-        )
-        for r in other_rows:
-            results.append(
-                {
-                    "kind": "ledger",
-                    "delta": r.delta,
-                    "reason": r.reason,
-                    "filename": r.filename,
-                    "page_key": r.page_key,
-                    "save_session_id": r.save_session_id,
-                    "meta": r.meta,
-                    "created_at": r.created_at.isoformat() if r.created_at else None,
-                }
-            )
-
-        # 전체를 created_at 기준으로 섞어 정렬
-        def _ts(x):
-            return x.get("created_at") or ""
-
-        results.sort(key=_ts, reverse=True)
-        return results[:max_limit]
-
-    rows = (
-        db.query(CreditLedger)
-        .filter(CreditLedger.email == email)
+    rows = (await db.scalars(
+        select(CreditLedger)
+        .where(CreditLedger.email == email)
         .order_by(CreditLedger.created_at.desc())
         .limit(max(1, min(limit, 500)))
-        .all()
-    )
+    )).all()
     return [
         {
             "id": r.id,
@@ -1344,7 +1949,7 @@ class BillingPurchaseRequest(BaseModel):
 
 
 @app.post("/billing/purchase")
-async def billing_purchase(payload: BillingPurchaseRequest, authorization: Optional[str] = Header(None), db: Session = Depends(get_db)):
+async def billing_purchase(payload: BillingPurchaseRequest, authorization: Optional[str] = Header(None)):
     """
     임시 구매 API (결제 없이 성공 처리)
     - 로그인 사용자 기준으로 plan 설정 + credits 지급 + ledger 기록
@@ -1369,41 +1974,38 @@ async def billing_purchase(payload: BillingPurchaseRequest, authorization: Optio
     credits_granted = int(plan["credits"])
     amount_krw = plan["amount_krw"]
 
-    user = db.query(UserAccount).filter(UserAccount.email == email).first()
-    if not user:
-        user = UserAccount(email=email, plan_key=None, credits_balance=0)
-        db.add(user)
-        db.flush()
+    def tx(db: Session) -> int:
+        ensure_account(db, email)
 
-    # 구매/지급 기록
-    db.add(
-        Purchase(
-            email=email,
-            plan_key=plan_key,
-            amount_krw=amount_krw,
-            credits_granted=credits_granted,
+        # 구매/지급 기록
+        db.add(
+            Purchase(
+                email=email,
+                plan_key=plan_key,
+                amount_krw=amount_krw,
+                credits_granted=credits_granted,
+            )
         )
-    )
-    user.plan_key = plan_key
-    user.credits_balance = (user.credits_balance or 0) + credits_granted
+        credits_balance = grant_credits(db, email, credits_granted, plan_key)
 
-    db.add(
-        CreditLedger(
-            email=email,
-            delta=credits_granted,
-            reason="purchase_mock",
-            filename=None,
-            page_key=-1,
-            save_session_id=f"mock-{plan_key}-{int(datetime.utcnow().timestamp())}",
-            meta=json.dumps(
-                {"plan_key": plan_key, "amount_krw": amount_krw, "credits_granted": credits_granted},
-                ensure_ascii=False,
-            ),
+        db.add(
+            CreditLedger(
+                email=email,
+                delta=credits_granted,
+                reason="purchase_mock",
+                filename=None,
+                page_key=-1,
+                save_session_id=f"mock-{plan_key}-{int(datetime.utcnow().timestamp())}",
+                meta=json.dumps(
+                    {"plan_key": plan_key, "amount_krw": amount_krw, "credits_granted": credits_granted},
+                    ensure_ascii=False,
+                ),
+            )
         )
-    )
+        return credits_balance
 
-    db.commit()
-    return {"email": user.email, "plan_key": user.plan_key, "credits_balance": user.credits_balance, "credits_granted": credits_granted}
+    credits_balance = await run_in_threadpool(run_write_transaction, tx)
+    return {"email": email, "plan_key": plan_key, "credits_balance": credits_balance, "credits_granted": credits_granted}
 
 
 @app.delete("/history/file/{filename}")
@@ -1411,7 +2013,6 @@ async def delete_file_records(
     filename: str, 
     first_timestamp: str = Query(None, description="그룹의 첫 타임스탬프 (ISO 형식)"),
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db)
 ):
     """
     특정 파일의 모든 OCR 기록을 삭제합니다.
@@ -1422,7 +2023,7 @@ async def delete_file_records(
         
         email = require_auth_email(authorization)
         # 파일명 + 소유자 이메일로 필터링
-        query = db.query(OCRRecord).filter(OCRRecord.email == email, OCRRecord.filename == filename)
+        filters = [OCRRecord.email == email, OCRRecord.filename == filename]
         
         # first_timestamp가 제공되면 해당 그룹만 삭제
         if first_timestamp:
@@ -1436,38 +2037,45 @@ async def delete_file_records(
                 # 10분 범위 내의 레코드 찾기 (그룹 임계값과 동일)
                 from datetime import timedelta
                 threshold = timedelta(minutes=10)
-                query = query.filter(
+                filters += [
                     OCRRecord.timestamp >= group_datetime - threshold,
                     OCRRecord.timestamp <= group_datetime + threshold
-                )
+                ]
             except Exception as e:
                 raise HTTPException(status_code=400, detail=f"Invalid timestamp format: {str(e)}")
         
-        records = query.all()
-        
-        if not records:
-            raise HTTPException(status_code=404, detail="No records found for this file")
-        
-        # 레코드 ID 수집
-        deleted_ids = [record.id for record in records]
-        deleted_count = len(deleted_ids)
-        
-        # 모든 레코드 삭제
-        for record in records:
-            db.delete(record)
+        def tx(db: Session) -> List[int]:
+            records = db.query(OCRRecord).filter(*filters).all()
+            
+            if not records:
+                raise HTTPException(status_code=404, detail="No records found for this file")
+            
+            # 레코드 ID 수집
+            deleted_ids = [record.id for record in records]
+            keys = [group_key(record.filename, record.timestamp) for record in records]
+            session_keys = [(record.save_session_id, record.filename) for record in records]
+            
+            # 모든 레코드 삭제
+            for record in records:
+                db.delete(record)
+            
+            db.flush()
+            refresh_history_groups(db, email, keys)
+            refresh_save_sessions(db, email, session_keys)
+            return deleted_ids
         
-        db.commit()
+        deleted_ids = await run_in_threadpool(run_write_transaction, tx)
+        recent_savings_feed.invalidate()
         
         return {
             "message": f"File records deleted successfully",
             "filename": filename,
-            "deleted_count": deleted_count,
+            "deleted_count": len(deleted_ids),
             "deleted_ids": deleted_ids
         }
     except HTTPException:
         raise
     except Exception as e:
-        db.rollback()
         raise HTTPException(status_code=500, detail=f"Failed to delete file records: {str(e)}")
 
 
@@ -1619,61 +2227,65 @@ class PromptResponse(BaseModel):
 
 # 프롬프트 CRUD API
 @app.post("/prompts", response_model=PromptResponse)
-async def create_prompt(prompt_data: PromptCreate, db: Session = Depends(get_db)):
+async def create_prompt(prompt_data: PromptCreate):
     """프롬프트 생성"""
-    db_prompt = Prompt(
-        name=prompt_data.name,
-        prompt=prompt_data.prompt
-    )
-    db.add(db_prompt)
-    db.commit()
-    db.refresh(db_prompt)
-    return db_prompt
+    def tx(db: Session) -> Prompt:
+        db_prompt = Prompt(
+            name=prompt_data.name,
+            prompt=prompt_data.prompt
+        )
+        db.add(db_prompt)
+        db.flush()
+        return db_prompt
+
+    return await run_in_threadpool(run_write_transaction, tx)
 
 
 @app.get("/prompts", response_model=List[PromptResponse])
-async def get_prompts(db: Session = Depends(get_db)):
+async def get_prompts(db: AsyncSession = Depends(get_async_db)):
     """모든 프롬프트 조회 (최신순)"""
-    prompts = db.query(Prompt).order_by(Prompt.created_at.desc()).all()
+    prompts = (await db.scalars(select(Prompt).order_by(Prompt.created_at.desc()))).all()
     return prompts
 
 
 @app.get("/prompts/{prompt_id}", response_model=PromptResponse)
-async def get_prompt(prompt_id: int, db: Session = Depends(get_db)):
+async def get_prompt(prompt_id: int, db: AsyncSession = Depends(get_async_db)):
     """특정 프롬프트 조회"""
-    prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+    prompt = await db.scalar(select(Prompt).where(Prompt.id == prompt_id))
     if not prompt:
         raise HTTPException(status_code=404, detail="Prompt not found")
     return prompt
 
 
 @app.put("/prompts/{prompt_id}", response_model=PromptResponse)
-async def update_prompt(prompt_id: int, prompt_data: PromptUpdate, db: Session = Depends(get_db)):
+async def update_prompt(prompt_id: int, prompt_data: PromptUpdate):
     """프롬프트 수정"""
-    prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
-    if not prompt:
-        raise HTTPException(status_code=404, detail="Prompt not found")
-    
-    if prompt_data.name is not None:
-        prompt.name = prompt_data.name
-    if prompt_data.prompt is not None:
-        prompt.prompt = prompt_data.prompt
-    prompt.updated_at = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(prompt)
-    return prompt
+    def tx(db: Session) -> Prompt:
+        prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+        if not prompt:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+        
+        if prompt_data.name is not None:
+            prompt.name = prompt_data.name
+        if prompt_data.prompt is not None:
+            prompt.prompt = prompt_data.prompt
+        prompt.updated_at = datetime.utcnow()
+        db.flush()
+        return prompt
+
+    return await run_in_threadpool(run_write_transaction, tx)
 
 
 @app.delete("/prompts/{prompt_id}")
-async def delete_prompt(prompt_id: int, db: Session = Depends(get_db)):
+async def delete_prompt(prompt_id: int):
     """프롬프트 삭제"""
-    prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
-    if not prompt:
-        raise HTTPException(status_code=404, detail="Prompt not found")
-    
-    db.delete(prompt)
-    db.commit()
+    def tx(db: Session) -> None:
+        prompt = db.query(Prompt).filter(Prompt.id == prompt_id).first()
+        if not prompt:
+            raise HTTPException(status_code=404, detail="Prompt not found")
+        db.delete(prompt)
+
+    await run_in_threadpool(run_write_transaction, tx)
     return {"message": "Prompt deleted successfully"}
 
 
@@ -1701,15 +2313,18 @@ class ExtractKeysResponse(BaseModel):
 
 # 추출 항목(Keys) CRUD API
 @app.post("/extract-keys", response_model=ExtractKeysResponse)
-async def create_extract_keys(keys_data: ExtractKeysCreate, db: Session = Depends(get_db)):
+async def create_extract_keys(keys_data: ExtractKeysCreate):
     """추출 항목(Keys) 생성"""
-    db_keys = ExtractKeys(
-        name=keys_data.name,
-        keys=json.dumps(keys_data.keys, ensure_ascii=False)
-    )
-    db.add(db_keys)
-    db.commit()
-    db.refresh(db_keys)
+    def tx(db: Session) -> ExtractKeys:
+        db_keys = ExtractKeys(
+            name=keys_data.name,
+            keys=json.dumps(keys_data.keys, ensure_ascii=False)
+        )
+        db.add(db_keys)
+        db.flush()
+        return db_keys
+
+    db_keys = await run_in_threadpool(run_write_transaction, tx)
     return {
         "id": db_keys.id,
         "name": db_keys.name,
@@ -1720,9 +2335,9 @@ async def create_extract_keys(keys_data: ExtractKeysCreate, db: Session = Depend
 
 
 @app.get("/extract-keys", response_model=List[ExtractKeysResponse])
-async def get_extract_keys(db: Session = Depends(get_db)):
+async def get_extract_keys(db: AsyncSession = Depends(get_async_db)):
     """모든 추출 항목(Keys) 조회 (최신순)"""
-    keys_list = db.query(ExtractKeys).order_by(ExtractKeys.created_at.desc()).all()
+    keys_list = (await db.scalars(select(ExtractKeys).order_by(ExtractKeys.created_at.desc()))).all()
     return [
         {
             "id": k.id,
@@ -1736,9 +2351,9 @@ async def get_extract_keys(db: Session = Depends(get_db)):
 
 
 @app.get("/extract-keys/{keys_id}", response_model=ExtractKeysResponse)
-async def get_extract_key(keys_id: int, db: Session = Depends(get_db)):
+async def get_extract_key(keys_id: int, db: AsyncSession = Depends(get_async_db)):
     """특정 추출 항목(Keys) 조회"""
-    keys = db.query(ExtractKeys).filter(ExtractKeys.id == keys_id).first()
+    keys = await db.scalar(select(ExtractKeys).where(ExtractKeys.id == keys_id))
     if not keys:
         raise HTTPException(status_code=404, detail="ExtractKeys not found")
     return {
@@ -1751,20 +2366,22 @@ async def get_extract_key(keys_id: int, db: Session = Depends(get_db)):
 
 
 @app.put("/extract-keys/{keys_id}", response_model=ExtractKeysResponse)
-async def update_extract_keys(keys_id: int, keys_data: ExtractKeysUpdate, db: Session = Depends(get_db)):
+async def update_extract_keys(keys_id: int, keys_data: ExtractKeysUpdate):
     """추출 항목(Keys) 수정"""
-    keys = db.query(ExtractKeys).filter(ExtractKeys.id == keys_id).first()
-    if not keys:
-        raise HTTPException(status_code=404, detail="ExtractKeys not found")
-    
-    if keys_data.name is not None:
-        keys.name = keys_data.name
-    if keys_data.keys is not None:
-        keys.keys = json.dumps(keys_data.keys, ensure_ascii=False)
-    keys.updated_at = datetime.utcnow()
-    
-    db.commit()
-    db.refresh(keys)
+    def tx(db: Session) -> ExtractKeys:
+        keys = db.query(ExtractKeys).filter(ExtractKeys.id == keys_id).first()
+        if not keys:
+            raise HTTPException(status_code=404, detail="ExtractKeys not found")
+        
+        if keys_data.name is not None:
+            keys.name = keys_data.name
+        if keys_data.keys is not None:
+            keys.keys = json.dumps(keys_data.keys, ensure_ascii=False)
+        keys.updated_at = datetime.utcnow()
+        db.flush()
+        return keys
+
+    keys = await run_in_threadpool(run_write_transaction, tx)
     return {
         "id": keys.id,
         "name": keys.name,
@@ -1775,14 +2392,15 @@ async def update_extract_keys(keys_id: int, keys_data: ExtractKeysUpdate, db: Se
 
 
 @app.delete("/extract-keys/{keys_id}")
-async def delete_extract_keys(keys_id: int, db: Session = Depends(get_db)):
+async def delete_extract_keys(keys_id: int):
     """추출 항목(Keys) 삭제"""
-    keys = db.query(ExtractKeys).filter(ExtractKeys.id == keys_id).first()
-    if not keys:
-        raise HTTPException(status_code=404, detail="ExtractKeys not found")
-    
-    db.delete(keys)
-    db.commit()
+    def tx(db: Session) -> None:
+        keys = db.query(ExtractKeys).filter(ExtractKeys.id == keys_id).first()
+        if not keys:
+            raise HTTPException(status_code=404, detail="ExtractKeys not found")
+        db.delete(keys)
+
+    await run_in_threadpool(run_write_transaction, tx)
     return {"message": "ExtractKeys deleted successfully"}
 
 
@@ -1802,7 +2420,7 @@ class OCRFileChatRequest(BaseModel):
 async def chat_with_ocr_file(
     payload: OCRFileChatRequest,
     authorization: Optional[str] = Header(None),
-    db: Session = Depends(get_db),
+    db: AsyncSession = Depends(get_async_db),
 ):
     """
     OCR History의 '파일(그룹)' 단위로 OCR 텍스트를 DB에서 모아서,
@@ -1819,7 +2437,10 @@ async def chat_with_ocr_file(
             raise HTTPException(status_code=400, detail="question is required")
 
         email = require_auth_email(authorization)
-        query = db.query(OCRRecord).filter(OCRRecord.email == email, OCRRecord.filename == payload.filename)
+        query = (
+            select(OCRRecord.id, OCRRecord.page_number, OCRRecord.extracted_text)
+            .where(OCRRecord.email == email, OCRRecord.filename == payload.filename)
+        )
 
         # first_timestamp가 있으면 해당 날짜(일 단위) 그룹만 대상으로 제한
         if payload.first_timestamp:
@@ -1830,7 +2451,7 @@ async def chat_with_ocr_file(
                     group_dt = group_dt.astimezone(timezone.utc).replace(tzinfo=None)
                 day_start = datetime(group_dt.year, group_dt.month, group_dt.day, 0, 0, 0)
                 day_end = day_start + timedelta(days=1)
-                query = query.filter(
+                query = query.where(
                     OCRRecord.timestamp >= day_start,
                     OCRRecord.timestamp < day_end
                 )
@@ -1839,11 +2460,13 @@ async def chat_with_ocr_file(
 
         # 페이지/ID 순으로 정렬 (페이지 없는 이미지는 뒤로) - SQLite 호환 정렬
         from sqlalchemy import case
-        records = query.order_by(
+        records = (await db.execute(query.order_by(
             case((OCRRecord.page_number.is_(None), 1), else_=0),
             OCRRecord.page_number.asc(),
             OCRRecord.id.asc()
-        ).all()
+        ))).all()
+        # 모델 응답을 기다리는 동안 DB 연결을 잡고 있지 않도록 읽기 트랜잭션을 끝냄
+        await db.close()
 
         if not records:
             raise HTTPException(status_code=404, detail="No OCR records found for this file group")
@@ -1890,8 +2513,7 @@ async def chat_with_ocr_file(
 
         chat_messages.append({"role": "user", "content": payload.question.strip()})
 
-        resp = ollama.chat(
-            model="qwen2.5vl:7b",
+        resp = await inference_client.chat(
             messages=chat_messages,
             options={
                 "temperature": 0.2,
@@ -0,0 +1,342 @@
+"""
+OCR 결과 캐시 (내용 주소 기반).
+
+같은 크롭 영역을 다시 열거나 저장 실패 후 재시도할 때 동일한 이미지를 모델에 다시 보내지 않도록,
+sha256(이미지 바이트) + 시스템/유저 프롬프트 + 모델명 + 생성 옵션을 키로 결과를 저장합니다.
+
+- 1차: 메모리 LRU (바이트 예산 OCR_CACHE_MEMORY_BYTES)
+- 2차: SQLite ocr_cache 테이블 (용량 예산 OCR_CACHE_DB_BYTES, 합계는 누적 계산하고 accessed_at은 OCR_CACHE_TOUCH_SECONDS마다만 갱신)
+- 두 계층 모두 TTL(OCR_CACHE_TTL_SECONDS)이 지나면 만료
+
+캐시는 완료된 결과만 재사용하므로, 같은 크롭이 동시에 들어오는 경우(더블 클릭, 같은 PDF를 연 두 탭)는
+SingleFlight로 진행 중인 모델 호출 1건을 함께 기다리게 합니다(캐시 비활성화 여부와 무관).
+"""
+
+import asyncio
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
+
+from database import OCRCacheEntry, SessionLocal
+
+OCR_CACHE_ENABLED = os.getenv("OCR_CACHE_ENABLED", "1") not in ("0", "false", "False", "")
+OCR_CACHE_TTL_SECONDS = int(os.getenv("OCR_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))  # 기본 7일
+OCR_CACHE_MEMORY_BYTES = int(os.getenv("OCR_CACHE_MEMORY_BYTES", str(64 * 1024 * 1024)))  # 기본 64MB
+OCR_CACHE_DB_BYTES = int(os.getenv("OCR_CACHE_DB_BYTES", str(256 * 1024 * 1024)))  # 기본 256MB
+# DB 히트 때 accessed_at(LRU 순서)은 이 간격보다 오래됐을 때만 갱신 (히트마다 쓰기/커밋하지 않도록)
+OCR_CACHE_TOUCH_SECONDS = int(os.getenv("OCR_CACHE_TOUCH_SECONDS", "600"))  # 기본 10분
+# DB 계층 용량은 프로세스 안에서 누적 계산하고, 다른 워커의 저장분은 이 간격마다 SUM으로 다시 맞춤
+OCR_CACHE_DB_RESYNC_SECONDS = 300
+
+# 후처리 로직(clean_ocr_response 등)이 바뀌면 올려서 기존 캐시를 무효화
+OCR_CACHE_VERSION = 3
+
+
+def image_sha256(image_bytes: bytes) -> str:
+    return hashlib.sha256(image_bytes).hexdigest()
+
+
+def make_cache_key(
+    image_hash: str,
+    system_prompt: str,
+    user_prompt: str,
+    model: str,
+    options: Dict[str, Any],
+    **extra: Any,
+) -> str:
+    """
+    캐시 키 생성. extra에는 결과에 영향을 주는 그 밖의 설정(후처리 모드 등)을 넣습니다.
+    """
+    payload = json.dumps(
+        {
+            "v": OCR_CACHE_VERSION,
+            "image": image_hash,
+            "system": system_prompt,
+            "user": user_prompt,
+            "model": model,
+            "options": options,
+            "extra": extra,
+        },
+        sort_keys=True,
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class OCRResultCache:
+    """
+    메모리 LRU + SQLite 2계층 캐시.
+    get/put은 DB I/O가 있으므로 async 엔드포인트에서는 run_in_threadpool로 호출합니다.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = OCR_CACHE_ENABLED,
+        ttl_seconds: int = OCR_CACHE_TTL_SECONDS,
+        memory_bytes: int = OCR_CACHE_MEMORY_BYTES,
+        db_bytes: int = OCR_CACHE_DB_BYTES,
+    ):
+        self.enabled = enabled
+        self.ttl_seconds = ttl_seconds
+        self.memory_bytes = memory_bytes
+        self.db_bytes = db_bytes
+
+        # key -> (extracted_text, size_bytes, 저장 시각(epoch 초))
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._memory_size = 0
+        self._lock = threading.Lock()
+
+        # DB 계층 size_bytes 합계 (None: 아직 모름 → 다음 put에서 SUM으로 계산)
+        self._db_size: Optional[int] = None
+        self._db_size_synced_at = 0.0
+
+        self.memory_hits = 0
+        self.db_hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.memory_evictions = 0
+        self.db_evictions = 0
+        self.expired = 0
+
+    # 메모리 계층
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            value, size, stored_at = entry
+            if time.time() - stored_at > self.ttl_seconds:
+                self._memory.pop(key, None)
+                self._memory_size -= size
+                self.expired += 1
+                return None
+            self._memory.move_to_end(key)
+            return value
+
+    def _memory_put(self, key: str, value: str, stored_at: float) -> None:
+        size = len(value.encode("utf-8"))
+        if size > self.memory_bytes:
+            return
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._memory_size -= old[1]
+            self._memory[key] = (value, size, stored_at)
+            self._memory_size += size
+            while self._memory_size > self.memory_bytes and self._memory:
+                _, (_, evicted_size, _) = self._memory.popitem(last=False)
+                self._memory_size -= evicted_size
+                self.memory_evictions += 1
+
+    # DB 계층
+    def _db_get(self, key: str) -> Optional[tuple]:
+        db = SessionLocal()
+        try:
+            row = db.query(OCRCacheEntry).filter(OCRCacheEntry.cache_key == key).first()
+            if row is None:
+                return None
+            now = datetime.utcnow()
+            if row.created_at and now - row.created_at > timedelta(seconds=self.ttl_seconds):
+                size = row.size_bytes or 0
+                db.delete(row)
+                db.commit()
+                self._adjust_db_size(-size)
+                self.expired += 1
+                return None
+            if row.accessed_at is None or now - row.accessed_at > timedelta(seconds=OCR_CACHE_TOUCH_SECONDS):
+                row.accessed_at = now
+                db.commit()
+            stored_at = (row.created_at - datetime(1970, 1, 1)).total_seconds() if row.created_at else time.time()
+            return row.extracted_text, stored_at
+        finally:
+            db.close()
+
+    def _db_put(self, key: str, value: str) -> None:
+        size = len(value.encode("utf-8"))
+        now = datetime.utcnow()
+        db = SessionLocal()
+        try:
+            row = db.query(OCRCacheEntry).filter(OCRCacheEntry.cache_key == key).first()
+            if row is None:
+                previous = 0
+                db.add(OCRCacheEntry(cache_key=key, extracted_text=value, size_bytes=size, created_at=now, accessed_at=now))
+            else:
+                previous = row.size_bytes or 0
+                row.extracted_text = value
+                row.size_bytes = size
+                row.created_at = now
+                row.accessed_at = now
+            try:
+                db.commit()
+            except IntegrityError:
+                # 같은 키를 동시에 저장한 경우: 먼저 저장된 값을 그대로 사용
+                db.rollback()
+                return
+            self._adjust_db_size(size - previous)
+            self._db_evict(db)
+        finally:
+            db.close()
+
+    def _adjust_db_size(self, delta: int) -> None:
+        with self._lock:
+            if self._db_size is not None:
+                self._db_size += delta
+
+    def _db_evict(self, db) -> None:
+        # 만료 항목 정리 (지운 게 있으면 합계를 다시 계산)
+        expire_before = datetime.utcnow() - timedelta(seconds=self.ttl_seconds)
+        removed = db.query(OCRCacheEntry).filter(OCRCacheEntry.created_at < expire_before).delete(synchronize_session=False)
+        if removed:
+            self.expired += removed
+            with self._lock:
+                self._db_size = None
+
+        # 용량 초과 시 가장 오래 사용되지 않은 항목부터 삭제 (합계는 누적값, 가끔만 SUM으로 다시 맞춤)
+        with self._lock:
+            total = self._db_size
+            stale = total is None or time.time() - self._db_size_synced_at > OCR_CACHE_DB_RESYNC_SECONDS
+        if stale:
+            total = db.query(func.coalesce(func.sum(OCRCacheEntry.size_bytes), 0)).scalar() or 0
+            with self._lock:
+                self._db_size = total
+                self._db_size_synced_at = time.time()
+        start_total = total
+        while total > self.db_bytes:
+            victims = (
+                db.query(OCRCacheEntry.cache_key, OCRCacheEntry.size_bytes)
+                .order_by(OCRCacheEntry.accessed_at.asc())
+                .limit(100)
+                .all()
+            )
+            if not victims:
+                break
+            for v in victims:
+                if total <= self.db_bytes:
+                    break
+                db.query(OCRCacheEntry).filter(OCRCacheEntry.cache_key == v.cache_key).delete(synchronize_session=False)
+                total -= v.size_bytes or 0
+                self.db_evictions += 1
+        db.commit()
+        self._adjust_db_size(total - start_total)
+
+    def get(self, key: str) -> Optional[str]:
+        if not self.enabled:
+            return None
+        value = self._memory_get(key)
+        if value is not None:
+            self.memory_hits += 1
+            return value
+        found = self._db_get(key)
+        if found is not None:
+            value, stored_at = found
+            self._memory_put(key, value, stored_at)
+            self.db_hits += 1
+            return value
+        self.misses += 1
+        return None
+
+    def put(self, key: str, value: str) -> None:
+        if not self.enabled:
+            return
+        self._memory_put(key, value, time.time())
+        self._db_put(key, value)
+        self.stores += 1
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.memory_hits + self.db_hits + self.misses
+        with self._lock:
+            memory_entries = len(self._memory)
+            memory_size = self._memory_size
+        return {
+            "enabled": self.enabled,
+            "ttl_seconds": self.ttl_seconds,
+            "memory_entries": memory_entries,
+            "memory_bytes": memory_size,
+            "memory_budget_bytes": self.memory_bytes,
+            "db_bytes": self._db_size,
+            "db_budget_bytes": self.db_bytes,
+            "memory_hits": self.memory_hits,
+            "db_hits": self.db_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.db_hits) / lookups, 4) if lookups else 0.0,
+            "stores": self.stores,
+            "memory_evictions": self.memory_evictions,
+            "db_evictions": self.db_evictions,
+            "expired": self.expired,
+        }
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: "asyncio.Future"):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    같은 키로 동시에 들어온 호출을 진행 중인 1건에 합칩니다(coalescing).
+    - 결과/예외는 기다리는 모든 호출자에게 그대로 전달됩니다.
+    - 호출자 하나가 취소되어도(클라이언트 연결 종료) 다른 호출자가 남아 있으면 작업은 계속되고,
+      마지막 호출자까지 떠나면 작업을 취소합니다.
+    """
+
+    def __init__(self):
+        self._flights: Dict[str, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._flights.get(key) is flight:
+            del self._flights[key]
+
+    async def do(
+        self,
+        key: str,
+        fn: Callable[[], Awaitable[Any]],
+        join: bool = True,
+    ) -> Tuple[Any, bool]:
+        """
+        fn()을 실행하거나 진행 중인 같은 키의 실행에 합류합니다. (결과, 합류 여부)를 반환합니다.
+        join=False이면 기존 실행에 합류하지 않지만, 자신의 실행은 다른 호출자가 합류할 수 있게 등록합니다.
+        """
+        flight = self._flights.get(key) if join else None
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(fn()))
+            if key not in self._flights:
+                self._flights[key] = flight
+                flight.task.add_done_callback(lambda _t, k=key, f=flight: self._forget(k, f))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        finally:
+            flight.waiters -= 1
+            if flight.waiters == 0 and not flight.task.done():
+                flight.task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        calls = self.leaders + self.coalesced
+        return {
+            "in_flight": len(self._flights),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "coalesced_rate": round(self.coalesced / calls, 4) if calls else 0.0,
+        }
+
+
+ocr_cache = OCRResultCache()
+ocr_single_flight = SingleFlight()
@@ -0,0 +1,286 @@
+"""
+OCR 스트리밍 생성 감시(guard).
+
+모델이 "10, 11, 12 … 365" 같은 숫자 나열이나 같은 문구/라인 반복에 빠지면
+clean_ocr_response가 나중에 지우더라도 GPU는 이미 num_predict(16384) 토큰까지 생성한 뒤입니다.
+RepetitionDetector는 토큰 스트림을 받으면서 이런 퇴행(degeneration)을 온라인으로 감지하여
+호출 측이 생성을 즉시 취소하고 유용한 앞부분만 남길 수 있게 합니다.
+
+감지기 종류
+- ngram: 한 라인 안에서 2~MAX_NGRAM 단어 묶음(또는 단어 1개)이 연속으로 반복
+- numeric_sequence: 한 라인 안에서 콤마로 구분된 등차수열 숫자 나열이 길게 이어짐
+- repeated_lines: 같은 라인 또는 여러 줄 블록이 연속으로 반복
+
+발동하면 뒷부분을 버리므로, 표(| --- |, | 0 | 0 |), 달력, "1, 2, …, 13" 같은 정상 문서는 걸리지 않게
+글자/숫자가 없는 토큰(|, ---, :)과 라인은 세지 않고, 임계값은 실제 표 한 행이 만들 수 있는 것보다 훨씬 크게 둡니다.
+"""
+
+import os
+import re
+from typing import Dict, List, Optional, Tuple
+
+OCR_EARLY_STOP_ENABLED = os.getenv("OCR_EARLY_STOP_ENABLED", "1") not in ("0", "false", "False", "")
+
+# 단어 묶음 반복: 묶음 길이별 최소 연속 반복 횟수와 반복 구간 최소 단어 수
+MAX_NGRAM = 8
+NGRAM_MIN_REPEATS = 8
+NGRAM_MIN_SPAN_WORDS = 32
+SINGLE_WORD_MIN_REPEATS = 32
+# 콤마 구분 등차수열 숫자 나열 최소 길이 (clean_ocr_response는 라인 내 10개 이상이면 그 라인에서만 제거)
+NUMERIC_MIN_RUN = 40
+# 라인/블록 반복
+MAX_LINE_BLOCK = 10
+LINE_MIN_REPEATS = 8
+BLOCK_MIN_REPEATS = 4
+# 공백 없이 이어지는 출력을 강제로 끊어 한 단어로 취급할 길이
+MAX_WORD_CHARS = 256
+# 단어/라인 이력 보관 개수 (꼬리 검사에 필요한 최대 길이보다 충분히 크게)
+_HISTORY_LIMIT = 512
+
+_WORD_RE = re.compile(r"\S+(?=\s)")
+_NUMERIC_WORD_RE = re.compile(r"^[(\[]?[\d,，]*\d[\d,，]*[)\].]?$")
+_INT_RE = re.compile(r"\d{1,9}")
+_COMMAS = (",", "，")
+
+
+def _has_content(token: str) -> bool:
+    # 글자/숫자가 하나라도 있는지 (표 구분자 |, ---, : 등은 반복 검사에서 제외)
+    return any(c.isalnum() for c in token)
+
+
+class EarlyStop:
+    """
+    감지 결과: 어떤 감지기가 발동했고, 원문 중 어디까지를 유지할지(keep_chars).
+    """
+
+    __slots__ = ("detector", "keep_chars", "detail")
+
+    def __init__(self, detector: str, keep_chars: int, detail: str):
+        self.detector = detector
+        self.keep_chars = keep_chars
+        self.detail = detail
+
+
+class RepetitionDetector:
+    """
+    feed(chunk)로 토큰 조각을 넣으면, 퇴행이 감지된 시점에 EarlyStop을 반환합니다.
+    단어/라인은 뒤에 공백·개행이 와서 "완성"된 것만 검사하므로 조각 경계에 영향을 받지 않습니다.
+    검사는 매 단어/라인마다 꼬리 부분만 보므로 전체 비용은 출력 길이에 선형입니다.
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+
+        # 아직 완성되지 않은 마지막 단어와 그 시작 오프셋
+        self._word_tail = ""
+        self._word_tail_start = 0
+        # 아직 완성되지 않은 현재 라인 조각들과 그 시작 오프셋
+        self._line_parts: List[str] = []
+        self._line_start = 0
+
+        # 꼬리 검사에 필요한 만큼만 보관
+        # (word, start_offset)
+        self._words: List[Tuple[str, int]] = []
+        # (stripped line, start_offset, end_offset) — 빈 라인 제외
+        self._lines: List[Tuple[str, int, int]] = []
+
+        # 등차수열 추적: (값, 시작 오프셋) 목록과 공차
+        self._num_run: List[Tuple[int, int]] = []
+        self._num_step: Optional[int] = None
+
+        self.chunks = 0
+        self.result: Optional[EarlyStop] = None
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    def feed(self, chunk: str) -> Optional[EarlyStop]:
+        if self.result is not None:
+            return self.result
+        self.chunks += 1
+        self._parts.append(chunk)
+        self.result = self._feed_words(chunk) or self._feed_lines(chunk)
+        return self.result
+
+    def _feed_words(self, chunk: str) -> Optional[EarlyStop]:
+        buf = self._word_tail + chunk
+        base = self._word_tail_start
+        last_end = 0
+        for m in _WORD_RE.finditer(buf):
+            if "\n" in buf[last_end:m.start()]:
+                self._new_line()
+            last_end = m.end()
+            hit = self._on_word(m.group(0), base + m.start())
+            if hit:
+                return hit
+        rest = buf[last_end:]
+        lead = len(rest) - len(rest.lstrip())
+        if "\n" in rest[:lead]:
+            self._new_line()
+        self._word_tail = rest[lead:]
+        self._word_tail_start = base + last_end + lead
+        # 공백 없이 끝없이 이어지는 출력은 일정 길이마다 한 단어로 취급
+        if len(self._word_tail) > MAX_WORD_CHARS:
+            hit = self._on_word(self._word_tail, self._word_tail_start)
+            self._word_tail_start += len(self._word_tail)
+            self._word_tail = ""
+            return hit
+        return None
+
+    def _feed_lines(self, chunk: str) -> Optional[EarlyStop]:
+        pieces = chunk.split("\n")
+        self._line_parts.append(pieces[0])
+        for piece in pieces[1:]:
+            line = "".join(self._line_parts)
+            start = self._line_start
+            end = start + len(line)
+            self._line_start = end + 1
+            self._line_parts = [piece]
+            hit = self._on_line(line, start, end)
+            if hit:
+                return hit
+        return None
+
+    def finish(self) -> str:
+        """
+        유지할 텍스트: 감지가 있었으면 반복 직전까지, 없으면 전체.
+        """
+        text = self.text
+        if self.result is None:
+            return text
+        return text[: self.result.keep_chars]
+
+    # 단어 단위 감지기 (라인이 바뀌면 처음부터 다시 셈)
+    def _new_line(self) -> None:
+        self._words = []
+        self._num_run = []
+        self._num_step = None
+
+    def _on_word(self, word: str, start: int) -> Optional[EarlyStop]:
+        hit = self._check_numeric(word, start)
+        if hit or not _has_content(word):
+            return hit
+        self._words.append((word, start))
+        if len(self._words) > _HISTORY_LIMIT:
+            del self._words[: _HISTORY_LIMIT // 2]
+        return self._check_ngram()
+
+    def _check_ngram(self) -> Optional[EarlyStop]:
+        words = self._words
+        n = len(words)
+        for size in range(1, MAX_NGRAM + 1):
+            if size == 1:
+                repeats = SINGLE_WORD_MIN_REPEATS
+            else:
+                repeats = max(NGRAM_MIN_REPEATS, -(-NGRAM_MIN_SPAN_WORDS // size))
+            span = size * repeats
+            if n < span:
+                continue
+            # 빠른 배제: 주기가 size라면 마지막 단어는 size칸 앞 단어와 같아야 함
+            if words[-1][0] != words[-1 - size][0]:
+                continue
+            base = n - span
+            group = [w for w, _ in words[base:base + size]]
+            if size > 1 and len(set(group)) == 1:
+                # 같은 단어의 반복은 단어 1개 기준(더 높은 임계값)으로만 판단
+                continue
+            ok = True
+            for r in range(1, repeats):
+                off = base + r * size
+                for k in range(size):
+                    if words[off + k][0] != group[k]:
+                        ok = False
+                        break
+                if not ok:
+                    break
+            if ok:
+                # 첫 번째 묶음까지만 유지
+                keep = words[base + size][1]
+                return EarlyStop("ngram", keep, f"{size}-word group repeated {repeats}x: {' '.join(group)[:80]}")
+        return None
+
+    def _check_numeric(self, word: str, start: int) -> Optional[EarlyStop]:
+        if not _NUMERIC_WORD_RE.match(word):
+            self._num_run = []
+            self._num_step = None
+            return None
+        for m in _INT_RE.finditer(word):
+            if word[m.end():m.end() + 1] not in _COMMAS:
+                # 콤마로 이어지지 않는 숫자("1 2 3" 달력, "…, 13"의 마지막 값)는 나열로 세지 않음
+                self._num_run = []
+                self._num_step = None
+                continue
+            value = int(m.group(0))
+            item = (value, start + m.start())
+            run = self._num_run
+            if not run:
+                run.append(item)
+                continue
+            step = value - run[-1][0]
+            if step == 0:
+                self._num_run = [item]
+                self._num_step = None
+            elif self._num_step is None or step == self._num_step:
+                run.append(item)
+                self._num_step = step
+            else:
+                # 공차가 바뀌면 직전 값부터 새 수열로 취급
+                self._num_run = [run[-1], item]
+                self._num_step = step
+            if len(self._num_run) >= NUMERIC_MIN_RUN:
+                keep = self._num_run[0][1]
+                first, last = self._num_run[0][0], self._num_run[-1][0]
+                return EarlyStop("numeric_sequence", keep, f"arithmetic run {first}..{last} (step {self._num_step})")
+        return None
+
+    # 라인 단위 감지기
+    def _on_line(self, line: str, start: int, end: int) -> Optional[EarlyStop]:
+        stripped = line.strip()
+        if not _has_content(stripped):
+            # 빈 라인과 표 구분선(| --- |) 등은 반복 검사에서 제외
+            return None
+        self._lines.append((stripped, start, end))
+        if len(self._lines) > _HISTORY_LIMIT:
+            del self._lines[: _HISTORY_LIMIT // 2]
+        lines = self._lines
+        n = len(lines)
+        for size in range(1, MAX_LINE_BLOCK + 1):
+            repeats = LINE_MIN_REPEATS if size == 1 else BLOCK_MIN_REPEATS
+            span = size * repeats
+            if n < span:
+                break
+            if lines[-1][0] != lines[-1 - size][0]:
+                continue
+            base = n - span
+            ok = True
+            for r in range(1, repeats):
+                off = base + r * size
+                for k in range(size):
+                    if lines[off + k][0] != lines[base + k][0]:
+                        ok = False
+                        break
+                if not ok:
+                    break
+            if ok:
+                keep = lines[base + size - 1][2]
+                return EarlyStop("repeated_lines", keep, f"{size}-line block repeated {repeats}x")
+        return None
+
+
+# 누적 통계 (/inference/stats에서 노출)
+early_stop_stats: Dict[str, int] = {
+    "ngram": 0,
+    "numeric_sequence": 0,
+    "repeated_lines": 0,
+    # 고급 모드에서 JSON 객체 완성 후 취소 (main.generate_ocr_text)
+    "json_complete": 0,
+    "tokens_saved_estimate": 0,
+}
+
+
+def record_early_stop(result: EarlyStop, tokens_saved: int) -> None:
+    early_stop_stats[result.detector] = early_stop_stats.get(result.detector, 0) + 1
+    early_stop_stats["tokens_saved_estimate"] += max(0, int(tokens_saved))
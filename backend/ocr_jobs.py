@@ -0,0 +1,367 @@
+"""
+영속 OCR 작업 큐 + 프로세스 내 워커 풀.
+
+OCR을 HTTP 요청 안에서 바로 처리하면 브라우저 새로고침이나 프록시 타임아웃만으로도
+수십 초의 GPU 작업이 버려집니다. 작업을 SQLite(ocr_jobs 테이블)에 먼저 기록하고
+워커가 순서대로 꺼내 처리하므로, 서버가 재시작되어도 대기/실행 중이던 작업은 다시 처리됩니다.
+
+- 작업 1건 처리 로직(handler)은 main.py에서 주입합니다.
+- handler가 JobError를 던지면 재시도하지 않고 실패 처리, 그 밖의 예외는 OCR_JOB_MAX_ATTEMPTS까지 재시도합니다.
+- 상태 전이는 running인 작업에만 적용됩니다(finish_job/requeue_job). handler는 결과 저장과 같은 트랜잭션에서
+  finish_job을 호출해, 저장은 됐는데 작업은 대기열에 남아 재시도 때 결과가 두 번 저장되는 일이 없게 합니다.
+- 쓰기는 모두 database.run_write_transaction(write_lock)으로 처리합니다.
+"""
+
+import asyncio
+import os
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from database import OCRJob, SessionLocal, run_write_transaction
+
+OCR_JOB_WORKERS = int(os.getenv("OCR_JOB_WORKERS", "2"))
+OCR_JOB_MAX_ATTEMPTS = int(os.getenv("OCR_JOB_MAX_ATTEMPTS", "3"))
+# 새 작업 알림을 놓쳤을 때를 대비한 폴링 주기
+OCR_JOB_POLL_SECONDS = float(os.getenv("OCR_JOB_POLL_SECONDS", "5"))
+
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+class JobError(Exception):
+    """
+    재시도해도 결과가 같은 실패 (잘못된 이미지, 크레딧 부족 등).
+    result_text가 있으면 OCR 결과는 작업에 남겨 둡니다.
+    """
+
+    def __init__(self, message: str, result_text: Optional[str] = None):
+        super().__init__(message)
+        self.result_text = result_text
+
+
+def _iso(dt: Optional[datetime]) -> Optional[str]:
+    return dt.isoformat() if dt else None
+
+
+def _percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    idx = min(len(values) - 1, max(0, int(round(pct * (len(values) - 1)))))
+    return values[idx]
+
+
+def finish_job(
+    db,
+    job_id: int,
+    status: str,
+    result_text: Optional[str] = None,
+    record_id: Optional[int] = None,
+    error: Optional[str] = None,
+) -> bool:
+    """
+    running인 작업을 끝냅니다 (commit은 호출 측 트랜잭션). 이미 끝났거나 대기열로 돌아간 작업이면 False.
+    """
+    updated = db.query(OCRJob).filter(OCRJob.id == job_id, OCRJob.status == "running").update(
+        {
+            OCRJob.status: status,
+            OCRJob.result_text: result_text,
+            OCRJob.record_id: record_id,
+            OCRJob.error: error,
+            OCRJob.finished_at: datetime.utcnow(),
+            # 입력 이미지는 결과가 OCRRecord에 저장되었으므로 더 이상 필요 없음
+            OCRJob.image_data: None,
+        },
+        synchronize_session=False,
+    )
+    return bool(updated)
+
+
+def requeue_job(db, job_id: int, error: Optional[str]) -> bool:
+    # running인 작업만 대기열로 되돌림 (handler가 이미 끝낸 작업은 그대로 둠)
+    updated = db.query(OCRJob).filter(OCRJob.id == job_id, OCRJob.status == "running").update(
+        {OCRJob.status: "queued", OCRJob.started_at: None, OCRJob.error: error},
+        synchronize_session=False,
+    )
+    return bool(updated)
+
+
+def job_to_dict(job: OCRJob, queue_position: Optional[int] = None) -> Dict[str, Any]:
+    return {
+        "id": job.id,
+        "status": job.status,
+        "filename": job.filename,
+        "page_number": job.page_number,
+        "save_session_id": job.save_session_id,
+        "extracted_text": job.result_text,
+        "record_id": job.record_id,
+        "error": job.error,
+        "attempts": job.attempts,
+        "queue_position": queue_position,
+        "created_at": _iso(job.created_at),
+        "started_at": _iso(job.started_at),
+        "finished_at": _iso(job.finished_at),
+    }
+
+
+class OCRJobQueue:
+    def __init__(
+        self,
+        handler: Optional[Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]] = None,
+        workers: int = OCR_JOB_WORKERS,
+        max_attempts: int = OCR_JOB_MAX_ATTEMPTS,
+    ):
+        self.handler = handler
+        self.workers = max(1, int(workers))
+        self.max_attempts = max(1, int(max_attempts))
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self.busy_workers = 0
+
+    # 작업 등록/조회 (sync: run_in_threadpool로 호출)
+    def submit(
+        self,
+        email: str,
+        image_data: bytes,
+        filename: Optional[str],
+        page_number: Optional[int],
+        custom_prompt: Optional[str],
+        image_mode: Optional[str],
+        save_session_id: Optional[str],
+    ) -> Dict[str, Any]:
+        return run_write_transaction(
+            self._submit, email, image_data, filename, page_number, custom_prompt, image_mode, save_session_id
+        )
+
+    def _submit(
+        self,
+        db,
+        email: str,
+        image_data: bytes,
+        filename: Optional[str],
+        page_number: Optional[int],
+        custom_prompt: Optional[str],
+        image_mode: Optional[str],
+        save_session_id: Optional[str],
+    ) -> Dict[str, Any]:
+        job = OCRJob(
+            email=email,
+            status="queued",
+            filename=filename,
+            page_number=page_number,
+            custom_prompt=custom_prompt,
+            image_mode=image_mode,
+            save_session_id=save_session_id,
+            image_data=image_data,
+            attempts=0,
+            created_at=datetime.utcnow(),
+        )
+        db.add(job)
+        db.flush()
+        return job_to_dict(job, self._queue_position(db, job))
+
+    def get(self, job_id: int, email: str) -> Optional[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            job = db.query(OCRJob).filter(OCRJob.id == job_id, OCRJob.email == email).first()
+            if not job:
+                return None
+            return job_to_dict(job, self._queue_position(db, job))
+        finally:
+            db.close()
+
+    def list_jobs(self, email: str, status: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+        db = SessionLocal()
+        try:
+            query = db.query(OCRJob).filter(OCRJob.email == email)
+            if status:
+                query = query.filter(OCRJob.status == status)
+            jobs = query.order_by(OCRJob.id.desc()).limit(limit).all()
+            return [job_to_dict(j) for j in jobs]
+        finally:
+            db.close()
+
+    @staticmethod
+    def _queue_position(db, job: OCRJob) -> Optional[int]:
+        if job.status != "queued":
+            return None
+        ahead = db.query(OCRJob.id).filter(OCRJob.status == "queued", OCRJob.id < job.id).count()
+        return ahead + 1
+
+    # 워커 내부 상태 전이 (sync)
+    def _claim_next(self) -> Optional[Dict[str, Any]]:
+        """
+        가장 오래된 queued 작업 1건을 running으로 전환하고 입력을 반환합니다.
+        status 조건부 UPDATE로 선점하므로 워커(또는 다른 프로세스)가 여러 개여도 같은 작업을 두 번 가져가지 않습니다.
+        """
+        return run_write_transaction(self._claim)
+
+    @staticmethod
+    def _claim(db) -> Optional[Dict[str, Any]]:
+        for _ in range(5):
+            row = (
+                db.query(OCRJob.id)
+                .filter(OCRJob.status == "queued")
+                .order_by(OCRJob.id.asc())
+                .first()
+            )
+            if row is None:
+                return None
+            claimed = (
+                db.query(OCRJob)
+                .filter(OCRJob.id == row.id, OCRJob.status == "queued")
+                .update(
+                    {
+                        OCRJob.status: "running",
+                        OCRJob.started_at: datetime.utcnow(),
+                        OCRJob.attempts: OCRJob.attempts + 1,
+                    },
+                    synchronize_session=False,
+                )
+            )
+            if not claimed:
+                continue
+            job = db.query(OCRJob).filter(OCRJob.id == row.id).first()
+            return {
+                "id": job.id,
+                "email": job.email,
+                "filename": job.filename,
+                "page_number": job.page_number,
+                "custom_prompt": job.custom_prompt,
+                "image_mode": job.image_mode,
+                "save_session_id": job.save_session_id,
+                "image_data": job.image_data,
+                "attempts": job.attempts,
+            }
+        return None
+
+    def _finish(
+        self,
+        job_id: int,
+        status: str,
+        result_text: Optional[str] = None,
+        record_id: Optional[int] = None,
+        error: Optional[str] = None,
+    ) -> None:
+        run_write_transaction(finish_job, job_id, status, result_text, record_id, error)
+
+    def _requeue(self, job_id: int, error: Optional[str]) -> None:
+        run_write_transaction(requeue_job, job_id, error)
+
+    def recover(self) -> int:
+        """
+        서버 시작 시: 이전 프로세스에서 running 상태로 남은 작업을 다시 대기열로 돌립니다.
+        """
+        return run_write_transaction(self._recover)
+
+    @staticmethod
+    def _recover(db) -> int:
+        count = (
+            db.query(OCRJob)
+            .filter(OCRJob.status == "running")
+            .update({OCRJob.status: "queued", OCRJob.started_at: None}, synchronize_session=False)
+        )
+        return count or 0
+
+    # 워커 루프
+    async def _run_job(self, job: Dict[str, Any]) -> None:
+        self.busy_workers += 1
+        try:
+            result = await self.handler(job)
+            # handler가 저장 트랜잭션에서 이미 끝냈으면 running이 아니므로 아무것도 바꾸지 않음
+            await run_in_threadpool(
+                self._finish, job["id"], "succeeded", result.get("result_text"), result.get("record_id")
+            )
+        except asyncio.CancelledError:
+            # 종료 중: 다음 시작 때 다시 처리되도록 대기열로 되돌림 (이벤트 루프를 막지 않도록 스레드에서)
+            await run_in_threadpool(self._requeue, job["id"], None)
+            raise
+        except JobError as e:
+            await run_in_threadpool(self._finish, job["id"], "failed", e.result_text, None, str(e))
+        except Exception as e:
+            error = f"{type(e).__name__}: {str(e)[:500]}"
+            if job["attempts"] < self.max_attempts:
+                print(f"[jobs] job {job['id']} attempt {job['attempts']} failed, requeued: {error}")
+                await run_in_threadpool(self._requeue, job["id"], error)
+            else:
+                await run_in_threadpool(self._finish, job["id"], "failed", None, None, error)
+        finally:
+            self.busy_workers -= 1
+
+    async def _worker(self) -> None:
+        while True:
+            self._wakeup.clear()
+            try:
+                job = await run_in_threadpool(self._claim_next)
+            except Exception as e:
+                print(f"[jobs] claim failed: {e}")
+                job = None
+            if job is None:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=OCR_JOB_POLL_SECONDS)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            await self._run_job(job)
+
+    def notify(self) -> None:
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    async def start(self) -> None:
+        if self._tasks:
+            return
+        recovered = await run_in_threadpool(self.recover)
+        if recovered:
+            print(f"[jobs] requeued {recovered} interrupted job(s)")
+        self._wakeup = asyncio.Event()
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        for task in self._tasks:
+            try:
+                await task
+            except (asyncio.CancelledError, Exception):
+                pass
+        self._tasks = []
+
+    # 관측
+    def stats(self, window_minutes: int = 60) -> Dict[str, Any]:
+        db = SessionLocal()
+        try:
+            now = datetime.utcnow()
+            queued = db.query(OCRJob.id).filter(OCRJob.status == "queued").count()
+            running = db.query(OCRJob.id).filter(OCRJob.status == "running").count()
+            oldest = (
+                db.query(OCRJob.created_at)
+                .filter(OCRJob.status == "queued")
+                .order_by(OCRJob.id.asc())
+                .first()
+            )
+            finished = (
+                db.query(OCRJob.status, OCRJob.created_at, OCRJob.started_at, OCRJob.finished_at)
+                .filter(OCRJob.finished_at >= now - timedelta(minutes=window_minutes))
+                .all()
+            )
+        finally:
+            db.close()
+
+        wait_s = [(f.started_at - f.created_at).total_seconds() for f in finished if f.started_at and f.created_at]
+        run_s = [(f.finished_at - f.started_at).total_seconds() for f in finished if f.started_at and f.finished_at]
+        return {
+            "workers": self.workers,
+            "busy_workers": self.busy_workers,
+            "queue_depth": queued,
+            "running": running,
+            "oldest_queued_age_seconds": round((now - oldest.created_at).total_seconds(), 1) if oldest and oldest.created_at else 0.0,
+            "window_minutes": window_minutes,
+            "succeeded": sum(1 for f in finished if f.status == "succeeded"),
+            "failed": sum(1 for f in finished if f.status == "failed"),
+            "wait_seconds_avg": round(sum(wait_s) / len(wait_s), 2) if wait_s else 0.0,
+            "wait_seconds_p95": round(_percentile(wait_s, 0.95), 2),
+            "run_seconds_avg": round(sum(run_s) / len(run_s), 2) if run_s else 0.0,
+            "run_seconds_p95": round(_percentile(run_s, 0.95), 2),
+        }
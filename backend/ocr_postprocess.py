@@ -0,0 +1,358 @@
+"""
+OCR 모델 응답 후처리.
+
+모든 OCR 응답이 거치는 CPU 경로라 main.py에서 분리해 두었습니다 (FastAPI/DB 없이 import 가능).
+- clean_ocr_response: 설명 문구/따옴표/잘림 표시, 라인 내 반복, 숫자 나열, 중복 라인/블록 제거
+- extract_json_from_text: 응답에 섞인 JSON 객체 추출 및 포맷팅
+- JsonObjectScanner: 스트리밍 중 최상위 JSON 객체가 닫히는 시점 감지 (고급 모드 조기 중단용)
+- postprocess_ocr_text: 원문 응답 → 최종 extracted_text
+
+동작을 바꾸는 수정은 benchmarks/bench_postprocess.py 의 golden 결과와 비교하세요.
+"""
+
+import json
+import os
+import re
+from typing import List, Optional, Tuple
+
+from repeat_removal import remove_repeated_phrases
+
+# 고급 모드(custom_prompt)에서 최상위 JSON 객체가 닫히면 남은 생성을 취소
+OCR_JSON_EARLY_STOP_ENABLED = os.getenv("OCR_JSON_EARLY_STOP_ENABLED", "1") not in ("0", "false", "False", "")
+# 설명문 속 "{...}"처럼 유효하지 않은 객체를 건너뛰며 시도할 최대 후보 수
+JSON_MAX_CANDIDATES = 8
+
+_JSON_SCAN_RE = re.compile(r'[{}"\\]')
+
+
+def clean_ocr_response(text: str) -> str:
+    """
+    OCR 응답에서 불필요한 설명이나 따옴표를 제거하고, 중복 라인을 제거합니다.
+    """
+    # "The image contains the text "..." 형식 제거
+    text = re.sub(r'^The image contains the text\s*["\']', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'^The text in the image is\s*["\']', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'^The image shows the text\s*["\']', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'^Here is the text from the image\s*[:]?\s*["\']', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'^Extracted text\s*[:]?\s*["\']', '', text, flags=re.IGNORECASE)
+    
+    # 끝에 있는 따옴표 제거
+    text = re.sub(r'["\']\s*$', '', text)
+    
+    # "..." 형식에서 실제 텍스트만 추출
+    quoted_match = re.search(r'["\']([^"\']+)["\']', text)
+    if quoted_match:
+        text = quoted_match.group(1)
+    
+    # 잘림 표시 제거 (..., … 등)
+    text = re.sub(r'\.\.\.\s*$', '', text)
+    text = re.sub(r'…\s*$', '', text)
+    text = re.sub(r'\.\.\s*$', '', text)
+    text = re.sub(r'\s*by\s+c\.\.\.\s*$', '', text, flags=re.IGNORECASE)  # "by c..." 형식 제거
+    
+    # 비정상적으로 긴 숫자 시퀀스 제거 (같은 라인 내에서 숫자가 10개 이상 반복되는 경우)
+    # 예: "10, 11, 12, 13, ... 365," -> 제거
+    lines = text.split('\n')
+    cleaned_lines = []
+    
+    for line in lines:
+        # 같은 라인 내 문구 반복 제거 먼저 수행 (repeat_removal.py, 라인 길이에 선형)
+        # 예: "광고 프로젝트의 진행 및 광고 프로젝트의 진행 및 ..." -> "광고 프로젝트의 진행 및"
+        line = remove_repeated_phrases(line)
+        # 숫자 시퀀스 패턴 찾기 (예: "10, 11, 12, 13" 또는 "10,11,12,13")
+        # 숫자가 10개 이상 연속으로 나오는 경우를 감지
+        # 더 강력한 패턴: 숫자, 콤마, 공백이 반복되는 패턴
+        number_sequence_pattern = r'(\d+\s*[,，]\s*){10,}'
+        
+        # 숫자 시퀀스가 있는지 확인
+        match = re.search(number_sequence_pattern, line)
+        if match:
+            start_pos = match.start()
+            
+            # 숫자 시퀀스 시작 전의 텍스트 확인
+            before_text = line[:start_pos]
+            
+            # 숫자 시퀀스가 시작된 이후의 모든 숫자 시퀀스 길이 확인
+            # 숫자 시퀀스 부분 추출
+            sequence_part = line[start_pos:]
+            # 숫자 개수 세기
+            numbers_in_sequence = re.findall(r'\d+', sequence_part)
+            
+            # 숫자가 10개 이상이면 제거
+            if len(numbers_in_sequence) >= 10:
+                # 괄호가 열려있는지 확인
+                open_paren_count = before_text.count('(') - before_text.count(')')
+                
+                if open_paren_count > 0:
+                    # 괄호 안의 숫자 시퀀스인 경우
+                    # 괄호 시작 부분을 찾아서 숫자 시퀀스 전까지 유지
+                    last_open_paren = before_text.rfind('(')
+                    if last_open_paren >= 0:
+                        # 괄호 시작부터 숫자 시퀀스 전까지의 텍스트 유지
+                        # 예: "소재지 대전 유성구 (카인 : 10, 11, ..." -> "소재지 대전 유성구 (카인 :"
+                        line = line[:start_pos].rstrip()
+                        # 끝에 불필요한 구두점 제거 (콜론은 유지)
+                        line = re.sub(r'[,\s]+$', '', line)
+                        # 닫는 괄호가 없으면 추가하지 않음 (원본 텍스트 유지)
+                    else:
+                        # 괄호가 없거나 찾을 수 없는 경우, 숫자 시퀀스 시작 전까지 유지
+                        line = line[:start_pos].rstrip()
+                        line = re.sub(r'[,\s:：]+$', '', line)
+                else:
+                    # 괄호 밖의 숫자 시퀀스인 경우
+                    # 숫자 시퀀스 시작 전까지의 텍스트만 유지
+                    line = line[:start_pos].rstrip()
+                    # 끝에 불필요한 구두점 제거
+                    line = re.sub(r'[,\s:：]+$', '', line)
+        
+        # 추가 검사: 라인 전체가 숫자 시퀀스로만 구성되어 있는 경우 제거
+        if line.strip():
+            # 라인이 숫자와 콤마, 공백만으로 구성되어 있고 길이가 매우 긴 경우
+            if re.match(r'^[\s\d,，]+$', line) and len(line) > 50:
+                # 숫자가 10개 이상인지 확인
+                numbers = re.findall(r'\d+', line)
+                if len(numbers) >= 10:
+                    # 이 라인은 완전히 제거
+                    continue
+        
+        cleaned_lines.append(line)
+    
+    text = '\n'.join(cleaned_lines)
+    
+    # 중복 라인 제거 (연속된 동일한 라인 제거)
+    lines = text.split('\n')
+    cleaned_lines = []
+    prev_line = None
+    
+    for line in lines:
+        line_stripped = line.strip()
+        # 빈 라인은 유지하되, 연속된 빈 라인은 하나만 유지
+        if not line_stripped:
+            if cleaned_lines and cleaned_lines[-1].strip():
+                cleaned_lines.append('')
+            continue
+        
+        # 이전 라인과 동일하지 않으면 추가
+        if line_stripped != prev_line:
+            cleaned_lines.append(line)
+            prev_line = line_stripped
+    
+    text = '\n'.join(cleaned_lines)
+    
+    # 여러 줄 패턴의 반복 제거
+    # 예: "A\nB\nA\nB\nA\nB" -> "A\nB"
+    lines = text.split('\n')
+    if len(lines) > 4:  # 최소 4줄 이상일 때만 패턴 검사
+        # 패턴 길이를 2부터 전체의 절반까지 시도
+        max_pattern_length = min(len(lines) // 2, 10)  # 최대 10줄 패턴까지 검사
+        
+        for pattern_len in range(2, max_pattern_length + 1):
+            # 패턴이 반복되는지 확인
+            pattern = lines[:pattern_len]
+            # 빈 줄을 제외한 패턴 텍스트 생성
+            pattern_text = '\n'.join([l.strip() for l in pattern if l.strip()])
+            
+            if not pattern_text:  # 빈 패턴은 건너뛰기
+                continue
+            
+            # 패턴이 3번 이상 반복되는지 확인
+            repeat_count = 1
+            pos = pattern_len
+            
+            while pos + pattern_len <= len(lines):
+                current_pattern = lines[pos:pos + pattern_len]
+                # 빈 줄을 제외한 현재 패턴 텍스트 생성
+                current_pattern_text = '\n'.join([l.strip() for l in current_pattern if l.strip()])
+                
+                if current_pattern_text == pattern_text:
+                    repeat_count += 1
+                    pos += pattern_len
+                else:
+                    break
+            
+            # 패턴이 3번 이상 반복되면 첫 번째 패턴만 유지
+            if repeat_count >= 3:
+                # 반복된 패턴 제거
+                remaining_lines = lines[repeat_count * pattern_len:]
+                text = '\n'.join(pattern + remaining_lines)
+                break  # 첫 번째로 발견된 패턴만 제거
+    
+    # 패턴 제거 후 다시 한 번 연속된 동일한 라인 제거 (남은 중복 제거)
+    lines = text.split('\n')
+    final_lines = []
+    prev_line = None
+    
+    for line in lines:
+        line_stripped = line.strip()
+        if not line_stripped:
+            if final_lines and final_lines[-1].strip():
+                final_lines.append('')
+            continue
+        
+        if line_stripped != prev_line:
+            final_lines.append(line)
+            prev_line = line_stripped
+    
+    text = '\n'.join(final_lines)
+    
+    # 앞뒤 공백 제거
+    text = text.strip()
+    
+    return text
+
+
+class JsonObjectScanner:
+    """
+    토큰 조각을 feed()로 받으면서 첫 번째 최상위 JSON 객체 {...}가 닫히는 시점을 찾습니다.
+    문자열 안의 중괄호와 이스케이프(\\", \\\\)는 무시하고, 조각 경계에 걸친 이스케이프도 처리합니다.
+    객체가 닫히면 json.loads로 검증하고, 유효하지 않으면(설명문 속 "{...}" 등) 그다음 '{'부터 다시 찾습니다.
+    비용은 출력 길이에 선형이며 (중괄호/따옴표/역슬래시만 검사), 재시도는 max_candidates번까지입니다.
+    """
+
+    def __init__(self, max_candidates: int = JSON_MAX_CANDIDATES):
+        self.max_candidates = max_candidates
+        self._parts: List[str] = []
+        self._length = 0
+        self._depth = 0
+        self._in_string = False
+        # 이스케이프 문자 다음 글자의 절대 위치 (그 글자는 무시)
+        self._skip = -1
+        self.candidates = 0
+        self.start: Optional[int] = None
+        self.end: Optional[int] = None
+        self.value: Optional[dict] = None
+
+    @property
+    def text(self) -> str:
+        if len(self._parts) > 1:
+            self._parts = ["".join(self._parts)]
+        return self._parts[0] if self._parts else ""
+
+    @property
+    def done(self) -> bool:
+        return self.value is not None or self.candidates >= self.max_candidates
+
+    def feed(self, chunk: str) -> bool:
+        """
+        조각을 추가하고, 유효한 최상위 객체가 완성되었으면 True를 반환합니다.
+        """
+        if self.done:
+            return self.value is not None
+        base = self._length
+        self._parts.append(chunk)
+        self._length += len(chunk)
+        self._scan(chunk, base, 0)
+        return self.value is not None
+
+    def _scan(self, text: str, base: int, pos: int) -> None:
+        # text[pos:]를 검사합니다. base는 text[0]의 절대 위치.
+        while True:
+            closed = None
+            for m in _JSON_SCAN_RE.finditer(text, pos):
+                at = base + m.start()
+                if at == self._skip:
+                    continue
+                ch = m.group(0)
+                if self._depth == 0:
+                    if ch == "{":
+                        self.start = at
+                        self._depth = 1
+                    continue
+                if self._in_string:
+                    if ch == '"':
+                        self._in_string = False
+                    elif ch == "\\":
+                        self._skip = at + 1
+                elif ch == '"':
+                    self._in_string = True
+                elif ch == "{":
+                    self._depth += 1
+                elif ch == "}":
+                    self._depth -= 1
+                    if self._depth == 0:
+                        closed = at + 1
+                        break
+            if closed is None:
+                return
+            full = self.text
+            try:
+                value = json.loads(full[self.start:closed])
+            except json.JSONDecodeError:
+                value = None
+            if isinstance(value, dict):
+                self.value = value
+                self.end = closed
+                return
+            # 유효한 객체가 아니면 다음 '{'부터 다시 검사
+            self.candidates += 1
+            if self.done:
+                return
+            text, base, pos = full, 0, self.start + 1
+            self.start = None
+            self._in_string = False
+            self._skip = -1
+
+
+def find_json_object(text: str) -> Optional[Tuple[int, int]]:
+    """
+    text에서 첫 번째 유효한 최상위 JSON 객체의 (시작, 끝) 위치를 반환합니다 (없으면 None).
+    """
+    scanner = JsonObjectScanner()
+    scanner.feed(text)
+    if scanner.value is None:
+        return None
+    return scanner.start, scanner.end
+
+
+def extract_json_from_text(text: str) -> str:
+    """
+    텍스트에서 JSON 블록을 추출하고 포맷팅합니다.
+    JSON을 찾지 못하면 원본 텍스트를 반환합니다.
+    """
+    # 1. JSON 코드 블록 찾기 (```json ... ``` 또는 ``` ... ```)
+    json_block_pattern = r'```(?:json)?\s*(\{.*?\})\s*```'
+    match = re.search(json_block_pattern, text, re.DOTALL)
+    if match:
+        json_str = match.group(1).strip()
+    else:
+        # 2. ``` 없이 첫 번째 유효한 {...} 찾기 (문자열 안의 중괄호는 무시, 설명문 속 중괄호는 건너뜀)
+        found = find_json_object(text)
+        if found is None:
+            # JSON 객체가 없거나 중괄호가 매칭되지 않음
+            return text
+        json_str = text[found[0]:found[1]]
+    
+    try:
+        # JSON 파싱 시도
+        json_obj = json.loads(json_str)
+        # JSON을 포맷팅된 문자열로 변환 (들여쓰기 포함)
+        formatted_json = json.dumps(json_obj, ensure_ascii=False, indent=2)
+        return formatted_json
+    except json.JSONDecodeError as e:
+        # JSON 파싱 실패 - 원본 텍스트 반환
+        print(f"JSON parsing failed: {e}")
+        return text
+
+
+def postprocess_ocr_text(raw_text: str, custom_prompt: Optional[str]) -> str:
+    """
+    모델 원문 응답을 최종 extracted_text로 정리합니다.
+    """
+    # "..." 같은 잘림 표시 제거 (더 강력한 패턴 매칭)
+    raw_text = re.sub(r'\s*by\s+c\.\.\.\s*$', '', raw_text, flags=re.IGNORECASE)
+    raw_text = re.sub(r'\.\.\.\s*$', '', raw_text)
+    raw_text = re.sub(r'…\s*$', '', raw_text)
+    raw_text = raw_text.rstrip('…').rstrip('...').rstrip('..').rstrip('.')
+
+    # JSON 형식인지 확인하고 포맷팅
+    # 사용자 지정 프롬프트가 있으면 JSON 추출 시도
+    if custom_prompt and custom_prompt.strip():
+        # JSON 추출 시도
+        json_formatted = extract_json_from_text(raw_text)
+        if json_formatted != raw_text:
+            # JSON이 성공적으로 추출됨
+            return json_formatted
+        # JSON이 아니면 기본 정리 로직 사용
+        return clean_ocr_response(raw_text)
+    # 기본 프롬프트 사용 시 기본 정리 로직
+    return clean_ocr_response(raw_text)
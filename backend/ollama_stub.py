@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Ollama API stub server for local testing (no GPU needed).
+
+Implements the subset of the Ollama HTTP API the backend uses:
+- POST /api/chat  (stream=true → NDJSON chunks, stream=false → single JSON)
+- GET  /api/tags  (health check)
+
+Examples:
+  # two fake inference boxes, the second one slower
+  python ollama_stub.py --port 11501
+  python ollama_stub.py --port 11502 --token-delay 0.2
+  OLLAMA_HOSTS="http://127.0.0.1:11501=2,http://127.0.0.1:11502=2" uvicorn main:app --port 8000
+
+  # simulate an unhealthy box (health check and chat return 503)
+  python ollama_stub.py --port 11503 --unhealthy
+"""
+
+from __future__ import annotations
+
+import argparse
+import json
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_TEXT = "Sample OCR text from stub\n두 번째 줄 텍스트"
+
+
+class StubState:
+    def __init__(self, text: str, token_delay: float, chunk_chars: int, unhealthy: bool, model: str):
+        self.text = text
+        self.token_delay = token_delay
+        self.chunk_chars = max(1, chunk_chars)
+        self.unhealthy = unhealthy
+        self.model = model
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def _make_handler(state: StubState):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args) -> None:  # keep output quiet
+            pass
+
+        def _send_json(self, status: int, payload: dict) -> None:
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def _write_chunk(self, payload: dict) -> None:
+            line = (json.dumps(payload, ensure_ascii=False) + "\n").encode("utf-8")
+            self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+            self.wfile.flush()
+
+        def do_GET(self) -> None:
+            if self.path.rstrip("/") != "/api/tags":
+                self._send_json(404, {"error": "not found"})
+                return
+            if state.unhealthy:
+                self._send_json(503, {"error": "stub marked unhealthy"})
+                return
+            self._send_json(200, {"models": [{"name": state.model}]})
+
+        def do_POST(self) -> None:
+            length = int(self.headers.get("Content-Length") or 0)
+            request = json.loads(self.rfile.read(length) or b"{}")
+            if self.path.rstrip("/") != "/api/chat":
+                self._send_json(404, {"error": "not found"})
+                return
+            if state.unhealthy:
+                self._send_json(503, {"error": "stub marked unhealthy"})
+                return
+
+            with state.lock:
+                state.calls += 1
+                state.in_flight += 1
+                state.max_in_flight = max(state.max_in_flight, state.in_flight)
+            try:
+                self._chat(request)
+            finally:
+                with state.lock:
+                    state.in_flight -= 1
+
+        def _chat(self, request: dict) -> None:
+            text = state.text
+            fmt = request.get("format")
+            if isinstance(fmt, dict):
+                # structured output request: answer an object with the schema keys
+                text = json.dumps({key: "stub" for key in (fmt.get("properties") or {})}, ensure_ascii=False)
+            elif fmt == "json":
+                text = json.dumps({"text": text}, ensure_ascii=False)
+            model = request.get("model") or state.model
+
+            if not request.get("stream", True):
+                time.sleep(state.token_delay * max(1, len(text) // state.chunk_chars))
+                self._send_json(200, {"model": model, "message": {"role": "assistant", "content": text}, "done": True})
+                return
+
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            try:
+                for i in range(0, len(text), state.chunk_chars):
+                    time.sleep(state.token_delay)
+                    piece = text[i : i + state.chunk_chars]
+                    self._write_chunk({"model": model, "message": {"role": "assistant", "content": piece}, "done": False})
+                self._write_chunk({"model": model, "message": {"role": "assistant", "content": ""}, "done": True})
+                self.wfile.write(b"0\r\n\r\n")
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # client cancelled the generation
+                print(f"[stub:{self.server.server_port}] client disconnected", flush=True)
+
+    return Handler
+
+
+def main(argv: list[str]) -> int:
+    parser = argparse.ArgumentParser(description="Ollama API stub server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=11434)
+    parser.add_argument("--text", default=DEFAULT_TEXT, help="response text")
+    parser.add_argument("--text-file", help="read response text from file")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="seconds between streamed chunks")
+    parser.add_argument("--chunk-chars", type=int, default=4, help="characters per streamed chunk")
+    parser.add_argument("--unhealthy", action="store_true", help="answer 503 to every request")
+    parser.add_argument("--model", default="qwen2.5vl:7b")
+    args = parser.parse_args(argv)
+
+    text = args.text
+    if args.text_file:
+        with open(args.text_file, encoding="utf-8") as f:
+            text = f.read()
+
+    state = StubState(text, args.token_delay, args.chunk_chars, args.unhealthy, args.model)
+    server = ThreadingHTTPServer((args.host, args.port), _make_handler(state))
+    server.daemon_threads = True
+    print(f"[stub] listening on http://{args.host}:{args.port}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(f"[stub] calls={state.calls} max_in_flight={state.max_in_flight}", flush=True)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main(sys.argv[1:]))
@@ -0,0 +1,161 @@
+"""
+공개 '최근 절약 현황' 피드 스냅샷 (GET /public/recent-savings).
+
+인증 없이 랜딩 페이지에서 호출되는데, 요청마다 최근 N일 전체 사용자 레코드를 집계하면
+트래픽이 몰릴 때 DB가 포화됩니다. 이제 days 값별로 최신 그룹 목록(최대 PUBLIC_SAVINGS_MAX_LIMIT개)을
+메모리 스냅샷으로 두고, 요청은 스냅샷을 limit만큼 잘라 반환합니다 (O(limit)).
+
+- 백그라운드 refresher가 TTL(PUBLIC_SAVINGS_TTL_SECONDS)이 지났거나 무효화된 스냅샷을 다시 만듭니다.
+- 저장/수정/삭제는 invalidate()로 스냅샷을 무효화합니다. 연속 저장 중에는
+  PUBLIC_SAVINGS_MIN_REFRESH_SECONDS마다 최대 한 번만 다시 집계합니다.
+- 스냅샷이 아직 없는 days 값의 첫 요청만 직접 집계합니다 (동시 요청은 한 번의 집계에 합류).
+- days는 PUBLIC_SAVINGS_DAYS 중 하나만 허용해 스냅샷(과 주기적인 전체 집계)이 최대 그 개수만큼만 생깁니다.
+- 한동안 요청되지 않은 days 값의 스냅샷은 버립니다.
+"""
+
+import asyncio
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+PUBLIC_SAVINGS_TTL_SECONDS = float(os.getenv("PUBLIC_SAVINGS_TTL_SECONDS", "60"))
+PUBLIC_SAVINGS_MIN_REFRESH_SECONDS = float(os.getenv("PUBLIC_SAVINGS_MIN_REFRESH_SECONDS", "5"))
+# 스냅샷에 담는 그룹 수 (= 요청 limit 상한)
+PUBLIC_SAVINGS_MAX_LIMIT = 50
+# 허용하는 days 값 (스냅샷은 days 값마다 하나씩 만들고 계속 갱신하므로 종류를 제한)
+PUBLIC_SAVINGS_DAYS = (1, 7, 30, 90, 365)
+# 이 시간 동안 요청되지 않은 days 값의 스냅샷은 갱신하지 않고 버림
+PUBLIC_SAVINGS_IDLE_SECONDS = 10 * PUBLIC_SAVINGS_TTL_SECONDS
+
+
+class _Snapshot:
+    __slots__ = ("items", "built_at", "generation", "last_access")
+
+    def __init__(self, items: List[dict], built_at: float, generation: int):
+        self.items = items
+        self.built_at = built_at
+        self.generation = generation
+        self.last_access = built_at
+
+
+class RecentSavingsFeed:
+    """
+    build(days, limit) -> 최신순 그룹 목록. build는 DB를 읽는 동기 함수이므로 스레드풀에서 실행합니다.
+    """
+
+    def __init__(
+        self,
+        build: Callable[[int, int], List[dict]],
+        ttl_seconds: float = PUBLIC_SAVINGS_TTL_SECONDS,
+        min_refresh_seconds: float = PUBLIC_SAVINGS_MIN_REFRESH_SECONDS,
+        max_limit: int = PUBLIC_SAVINGS_MAX_LIMIT,
+    ):
+        self._build = build
+        self.ttl_seconds = ttl_seconds
+        self.min_refresh_seconds = min_refresh_seconds
+        self.max_limit = max_limit
+
+        self._snapshots: Dict[int, _Snapshot] = {}
+        # invalidate()는 스레드풀(작업 저장 등)에서도 호출되므로 threading.Lock
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._building: Dict[int, asyncio.Future] = {}
+        self._task: Optional[asyncio.Task] = None
+
+        self.hits = 0
+        self.builds = 0
+        self.invalidations = 0
+        self.errors = 0
+
+    def invalidate(self) -> None:
+        # 레코드 변경을 commit한 뒤 호출
+        with self._lock:
+            self._generation += 1
+            self.invalidations += 1
+
+    def _stale(self, snapshot: _Snapshot, now: float) -> bool:
+        if now - snapshot.built_at >= self.ttl_seconds:
+            return True
+        return snapshot.generation != self._generation and now - snapshot.built_at >= self.min_refresh_seconds
+
+    async def _refresh(self, days: int) -> _Snapshot:
+        # 같은 days의 동시 집계는 하나로 합류
+        pending = self._building.get(days)
+        if pending is not None:
+            return await asyncio.shield(pending)
+        future = asyncio.get_running_loop().create_future()
+        self._building[days] = future
+        try:
+            with self._lock:
+                generation = self._generation
+            items = await run_in_threadpool(self._build, days, self.max_limit)
+            snapshot = _Snapshot(items, time.monotonic(), generation)
+            with self._lock:
+                previous = self._snapshots.get(days)
+                if previous is not None:
+                    snapshot.last_access = previous.last_access
+                self._snapshots[days] = snapshot
+                self.builds += 1
+            future.set_result(snapshot)
+            return snapshot
+        except BaseException as e:
+            future.set_exception(e)
+            # 합류한 요청이 없으면 "exception was never retrieved" 경고가 남지 않도록
+            future.exception()
+            raise
+        finally:
+            self._building.pop(days, None)
+
+    async def get(self, days: int, limit: int) -> List[dict]:
+        with self._lock:
+            snapshot = self._snapshots.get(days)
+            if snapshot is not None:
+                snapshot.last_access = time.monotonic()
+                self.hits += 1
+        if snapshot is None:
+            snapshot = await self._refresh(days)
+        return snapshot.items[:limit]
+
+    async def _refresh_loop(self) -> None:
+        interval = max(0.5, min(self.min_refresh_seconds, self.ttl_seconds))
+        while True:
+            await asyncio.sleep(interval)
+            now = time.monotonic()
+            with self._lock:
+                for days in [d for d, s in self._snapshots.items() if now - s.last_access > PUBLIC_SAVINGS_IDLE_SECONDS]:
+                    del self._snapshots[days]
+                due = [d for d, s in self._snapshots.items() if self._stale(s, now)]
+            for days in due:
+                try:
+                    await self._refresh(days)
+                except Exception as e:
+                    # 실패해도 이전 스냅샷으로 계속 응답
+                    self.errors += 1
+                    print(f"[public-savings] refresh failed (days={days}): {e}")
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "ttl_seconds": self.ttl_seconds,
+                "snapshots": {
+                    days: {"items": len(s.items), "age_seconds": round(now - s.built_at, 1), "stale": self._stale(s, now)}
+                    for days, s in self._snapshots.items()
+                },
+                "hits": self.hits,
+                "builds": self.builds,
+                "invalidations": self.invalidations,
+                "errors": self.errors,
+            }
@@ -0,0 +1,330 @@
+"""
+라인 내 반복 문구 제거 (clean_ocr_response용).
+
+기존 remove_repeated_phrases는
+- 역추적 정규식 (.{5,}?)(?:\\s+\\1){2,} 를 라인마다 실행하고
+- 단어 묶음 반복을 하나 지울 때마다 처음(i = 0)부터 다시 검사했기 때문에
+16k 토큰 예산이 허용하는 긴 퇴행 출력에서 최악 3제곱 시간이 걸렸습니다.
+
+이 모듈은 같은 결과를 단어 토큰 + 롤링 해시로 계산합니다.
+- collapse_repeated_phrases: 정규식 단계. 가장 왼쪽 위치에서 가장 짧은(5자 이상) 문구가 공백을 사이에 두고
+  연속 3번 이상 나오면 1번만 남깁니다. 문구가 단어 중간이나 앞 공백 안에서 시작하는 경우, 5자를 채우려고 뒤 공백을 포함하는 경우,
+  마지막 반복이 단어 앞부분에서 끝나는 경우까지 정규식과 동일하게 처리합니다. 문구 길이는 MAX_PHRASE_WORDS 단어까지 검사합니다.
+- collapse_repeated_word_groups: 2~8단어 묶음 단계. 제거 후 영향을 받을 수 있는 위치(2묶음 앞)부터만 다시 검사합니다.
+
+전체 비용은 라인 길이 × MAX_PHRASE_WORDS에 비례합니다(선형).
+정규식과 다를 수 있는 경우는 MAX_PHRASE_WORDS보다 긴 문구가 반복되는 경우뿐입니다.
+기존 구현과의 비교와 성능 측정은 benchmarks/bench_repeat_removal.py 를 참고하세요.
+"""
+
+import re
+from bisect import bisect_right
+from typing import Dict, List, Optional, Tuple
+
+# 정규식 (.{5,}?) 의 최소 문구 길이(문자)와 (?:\s+\1){2,} 의 최소 반복 횟수
+MIN_PHRASE_CHARS = 5
+MIN_PHRASE_COPIES = 3
+# 정규식 단계에서 검사할 최대 문구 길이(단어)
+MAX_PHRASE_WORDS = 64
+# 단어 묶음 단계 (기존 방법 2와 동일)
+MIN_WORDS_FOR_GROUPS = 16
+MAX_GROUP_WORDS = 8
+MIN_GROUP_WORDS = 2
+
+_TOKEN_RE = re.compile(r"\S+")
+_HASH_MOD = (1 << 61) - 1
+_HASH_BASE = 1_000_003
+
+
+def _prefix_hashes(values: List[int]) -> List[int]:
+    h = [0] * (len(values) + 1)
+    acc = 0
+    for k, v in enumerate(values):
+        acc = (acc * _HASH_BASE + v + 1) % _HASH_MOD
+        h[k + 1] = acc
+    return h
+
+
+class _Tokens:
+    """
+    라인을 단어/구분 공백으로 나누고, 구간 비교를 O(1)로 하기 위한 롤링 해시를 준비합니다.
+    """
+
+    def __init__(self, line: str):
+        spans = [(m.start(), m.end()) for m in _TOKEN_RE.finditer(line)]
+        self.spans = spans
+        self.words = [line[s:e] for s, e in spans]
+        n = len(spans)
+        # seps[k]: 단어 k 뒤의 공백 (마지막 단어 뒤는 라인 끝 공백)
+        self.seps = [line[spans[k][1]:spans[k + 1][0]] for k in range(n - 1)]
+        if n:
+            self.seps.append(line[spans[-1][1]:])
+        self.leading = line[:spans[0][0]] if n else line
+        # 공백 안에서 시작하는 문구는 반복 사이 공백이 2자 이상일 때만 가능
+        self.wide_gaps = any(len(sep) > 1 for sep in self.seps[:-1])
+
+        vocab: Dict[str, int] = {}
+        self.wid = [vocab.setdefault(w, len(vocab)) for w in self.words]
+        self.vocab = vocab
+        self.vocab_words = list(vocab)
+        # 단어 id별 등장 위치 (오름차순)
+        self.occ: List[List[int]] = [[] for _ in vocab]
+        for k, v in enumerate(self.wid):
+            self.occ[v].append(k)
+        self._vocab_lengths = sorted({len(w) for w in vocab}, reverse=True)
+        self._suffixes: Dict[int, List[Tuple[int, int]]] = {}
+        sep_vocab: Dict[str, int] = {}
+        self.sid = [sep_vocab.setdefault(s, len(sep_vocab)) for s in self.seps]
+        self._hw = _prefix_hashes(self.wid)
+        self._hs = _prefix_hashes(self.sid)
+        self._pow = [1] * (n + 1)
+        for k in range(n):
+            self._pow[k + 1] = self._pow[k] * _HASH_BASE % _HASH_MOD
+
+    def suffix_ids(self, v: int) -> List[Tuple[int, int]]:
+        """
+        단어 v의 뒷부분과 같은 단어들: [(오프셋, 단어 id)] 오프셋 오름차순 (자기 자신이 오프셋 0).
+        """
+        found = self._suffixes.get(v)
+        if found is None:
+            word = self.vocab_words[v]
+            found = []
+            for length in self._vocab_lengths:
+                if length > len(word):
+                    continue
+                sid = self.vocab.get(word[len(word) - length:])
+                if sid is not None:
+                    found.append((len(word) - length, sid))
+            self._suffixes[v] = found
+        return found
+
+    def occurrences(self, v: int, lo: int, hi: int) -> List[int]:
+        """
+        단어 v가 (lo, hi] 구간에 등장하는 위치들.
+        """
+        positions = self.occ[v]
+        a = bisect_right(positions, lo)
+        b = bisect_right(positions, hi)
+        return positions[a:b]
+
+    def _get(self, h: List[int], a: int, length: int) -> int:
+        return (h[a + length] - h[a] * self._pow[length]) % _HASH_MOD
+
+    def same_words(self, a: int, b: int, length: int) -> bool:
+        if length <= 0:
+            return True
+        if self._get(self._hw, a, length) != self._get(self._hw, b, length):
+            return False
+        return self.wid[a:a + length] == self.wid[b:b + length]
+
+    def same_seps(self, a: int, b: int, length: int) -> bool:
+        if length <= 0:
+            return True
+        if self._get(self._hs, a, length) != self._get(self._hs, b, length):
+            return False
+        return self.sid[a:a + length] == self.sid[b:b + length]
+
+
+# 다음 검사 위치가 단어 경계일 때: 앞 공백 전체가 문구 시작 후보
+_WHOLE_GAP = -(1 << 30)
+
+
+class _Match:
+    __slots__ = ("offset", "phrase_end", "end_char", "next_i", "next_offset")
+
+    def __init__(self, offset: int, phrase_end: int, end_char: int, next_i: int, next_offset: int):
+        # offset: 단어 시작 기준 문구 시작 위치 (음수면 앞 공백 안)
+        self.offset = offset
+        # phrase_end: 남길 문구의 끝, end_char: 지울 반복의 끝 (문자 위치)
+        self.phrase_end = phrase_end
+        self.end_char = end_char
+        self.next_i = next_i
+        self.next_offset = next_offset
+
+
+def _count_copies(t: _Tokens, i: int, m: int, first: str, lead: str, tail: int) -> Tuple[int, int, int, int]:
+    """
+    문구 = lead + first(단어 i의 뒷부분) + 단어 i+1..i+m-1 + 뒤 공백 tail자.
+    문구 뒤에 이어지는 반복 횟수를 정규식 (?:\s+\1){2,} 의 탐욕적 반복과 같게 셉니다.
+    - 반복 본 사이 공백은 (이전 반복 본의 뒤 공백 tail자) + \s+(1자 이상) + lead 로 나뉘어야 합니다.
+    - tail이 0이면 마지막 반복 본은 단어 앞부분에서 끝날 수 있습니다 (뒤에 공백이 없으므로 거기서 멈춤).
+    반환: (반복 횟수, 매치 끝 문자 위치, 다음 검사 단어, 다음 검사 오프셋)
+    """
+    n = len(t.words)
+    last = t.words[i + m - 1] if m > 1 else first
+    tail_ws = t.seps[i + m - 1][:tail]
+    min_gap = tail + 1 + len(lead)
+    copies = 0
+    end_char = t.spans[i + m - 1][1] + tail
+    resume = (i + m, tail - len(t.seps[i + m - 1]))
+    b = i + m
+    while b + m - 1 < n:
+        gap = t.seps[b - 1]
+        if len(gap) < min_gap or not gap.startswith(tail_ws) or not gap.endswith(lead):
+            break
+        # 반복 본의 마지막 단어 앞까지는 정확히 같아야 함 (내부 공백 포함)
+        if m > 1:
+            if t.words[b] != first:
+                break
+            if not (t.same_seps(i, b, m - 1) and t.same_words(i + 1, b + 1, m - 2)):
+                break
+        end = b + m - 1
+        word = t.words[end]
+        if word == last and t.seps[end].startswith(tail_ws):
+            copies += 1
+            end_char = t.spans[end][1] + tail
+            resume = (end + 1, tail - len(t.seps[end]))
+            b += m
+            continue
+        if not tail and word.startswith(last):
+            copies += 1
+            end_char = t.spans[end][0] + len(last)
+            resume = (end, len(last))
+        break
+    return copies, end_char, resume[0], resume[1]
+
+
+def _try(t: _Tokens, i: int, m: int, offset: int, first: str, lead: str) -> Optional[_Match]:
+    """
+    시작 위치(단어 i + offset)와 문구 단어 수 m이 정해졌을 때, 가장 짧은 문구로 반복이 성립하는지 검사합니다.
+    문구가 5자보다 짧으면 정규식처럼 뒤 공백까지 늘려 봅니다 (뒤 공백이 짧을수록 조건이 느슨하므로 최소 길이만 검사).
+    """
+    length = t.spans[i + m - 1][1] - t.spans[i][0] - offset
+    tail = max(0, MIN_PHRASE_CHARS - length)
+    if tail and len(t.seps[i + m - 1]) <= tail + len(lead):
+        return None
+    copies, end_char, next_i, next_offset = _count_copies(t, i, m, first, lead, tail)
+    if copies < MIN_PHRASE_COPIES - 1:
+        return None
+    return _Match(offset, t.spans[i + m - 1][1] + tail, end_char, next_i, next_offset)
+
+
+def _candidates(t: _Tokens, i: int, v: int) -> List[int]:
+    """
+    첫 번째 반복 본이 단어 i+m에서 시작할 수 있는 m 목록 (오름차순).
+    단어 i+m은 단어 v와 같아야 하고, m > 1이면 두 번째 반복 본의 첫 단어와 첫 번째 반복 본의 마지막 단어도 정확히 같아야 합니다.
+    """
+    n = len(t.words)
+    wid = t.wid
+    max_m = min(MAX_PHRASE_WORDS, (n - 1 - i) // (MIN_PHRASE_COPIES - 1))
+    result = []
+    for p in t.occurrences(v, i, i + max_m):
+        m = p - i
+        if m > 1 and (wid[i + 2 * m] != v or wid[i + 2 * m - 1] != wid[i + m - 1]):
+            continue
+        result.append(m)
+    return result
+
+
+def _match_at(t: _Tokens, i: int, min_offset: int) -> Optional[_Match]:
+    """
+    정규식 탐색 순서대로 단어 i 앞 공백(min_offset 이후 부분) → 단어 i 안의 각 위치에서 시작하는 반복 문구를 찾고,
+    같은 시작 위치에서는 가장 짧은 문구를 고릅니다.
+    """
+    wid = t.wid
+    # 1) 앞 공백 안에서 시작 (반복 사이 공백이 2자 이상일 때만 가능): 공백이 긴 것부터
+    if min_offset < 0 and t.wide_gaps:
+        gap = t.seps[i - 1] if i > 0 else t.leading
+        widest = min(len(gap), -min_offset)
+        if widest:
+            candidates = _candidates(t, i, wid[i])
+            for q in range(widest, 0, -1):
+                for m in candidates:
+                    found = _try(t, i, m, -q, t.words[i], gap[-q:])
+                    if found is not None:
+                        return found
+    # 2) 단어 i 안에서 시작: 문구의 첫 조각(단어 i의 뒷부분)이 첫 번째 반복 본의 첫 단어와 같아야 하므로
+    #    단어 i의 뒷부분과 같은 단어가 뒤에 나오는 위치만 후보
+    for offset, sid in t.suffix_ids(wid[i]):
+        if offset < min_offset:
+            continue
+        for m in _candidates(t, i, sid):
+            found = _try(t, i, m, offset, t.vocab_words[sid], "")
+            if found is not None:
+                return found
+    return None
+
+
+def collapse_repeated_phrases(line: str) -> str:
+    """
+    re.sub(r'(.{5,}?)(?:\s+\1){2,}', r'\1', line) 와 같은 결과를 선형 시간으로 계산합니다.
+    """
+    t = _Tokens(line)
+    n = len(t.words)
+    if n < MIN_PHRASE_COPIES:
+        return line
+    out: List[str] = []
+    emitted = 0
+    i, min_offset = 0, _WHOLE_GAP
+    while i < n:
+        found = _match_at(t, i, min_offset)
+        if found is None:
+            i, min_offset = i + 1, _WHOLE_GAP
+            continue
+        # 문구 시작은 항상 이전 매치 끝 이후이므로 그 사이 원문 + 문구 1개를 그대로 남김
+        out.append(line[emitted:found.phrase_end])
+        emitted = found.end_char
+        i, min_offset = found.next_i, found.next_offset
+    if not out:
+        return line
+    out.append(line[emitted:])
+    return "".join(out)
+
+
+def collapse_repeated_word_groups(text_line: str) -> str:
+    """
+    2~8단어 묶음이 연속 3번 이상 반복되면 첫 번째만 남깁니다 (16단어 이상인 라인만, 결과는 공백 1칸으로 연결).
+    큰 묶음부터 검사하고, 어떤 크기에서 제거가 일어나면 더 작은 묶음은 검사하지 않습니다.
+    """
+    words = text_line.split()
+    total = len(words)
+    if total < MIN_WORDS_FOR_GROUPS:
+        return text_line
+    vocab: Dict[str, int] = {}
+    ids = [vocab.setdefault(w, len(vocab)) for w in words]
+
+    for size in range(min(MAX_GROUP_WORDS, total // 3), MIN_GROUP_WORDS - 1, -1):
+        # 현재 라인 = ids[:w] + ids[r:] (제자리 del 대신 가운데 빈 구간을 두고 남길 단어만 앞으로 옮김 → 전체 선형)
+        w = r = 0
+        i = 0
+        while i <= w + total - r - size * 3:
+            if i >= w:
+                p = i + r - w
+                if ids[p] != ids[p + size] or ids[p] != ids[p + 2 * size]:
+                    i += 1
+                    continue
+                window = ids[p:p + 3 * size]
+            else:
+                # 제거 직후 되돌아간 구간: 검사 창이 빈 구간에 걸쳐 있음
+                window = ids[i:w] + ids[r:r + i + 3 * size - w]
+                if window[0] != window[size] or window[0] != window[2 * size]:
+                    i += 1
+                    continue
+            group = window[:size]
+            if window[size:2 * size] != group or window[2 * size:] != group:
+                i += 1
+                continue
+            # 되돌아가는 폭이 2묶음 미만이므로 i + 3묶음 위치는 항상 ids[r:] 쪽에 있음
+            pos = i + 3 * size + r - w
+            while pos + size <= total and ids[pos:pos + size] == group:
+                pos += size
+            keep_end = i + size
+            if keep_end > w and r != w:
+                ids[w:keep_end] = ids[r:r + keep_end - w]
+                words[w:keep_end] = words[r:r + keep_end - w]
+            w, r = keep_end, pos
+            # 제거 지점보다 2묶음 이상 앞에서 시작하는 구간은 바뀌지 않았으므로 그 뒤부터 다시 검사
+            i = max(0, i - 2 * size + 1)
+        if r > w:
+            return " ".join(words[:w] + words[r:])
+    return " ".join(words)
+
+
+def remove_repeated_phrases(text_line: str) -> str:
+    """
+    같은 라인 내에서 반복되는 문구를 제거합니다.
+    예: "광고 프로젝트의 진행 및 광고 프로젝트의 진행 및 광고 프로젝트의 진행 및" -> "광고 프로젝트의 진행 및"
+    """
+    if not text_line or len(text_line.strip()) < 10:
+        return text_line
+    return collapse_repeated_word_groups(collapse_repeated_phrases(text_line))
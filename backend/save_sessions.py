@@ -0,0 +1,124 @@
+"""
+저장 세션 요약 (save_sessions 테이블).
+
+GET /billing/usage?mode=file은 최근 OCR 차감 세션 목록을 가져온 뒤, 세션마다 OCRRecord 집계 쿼리를
+한 번씩 더 실행했습니다 (N+1). 이제 (email, save_session_id, filename)마다 요약 1행을 두고
+저장/삭제 트랜잭션 안에서 해당 세션만 다시 계산합니다. 파일 단위 이용 내역은 이 테이블만 읽습니다.
+
+- 차감 기록(credit_ledger, reason=ocr_save_page_charge)이 있는 세션만 요약합니다.
+  레코드가 모두 삭제되어도 차감 내역은 남으므로 요약 행도 남습니다.
+- 요약이 어긋났다면 db_tools.py rebuild-sessions로 다시 만듭니다.
+"""
+
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+from sqlalchemy import case, distinct, func
+from sqlalchemy.orm import Session
+
+from database import CreditLedger, OCRRecord, SaveSession
+
+OCR_SAVE_CHARGE_REASON = "ocr_save_page_charge"
+
+# (save_session_id, filename)
+SessionKey = Tuple[str, str]
+
+
+def refresh_save_sessions(db: Session, email: Optional[str], keys: Iterable[SessionKey]) -> None:
+    """
+    주어진 세션들의 요약을 credit_ledger/ocr_records에서 다시 계산해 반영합니다 (commit은 호출 측).
+    레코드/차감 변경을 flush한 뒤 같은 트랜잭션에서 호출해야 합니다.
+    """
+    if not email:
+        return
+    for save_session_id, filename in set(keys):
+        if not save_session_id or filename is None:
+            continue
+        delta_total, last_charged_at = (
+            db.query(func.sum(CreditLedger.delta), func.max(CreditLedger.created_at))
+            .filter(
+                CreditLedger.email == email,
+                CreditLedger.reason == OCR_SAVE_CHARGE_REASON,
+                CreditLedger.save_session_id == save_session_id,
+                CreditLedger.filename == filename,
+            )
+            .one()
+        )
+        row = (
+            db.query(SaveSession)
+            .filter(
+                SaveSession.email == email,
+                SaveSession.save_session_id == save_session_id,
+                SaveSession.filename == filename,
+            )
+            .first()
+        )
+        if last_charged_at is None:
+            if row is not None:
+                db.delete(row)
+            continue
+
+        records_count, distinct_pages, null_pages, first_saved_at, last_saved_at = (
+            db.query(
+                func.count(OCRRecord.id),
+                func.count(distinct(OCRRecord.page_number)),
+                func.coalesce(func.sum(case((OCRRecord.page_number.is_(None), 1), else_=0)), 0),
+                func.min(OCRRecord.timestamp),
+                func.max(OCRRecord.timestamp),
+            )
+            .filter(
+                OCRRecord.email == email,
+                OCRRecord.save_session_id == save_session_id,
+                OCRRecord.filename == filename,
+            )
+            .one()
+        )
+        # 페이지 수: 고유한 페이지 번호 + 페이지 번호 없는(이미지) 레코드가 있으면 1페이지 (최소 1)
+        pages_count = int(distinct_pages or 0) + (1 if null_pages else 0)
+
+        if row is None:
+            row = SaveSession(email=email, save_session_id=save_session_id, filename=filename)
+            db.add(row)
+        row.pages_count = max(pages_count, 1)
+        row.records_count = int(records_count or 0)
+        row.delta_total = int(delta_total or 0)
+        row.first_saved_at = first_saved_at
+        row.last_saved_at = last_saved_at
+        row.last_charged_at = last_charged_at
+    db.flush()
+
+
+def rebuild_save_sessions(db: Session, email: Optional[str] = None) -> int:
+    """
+    credit_ledger 전체(또는 한 사용자)에서 세션 요약을 다시 만듭니다 (commit은 호출 측). 만든 세션 수를 반환합니다.
+    """
+    rows = db.query(SaveSession)
+    charges = db.query(CreditLedger.email, CreditLedger.save_session_id, CreditLedger.filename).filter(
+        CreditLedger.reason == OCR_SAVE_CHARGE_REASON,
+        CreditLedger.save_session_id.isnot(None),
+        CreditLedger.filename.isnot(None),
+    )
+    if email is not None:
+        rows = rows.filter(SaveSession.email == email)
+        charges = charges.filter(CreditLedger.email == email)
+    rows.delete(synchronize_session=False)
+
+    keys_by_email: Dict[str, set] = {}
+    for charge_email, save_session_id, filename in charges.distinct():
+        keys_by_email.setdefault(charge_email, set()).add((save_session_id, filename))
+    for charge_email, keys in keys_by_email.items():
+        refresh_save_sessions(db, charge_email, keys)
+    return sum(len(keys) for keys in keys_by_email.values())
+
+
+def session_to_usage(row: SaveSession) -> Dict[str, Any]:
+    # "몇개 영역"은 페이지당 영역 개수로 표기(=총 레코드 / 페이지수)
+    areas_per_page = row.records_count / row.pages_count if row.pages_count else 0
+    return {
+        "kind": "ocr",
+        "filename": row.filename,
+        "pages_count": row.pages_count,
+        "areas_per_page": round(areas_per_page, 2),
+        "delta": row.delta_total,
+        "created_at": row.last_charged_at.isoformat() if row.last_charged_at else None,
+        "save_session_id": row.save_session_id,
+    }
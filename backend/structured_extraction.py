@@ -0,0 +1,97 @@
+"""
+ExtractKeys 기반 구조화 추출 (schema-constrained JSON).
+
+기존 고급 모드는 프론트엔드가 키 목록으로 자유 형식 프롬프트를 만들고, 모델 응답에서 JSON을 찾아냈습니다.
+이 모드(/ocr의 extract_keys_id)는 저장된 키 목록으로 JSON 스키마를 만들어 Ollama `format`으로 넘기므로
+모델은 스키마에 맞는 JSON 객체만 생성합니다 (설명문/코드 블록 없음, 파싱 실패 재시도 불필요).
+결과는 서버에서 다시 검증하여 키 순서대로 정리하고, 비어 있거나 빠진 키를 보고합니다.
+"""
+
+import json
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from ocr_postprocess import find_json_object
+
+# 스키마 한 개에 넣을 최대 키 수
+MAX_EXTRACT_KEYS = 100
+
+
+def normalize_keys(keys: Iterable[Any]) -> List[str]:
+    """
+    저장된 키 목록 정리: 문자열화 + 앞뒤 공백 제거, 빈 키 제외, 중복 제거(순서 유지).
+    """
+    result: List[str] = []
+    seen = set()
+    for key in keys:
+        name = str(key).strip() if key is not None else ""
+        if name and name not in seen:
+            seen.add(name)
+            result.append(name)
+    if not result:
+        raise ValueError("ExtractKeys has no usable keys")
+    if len(result) > MAX_EXTRACT_KEYS:
+        raise ValueError(f"Too many keys ({len(result)} > {MAX_EXTRACT_KEYS})")
+    return result
+
+
+def build_schema(keys: List[str]) -> Dict[str, Any]:
+    """
+    키마다 문자열 값을 갖는 객체 스키마 (모든 키 필수, 그 밖의 키 불가).
+    """
+    return {
+        "type": "object",
+        "properties": {key: {"type": "string"} for key in keys},
+        "required": list(keys),
+        "additionalProperties": False,
+    }
+
+
+def build_prompt(keys: List[str]) -> str:
+    key_list = ", ".join(json.dumps(key, ensure_ascii=False) for key in keys)
+    return (
+        "Read the text that is ACTUALLY VISIBLE in this cropped image and fill in these fields: "
+        f"{key_list}. Answer with a single JSON object using exactly these keys. "
+        "Copy each value exactly as it appears in the image. "
+        "Use an empty string for a field that is not visible. Do NOT guess."
+    )
+
+
+def _as_text(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value.strip()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, ensure_ascii=False)
+    return str(value)
+
+
+def _parse_object(raw_text: str) -> Optional[dict]:
+    text = raw_text.strip()
+    try:
+        value = json.loads(text)
+    except json.JSONDecodeError:
+        # 스키마를 지원하지 않는 서버 등: 응답 안의 첫 번째 유효한 객체
+        found = find_json_object(text)
+        if found is None:
+            return None
+        value = json.loads(text[found[0]:found[1]])
+    return value if isinstance(value, dict) else None
+
+
+def validate_extraction(raw_text: str, keys: List[str]) -> Tuple[Optional[Dict[str, str]], Dict[str, Any]]:
+    """
+    모델 응답을 검증합니다.
+    반환: (키 순서대로 정리한 {키: 문자열 값} 또는 JSON 객체가 아니면 None, 검증 보고)
+    보고: valid(JSON 객체 여부), missing_keys(없거나 빈 값). 스키마에 없는 키는 결과에서 제외합니다.
+    """
+    obj = _parse_object(raw_text)
+    if obj is None:
+        return None, {"valid": False, "missing_keys": list(keys)}
+    data = {key: _as_text(obj.get(key)) for key in keys}
+    return data, {"valid": True, "missing_keys": [key for key in keys if not data[key]]}
+
+
+def format_extraction(data: Dict[str, str]) -> str:
+    # 기존 고급 모드(extract_json_from_text)와 같은 형식
+    return json.dumps(data, ensure_ascii=False, indent=2)
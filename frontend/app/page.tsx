@@ -12,6 +12,8 @@ import LandingState from '@/components/LandingState';
 import LoginModal from '@/components/LoginModal';
 
 const BACKEND_URL = process.env.NEXT_PUBLIC_BACKEND_URL || 'http://localhost:8000';
+// POST /history/save-batch 한 번에 보낼 수 있는 최대 영역 수 (백엔드 SAVE_BATCH_MAX_ITEMS)
+const SAVE_BATCH_MAX_ITEMS = 500;
 const OCR_RESULT_STORAGE_KEY = 'ocr_result';
 const PROMPT_STORAGE_KEY = 'custom_prompt';
 const PROMPT_LIST_STORAGE_KEY = 'saved_prompts';
@@ -106,7 +108,7 @@ export default function Home() {
   // OCR 결과를 임시로 저장 (저장 버튼을 위해)
   const [ocrResultsData, setOcrResultsData] = useState<Array<{
     extracted_text: string;
-    cropped_image: string;
+    crop_handle: string;
     filename: string;
     page_number: number | null;
   }>>([]);
@@ -1557,6 +1559,9 @@ export default function Home() {
               throw new Error('OCR 실행이 중지되었습니다.');
             }
 
+            // 크롭 이미지는 서버에 임시 보관(crop_handle)되므로 base64로 돌려받지 않음
+            formData.append('return_image', 'false');
+
             const response = await fetch(`${BACKEND_URL}/ocr`, {
               method: 'POST',
               body: formData,
@@ -1578,7 +1583,7 @@ export default function Home() {
               // OCR 결과 데이터 임시 저장
               setOcrResultsData(prev => [...prev, {
                 extracted_text: data.extracted_text,
-                cropped_image: data.cropped_image,
+                crop_handle: data.crop_handle,
                 filename: currentFile.name,
                 page_number: isPdfFile ? pageNum : null,
               }]);
@@ -1701,6 +1706,9 @@ export default function Home() {
             formData.append('custom_prompt', promptToUse);
           }
           
+          // 크롭 이미지는 서버에 임시 보관(crop_handle)되므로 base64로 돌려받지 않음
+          formData.append('return_image', 'false');
+
           const response = await fetch(`${BACKEND_URL}/ocr`, {
             method: 'POST',
             body: formData,
@@ -1722,7 +1730,7 @@ export default function Home() {
             // OCR 결과 데이터 임시 저장 (저장 버튼을 위해)
             setOcrResultsData(prev => [...prev, {
               extracted_text: data.extracted_text,
-              cropped_image: data.cropped_image,
+              crop_handle: data.crop_handle,
               filename: data.filename || filename,
               page_number: isPdf ? pageNum : null,
             }]);
@@ -1797,6 +1805,9 @@ export default function Home() {
               formData.append('custom_prompt', promptToUse);
             }
 
+          // 크롭 이미지는 서버에 임시 보관(crop_handle)되므로 base64로 돌려받지 않음
+          formData.append('return_image', 'false');
+
           const response = await fetch(`${BACKEND_URL}/ocr`, {
             method: 'POST',
             body: formData,
@@ -1816,7 +1827,7 @@ export default function Home() {
               // OCR 결과 데이터 임시 저장 (저장 버튼을 위해)
               setOcrResultsData(prev => [...prev, {
                 extracted_text: data.extracted_text,
-                cropped_image: data.cropped_image,
+                crop_handle: data.crop_handle,
                 filename: data.filename || pdfFile?.name || 'unknown.pdf',
                 page_number: typeof area.pageNumber === 'number' ? area.pageNumber : null,
               }]);
@@ -1891,6 +1902,9 @@ export default function Home() {
               formData.append('custom_prompt', promptToUseImage);
             }
 
+        // 크롭 이미지는 서버에 임시 보관(crop_handle)되므로 base64로 돌려받지 않음
+        formData.append('return_image', 'false');
+
         const response = await fetch(`${BACKEND_URL}/ocr`, {
           method: 'POST',
           body: formData,
@@ -1911,7 +1925,7 @@ export default function Home() {
               // OCR 결과 데이터 임시 저장 (저장 버튼을 위해)
               setOcrResultsData(prev => [...prev, {
                 extracted_text: data.extracted_text,
-                cropped_image: data.cropped_image,
+                crop_handle: data.crop_handle,
                 filename: data.filename || file?.name || 'unknown',
                 page_number: null, // 이미지 파일은 page_number가 null
               }]);
@@ -3146,35 +3160,44 @@ export default function Home() {
                     try {
                       setError(null);
                       const saveSessionId = `${Date.now()}-${Math.random().toString(16).slice(2)}`;
-                      const userEmail = user.email;
-                      // 각 OCR 결과를 순차적으로 저장
+                      // 저장 세션의 모든 영역을 파일별로 한 번에 저장 (/history/save-batch, 전부 저장되거나 전부 실패)
+                      const itemsByFile = new Map<string, typeof ocrResultsData>();
                       for (const resultData of ocrResultsData) {
-                        const formData = new FormData();
-                        formData.append('extracted_text', resultData.extracted_text);
-                        formData.append('cropped_image', resultData.cropped_image);
-                        formData.append('filename', resultData.filename);
-                        formData.append('user_email', userEmail);
-                        formData.append('save_session_id', saveSessionId);
-                        if (resultData.page_number !== null) {
-                          formData.append('page_number', String(resultData.page_number));
-                        }
-                        
-                        const response = await fetch(`${BACKEND_URL}/history/save`, {
-                          method: 'POST',
-                          headers: token ? { Authorization: `Bearer ${token}` } : undefined,
-                          body: formData,
-                        });
-                        
-                        if (!response.ok) {
-                          // 가능한 경우 백엔드 에러 메시지(detail)를 노출
-                          let message = '저장에 실패했습니다.';
-                          try {
-                            const data = await response.json();
-                            if (data?.detail) message = data.detail;
-                          } catch {
-                            // ignore
+                        const items = itemsByFile.get(resultData.filename) ?? [];
+                        items.push(resultData);
+                        itemsByFile.set(resultData.filename, items);
+                      }
+                      for (const [filename, results] of Array.from(itemsByFile.entries())) {
+                        // 요청당 최대 SAVE_BATCH_MAX_ITEMS개 (같은 save_session_id라 페이지당 1회 차감은 유지)
+                        for (let start = 0; start < results.length; start += SAVE_BATCH_MAX_ITEMS) {
+                          const response = await fetch(`${BACKEND_URL}/history/save-batch`, {
+                            method: 'POST',
+                            headers: {
+                              'Content-Type': 'application/json',
+                              ...(token ? { Authorization: `Bearer ${token}` } : {}),
+                            },
+                            body: JSON.stringify({
+                              filename,
+                              save_session_id: saveSessionId,
+                              items: results.slice(start, start + SAVE_BATCH_MAX_ITEMS).map((resultData) => ({
+                                extracted_text: resultData.extracted_text,
+                                crop_handle: resultData.crop_handle,
+                                page_number: resultData.page_number,
+                              })),
+                            }),
+                          });
+
+                          if (!response.ok) {
+                            // 가능한 경우 백엔드 에러 메시지(detail)를 노출
+                            let message = '저장에 실패했습니다.';
+                            try {
+                              const data = await response.json();
+                              if (typeof data?.detail === 'string') message = data.detail;
+                            } catch {
+                              // ignore
+                            }
+                            throw new Error(message);
                           }
-                          throw new Error(message);
                         }
                       }
 